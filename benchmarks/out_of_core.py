@@ -0,0 +1,92 @@
+"""Pic de mémoire du rééchantillonnage et de l'analyse, en mémoire et hors mémoire (--out-of-core).
+
+Pour chaque taille, une paire synthétique (voir synthetic.py) est écrite en NRRD non compressé ;
+chaque mesure tourne dans un processus neuf pour que les pics ne se mélangent pas. Hors mémoire,
+le pic doit rester à peu près constant quand la taille du volume augmente.
+
+    python benchmarks/out_of_core.py --sizes 128 256 384 --memory-budget 64
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import ROOT
+
+STAGES = ["resample", "analyze"]
+MODES = ["in_core", "out_of_core"]
+
+def _write_case(size, directory):
+    import itk
+    from synthetic import make_case
+    from src.registration import resample_image
+
+    case = make_case(size)
+    paths = {name: os.path.join(directory, f"{name}.nrrd") for name in ("fixed", "moving", "fixed_truth", "registered_truth")}
+    itk.imwrite(case["fixed"], paths["fixed"])
+    itk.imwrite(case["moving"], paths["moving"])
+    itk.imwrite(case["fixed_truth"], paths["fixed_truth"])
+    itk.imwrite(resample_image(case["moving_truth"], case["transform"], case["fixed"], interpolation="nearest"),
+                paths["registered_truth"])
+    itk.transformwrite([case["transform"]], os.path.join(directory, "transform.tfm"))
+    return paths
+
+def _child(stage, mode, directory, memory_budget_mb):
+    """Une mesure : ITK est chargé avant la remise à zéro du pic"""
+    import itk
+    from src.profiling import reset_peak_rss, memory_mb
+    from src.image_io import read_transform
+
+    path = lambda name: os.path.join(directory, f"{name}.nrrd")
+    transform = read_transform(os.path.join(directory, "transform.tfm"))
+    itk.ResampleImageFilter, itk.LinearInterpolateImageFunction
+    reset_peak_rss()
+    baseline = memory_mb("VmRSS")
+    start = time.perf_counter()
+    if stage == "resample":
+        if mode == "in_core":
+            from src.registration import resample_image
+            from src.image_io import load_image, safe_itk_write
+            fixed, moving = load_image(path("fixed"), itk.F), load_image(path("moving"), itk.F)
+            safe_itk_write(resample_image(moving, transform, fixed), path("registered"))
+        else:
+            from src.out_of_core import resample_out_of_core
+            resample_out_of_core(path("moving"), transform, path("fixed"), path("registered"),
+                                 memory_budget_mb=memory_budget_mb)
+    else:
+        from src.analysis import analyze_masks
+        analyze_masks(path("fixed_truth"), path("registered_truth"), path("fixed"), path("moving"),
+                      memory_budget_mb=memory_budget_mb if mode == "out_of_core" else None)
+    seconds = time.perf_counter() - start
+    print(json.dumps({"seconds": seconds, "baseline_mb": baseline, "peak_mb": memory_mb("VmHWM")}))
+
+def main():
+    parser = argparse.ArgumentParser(description="Pic de mémoire en mémoire / hors mémoire")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[128, 256, 384])
+    parser.add_argument("--memory-budget", type=int, default=64, help="Budget des traitements par tranches (Mo)")
+    parser.add_argument("--child", nargs=3, metavar=("STAGE", "MODE", "DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(*args.child, args.memory_budget)
+        return
+
+    script = os.path.abspath(__file__)
+    print(f"{'taille':>6s} {'étape':10s} {'mode':12s} {'durée (s)':>10s} {'pic - départ (Mo)':>18s}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            _write_case(size, directory)
+            for stage in STAGES:
+                for mode in MODES:
+                    output = subprocess.run(
+                        [sys.executable, script, "--child", stage, mode, directory,
+                         "--memory-budget", str(args.memory_budget)],
+                        capture_output=True, text=True, check=True, cwd=ROOT).stdout
+                    result = json.loads(output.strip().splitlines()[-1])
+                    print(f"{size:5d}³ {stage:10s} {mode:12s} {result['seconds']:10.2f} "
+                          f"{result['peak_mb'] - result['baseline_mb']:18.1f}")
+
+if __name__ == "__main__":
+    main()
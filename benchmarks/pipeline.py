@@ -0,0 +1,171 @@
+"""Benchmark de chaque étape du pipeline sur des volumes synthétiques (voir synthetic.py).
+
+Pour chaque taille : temps et pic de mémoire de chaque étape, et précision par rapport à la vérité
+terrain (écart de la transformation en mm, Dice des segmentations). Résultats en JSON ; --compare
+signale les étapes plus lentes qu'une exécution précédente et sort alors avec le code 1.
+
+    python benchmarks/pipeline.py --sizes 64 128 256 512 --preset balanced --output bench.json
+    python benchmarks/pipeline.py --sizes 64 128 --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from synthetic import ROOT, make_case
+
+import itk
+import numpy as np
+import vtk
+
+from src.registration import estimate_rigid_transform, resample_image, transform_discrepancy
+from src.segmentation import segment_brain, segment_tumor
+from src.analysis import analyze_masks
+from src.meshing import extract_surface
+from src.visualization import BRAIN_TRIANGLE_BUDGET, TUMOR_TRIANGLE_BUDGET
+from src.profiling import reset_peak_rss, memory_mb
+
+DEFAULT_SIZES = [64, 128, 256]
+WARM_UP_SIZE = 32
+
+def _measure(stages, name, function, *args, **kwargs):
+    """Exécute une étape ; enregistre durée, mémoire résidente au départ et pic pendant l'étape"""
+    reset_peak_rss()
+    rss_before = memory_mb("VmRSS")
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = memory_mb("VmHWM")
+    stages[name] = {
+        "seconds": round(seconds, 4),
+        "rss_before_mb": round(rss_before, 1),
+        "peak_rss_mb": round(peak, 1),
+        "peak_increase_mb": round(peak - rss_before, 1),
+    }
+    return result
+
+def dice(mask, truth):
+    a = itk.array_view_from_image(mask) != 0
+    b = itk.array_view_from_image(truth) != 0
+    total = np.count_nonzero(a) + np.count_nonzero(b)
+    return 2.0 * np.count_nonzero(a & b) / total if total else float("nan")
+
+def benchmark_size(size, preset):
+    stages = {}
+    case = _measure(stages, "generate", make_case, size)
+    fixed, moving, seed = case["fixed"], case["moving"], case["seed"]
+
+    transform = _measure(stages, "register", estimate_rigid_transform, fixed, moving, preset)
+    registered = _measure(stages, "resample", resample_image, moving, transform, fixed)
+    brain = _measure(stages, "segment_brain", segment_brain, fixed)
+    brain_fast = _measure(stages, "segment_brain_fast", segment_brain, fixed, fast=True)
+    tumor, _ = _measure(stages, "segment_tumor", segment_tumor, fixed, seed)
+    tumor_roi, _ = _measure(stages, "segment_tumor_roi", segment_tumor, fixed, seed, roi=True)
+    registered_tumor, _ = _measure(stages, "segment_tumor_registered", segment_tumor, registered, seed, roi=True)
+    analysis = _measure(stages, "analyze", analyze_masks, tumor_roi, registered_tumor, fixed, registered)
+    _measure(stages, "analyze_surface", analyze_masks, tumor_roi, registered_tumor, surface_distances=True)
+    surface = _measure(stages, "mesh_tumor", extract_surface, tumor_roi,
+                       target_triangles=TUMOR_TRIANGLE_BUDGET, cache_dir=None)
+    _measure(stages, "mesh_brain", extract_surface, brain, target_triangles=BRAIN_TRIANGLE_BUDGET, cache_dir=None)
+
+    accuracy = {
+        "transform_error_mm": transform_discrepancy(transform, case["transform"], fixed),
+        "dice_tumor": dice(tumor, case["fixed_truth"]),
+        "dice_tumor_roi": dice(tumor_roi, case["fixed_truth"]),
+        # La tumeur ne bouge pas dans le fantôme : le masque du scan recalé doit retomber sur la vérité du scan fixe
+        "dice_tumor_registered": dice(registered_tumor, case["fixed_truth"]),
+        "dice_between_scans": analysis["dice"],
+        "dice_brain_fast": dice(brain_fast, brain),
+        "tumor_triangles": surface.GetNumberOfPolys(),
+    }
+    return {"size": size, "voxels": size ** 3, "stages": stages, "accuracy": accuracy}
+
+def _environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "itk_threads": itk.MultiThreaderBase.GetGlobalDefaultNumberOfThreads(),
+        "itk": itk.Version.GetITKVersion(),
+        "vtk": vtk.vtkVersion.GetVTKVersion(),
+        "numpy": np.__version__,
+    }
+
+def compare(results, previous, tolerance, min_seconds):
+    """Étapes plus lentes que dans `previous` au-delà de la tolérance relative.
+
+    Les étapes plus courtes que `min_seconds` dans les deux exécutions sont ignorées (bruit de mesure).
+    """
+    previous_by_size = {entry["size"]: entry for entry in previous["results"]}
+    regressions = []
+    for entry in results:
+        old = previous_by_size.get(entry["size"])
+        if old is None:
+            continue
+        for stage, timing in entry["stages"].items():
+            if stage not in old["stages"] or stage == "generate":
+                continue
+            old_seconds = old["stages"][stage]["seconds"]
+            ratio = timing["seconds"] / max(old_seconds, 1e-6)
+            print(f"{entry['size']:4d}³ {stage:26s} {old_seconds:8.3f} s -> {timing['seconds']:8.3f} s (x{ratio:.2f})")
+            if ratio > 1.0 + tolerance and max(timing["seconds"], old_seconds) >= min_seconds:
+                regressions.append((entry["size"], stage, ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline sur volumes synthétiques")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Tailles des volumes (côté en voxels), jusqu'à 512")
+    parser.add_argument("--preset", default="balanced", help="Préréglage du recalage")
+    parser.add_argument("--output", default=os.path.join(ROOT, "Data", "benchmarks", "pipeline.json"),
+                        help="Fichier JSON des résultats")
+    parser.add_argument("--compare", help="Résultats JSON d'une exécution précédente")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Ralentissement relatif toléré par étape avec --compare")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="Durée en dessous de laquelle une étape n'est pas comparée")
+    args = parser.parse_args()
+
+    # Chargement des modules ITK et VTK hors mesure
+    print(f"Préchauffage ({WARM_UP_SIZE}³)...")
+    benchmark_size(WARM_UP_SIZE, "fast")
+
+    results = []
+    for size in args.sizes:
+        print(f"Volume {size}³...")
+        entry = benchmark_size(size, args.preset)
+        for stage, timing in entry["stages"].items():
+            print(f"  {stage:26s} {timing['seconds']:8.3f} s  pic {timing['peak_rss_mb']:8.1f} Mo "
+                  f"(+{timing['peak_increase_mb']:.1f})")
+        accuracy = entry["accuracy"]
+        print(f"  écart transformation {accuracy['transform_error_mm']:.3f} mm, Dice tumeur {accuracy['dice_tumor']:.3f} "
+              f"(ROI {accuracy['dice_tumor_roi']:.3f}, recalée {accuracy['dice_tumor_registered']:.3f})")
+        results.append(entry)
+
+    report = {"environment": _environment(), "preset": args.preset, "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats : {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        regressions = compare(results, previous, args.tolerance, args.min_seconds)
+        for size, stage, ratio in regressions:
+            print(f"Régression : {stage} ({size}³) x{ratio:.2f}")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Préréglages du recalage comparés au recalage historique ("exact") et à la vérité terrain.
+
+Pour chaque volume synthétique, chaque préréglage est mesuré : durée de l'optimisation, accélération
+par rapport à "exact", écart (transform_discrepancy, mm) à la transformation "exact" et à la vraie
+transformation. Une paire de fichiers peut remplacer les volumes synthétiques (pas de vérité terrain) :
+
+    python benchmarks/registration_presets.py --sizes 64 128
+    python benchmarks/registration_presets.py --pair Data/case6_gre1.nrrd Data/case6_gre2.nrrd
+"""
+import argparse
+import time
+
+import synthetic  # ajoute la racine du dépôt à sys.path
+import itk
+from src.config import REGISTRATION_PRESETS
+from src.image_io import load_image
+from src.registration import estimate_rigid_transform, transform_discrepancy
+
+REFERENCE_PRESET = "exact"
+
+def compare_presets(fixed, moving, truth=None, presets=None):
+    presets = presets or list(REGISTRATION_PRESETS)
+    # La référence d'abord : les autres préréglages lui sont comparés
+    presets = [REFERENCE_PRESET] + [preset for preset in presets if preset != REFERENCE_PRESET]
+    rows, reference = [], None
+    for preset in presets:
+        start = time.perf_counter()
+        transform = estimate_rigid_transform(fixed, moving, preset)
+        seconds = time.perf_counter() - start
+        if reference is None:
+            reference = {"transform": transform, "seconds": seconds}
+        rows.append({
+            "preset": preset, "seconds": seconds, "speedup": reference["seconds"] / seconds,
+            "vs_exact_mm": transform_discrepancy(transform, reference["transform"], fixed),
+            "vs_truth_mm": float("nan") if truth is None else transform_discrepancy(transform, truth, fixed),
+        })
+    return rows
+
+def _print(title, rows):
+    print(title)
+    print(f"  {'préréglage':10s} {'temps (s)':>10s} {'accél.':>7s} {'vs exact':>9s} {'vs vérité':>10s}")
+    for row in rows:
+        print(f"  {row['preset']:10s} {row['seconds']:10.2f} {row['speedup']:7.1f} "
+              f"{row['vs_exact_mm']:9.3f} {row['vs_truth_mm']:10.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Préréglages du recalage comparés à exact et à la vérité terrain")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 128], help="Tailles des volumes synthétiques")
+    parser.add_argument("--rotation", type=float, default=synthetic.DEFAULT_ROTATION_DEG, help="Rotation (degrés)")
+    parser.add_argument("--translation", type=float, nargs=3, default=synthetic.DEFAULT_TRANSLATION_MM,
+                        metavar=("X", "Y", "Z"), help="Translation (mm)")
+    parser.add_argument("--pair", nargs=2, metavar=("FIXE", "MOBILE"), help="Paire de fichiers à la place")
+    parser.add_argument("--presets", nargs="+", choices=list(REGISTRATION_PRESETS), help="Préréglages mesurés")
+    args = parser.parse_args()
+
+    # Chargement des modules ITK du recalage hors mesure
+    warm_up = synthetic.make_case(32)
+    estimate_rigid_transform(warm_up["fixed"], warm_up["moving"], "fast")
+
+    if args.pair:
+        fixed, moving = (load_image(path, itk.F) for path in args.pair)
+        _print(f"{args.pair[0]} / {args.pair[1]}", compare_presets(fixed, moving, presets=args.presets))
+        return
+    for size in args.sizes:
+        case = synthetic.make_case(size, args.rotation, args.translation)
+        _print(f"Volume {size}³ (rotation {args.rotation}°, translation {tuple(args.translation)} mm)",
+               compare_presets(case["fixed"], case["moving"], case["transform"], args.presets))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Ajouts et requêtes de l'entrepôt des résultats (src/results_store.py) sur une cohorte simulée.
+
+Des lignes aléatoires (patients à plusieurs examens, dates, empreintes) sont ajoutées en un bloc
+puis une à une, comme le mode cohorte. Les requêtes d'un tableau de bord (chargement des colonnes
+utiles, distribution de la croissance, sélection par dates, agrégats par patient) sont ensuite
+mesurées dans un entrepôt temporaire.
+
+    python benchmarks/results_store.py --rows 10000 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import synthetic  # ajoute la racine du dépôt à sys.path
+from src.results_store import (append_records, load_results, select, growth_distribution, aggregate_by,
+                               table_rows)
+
+DASHBOARD_COLUMNS = ["patient_id", "reference", "timepoint", "source", "reference_date", "date",
+                     "volume1", "volume2", "dice"]
+
+def _records(rows, timepoints, rng):
+    start = np.datetime64("2020-01-01")
+    for i in range(rows):
+        index = i % timepoints
+        volume1 = rng.uniform(500.0, 20000.0)
+        yield {
+            "patient_id": f"p{i // timepoints:06d}", "reference": f"t{index}", "timepoint": f"t{index + 1}",
+            "source": "batch", "reference_date": start + 90 * index, "date": start + 90 * (index + 1),
+            "volume1": volume1, "volume2": volume1 * rng.uniform(0.7, 1.6), "dice": rng.uniform(0.5, 0.95),
+            "preset": "balanced", "seed": "53 63 83", "lower_factor": 0.8, "upper_factor": 1.2,
+            "digest": rng.bytes(32).hex(), "reference_digest": rng.bytes(32).hex(), "code_version": "0" * 64,
+        }
+
+def _best(function, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+def main():
+    parser = argparse.ArgumentParser(description="Ajouts et requêtes de l'entrepôt des résultats")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000], help="Lignes de l'entrepôt")
+    parser.add_argument("--timepoints", type=int, default=4, help="Comparaisons par patient")
+    parser.add_argument("--repeat", type=int, default=5, help="Répétitions par mesure (la meilleure est gardée)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'lignes':>8s} {'bloc (ms)':>10s} {'ajout (ms)':>11s} {'disque (Mo)':>12s} "
+          f"{'chargement':>11s} {'croissance':>11s} {'dates':>7s} {'par patient':>12s}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as store_dir:
+            records = list(_records(rows, args.timepoints, rng))
+            start = time.perf_counter()
+            append_records(store_dir, records[:-100])
+            bulk = time.perf_counter() - start
+            start = time.perf_counter()
+            for record in records[-100:]:
+                append_records(store_dir, [record])
+            single = (time.perf_counter() - start) / 100
+            size = sum(os.path.getsize(os.path.join(store_dir, name)) for name in os.listdir(store_dir))
+
+            table = load_results(store_dir, DASHBOARD_COLUMNS)
+            assert table_rows(table) == rows
+            timings = [
+                _best(lambda: load_results(store_dir, DASHBOARD_COLUMNS), args.repeat),
+                _best(lambda: growth_distribution(table), args.repeat),
+                _best(lambda: select(table, since="2020-06-01", until="2020-12-31"), args.repeat),
+                _best(lambda: aggregate_by(table, "dice"), args.repeat),
+            ]
+            print(f"{rows:8d} {bulk * 1000:10.1f} {single * 1000:11.2f} {size / 1e6:12.2f} "
+                  + " ".join(f"{seconds * 1000:{width}.1f}" for seconds, width in zip(timings, (11, 11, 7, 12))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Passage à l'échelle de l'étape de segmentation de 1 à N cœurs (--threads).
+
+Pour chaque nombre de threads ITK, les quatre segmentations d'une paire synthétique (voir
+synthetic.py) sont mesurées à la suite (un filtre à la fois, comme avant segment_scans) puis
+en parallèle (segment_scans). Chaque nombre de threads tourne dans un processus neuf : la taille
+du pool de threads ITK est fixée au démarrage. Les modules ITK sont chargés hors mesure.
+
+    python benchmarks/segmentation_threads.py --size 256 --threads 1 2 4 8 16 32
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from synthetic import ROOT
+
+def _sequential(fixed, registered, seed, roi):
+    from src.segmentation import segment_brain, segment_tumor
+    segment_brain(fixed)
+    _, seed = segment_tumor(fixed, seed, roi=roi)
+    segment_brain(registered)
+    segment_tumor(registered, seed, roi=roi)
+
+def _concurrent(fixed, registered, seed, roi):
+    from src.segmentation import segment_scans
+    segment_scans(fixed, registered, seed, roi=roi)
+
+MODES = {"sequential": _sequential, "concurrent": _concurrent}
+
+def _child(threads, size, repeat, roi):
+    from src.parallel import configure_threads
+    configure_threads(threads)
+    from synthetic import make_case
+    from src.segmentation import _load_filter_modules
+
+    case = make_case(size)
+    fixed, registered, seed = case["fixed"], case["moving"], case["seed"]
+    _load_filter_modules()
+    _sequential(fixed, registered, seed, roi)
+    timings = {}
+    for mode, function in MODES.items():
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function(fixed, registered, seed, roi)
+            seconds.append(time.perf_counter() - start)
+        timings[mode] = min(seconds)
+    print(json.dumps(timings))
+
+def _default_threads():
+    cpu_count = os.cpu_count() or 1
+    threads = [1]
+    while threads[-1] * 2 <= cpu_count:
+        threads.append(threads[-1] * 2)
+    if threads[-1] != cpu_count:
+        threads.append(cpu_count)
+    return threads
+
+def main():
+    parser = argparse.ArgumentParser(description="Passage à l'échelle de la segmentation (--threads)")
+    parser.add_argument("--size", type=int, default=128, help="Côté du volume synthétique en voxels")
+    parser.add_argument("--threads", type=int, nargs="+", default=_default_threads(),
+                        help="Nombres de threads ITK à mesurer (défaut : puissances de 2 jusqu'au nombre de cœurs)")
+    parser.add_argument("--repeat", type=int, default=3, help="Répétitions par mesure (la meilleure est gardée)")
+    parser.add_argument("--roi", action="store_true", help="Segmentation de la tumeur limitée à une boîte (--roi)")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args.child, args.size, args.repeat, args.roi)
+        return
+
+    script = os.path.abspath(__file__)
+    print(f"Volume {args.size}³, {os.cpu_count()} cœurs")
+    print(f"{'threads':>7s} {'à la suite (s)':>15s} {'parallèle (s)':>14s} {'gain':>6s} {'accélération':>13s}")
+    reference = None
+    for threads in args.threads:
+        command = [sys.executable, script, "--child", str(threads), "--size", str(args.size),
+                   "--repeat", str(args.repeat)] + (["--roi"] if args.roi else [])
+        output = subprocess.run(command, capture_output=True, text=True, check=True, cwd=ROOT).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        reference = reference or result["sequential"]
+        print(f"{threads:7d} {result['sequential']:15.3f} {result['concurrent']:14.3f} "
+              f"x{result['sequential'] / result['concurrent']:5.2f} x{reference / result['concurrent']:12.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Temps de démarrage de main.py, avec budget.
+
+Mesure, dans des processus neufs :
+- l'import de main.py ;
+- `main.py --help` ;
+- le premier chargement d'une image par ITK : import d'ITK puis load_image ;
+- `--step analyze` complet, jusqu'à la fin du processus (sans entrepôt des résultats) : les masques
+  et les volumes NRRD bruts sont projetés en mémoire, sans ITK.
+
+Les vérifications bloquantes (modules chargés par `import main` et `--step analyze`, budgets de
+l'import et de l'analyse) sont dans tests/test_startup.py. Ce script détaille les mesures et sort
+avec le code 1 si un budget est dépassé :
+    python benchmarks/startup.py [--repeat 5] [--budget-help 0.5] [--budget-first-image 6]
+                                 [--budget-analyze 1]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+def _time_command(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=ROOT, check=True, capture_output=True)
+    return time.perf_counter() - start
+
+# Premier accès à une image par ITK dans un interpréteur neuf (recalage, segmentation) : import d'ITK
+# et chargement paresseux de son module de lecture
+FIRST_IMAGE_CODE = (
+    "import itk\n"
+    "from src.config import data_path\n"
+    "from src.image_io import load_image\n"
+    "load_image(data_path('case6_gre1.nrrd'), itk.F)\n"
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps de démarrage de main.py")
+    parser.add_argument("--repeat", type=int, default=5, help="Nombre de mesures (la meilleure est retenue)")
+    parser.add_argument("--budget-help", type=float, default=0.5, help="Budget pour `main.py --help` (s)")
+    parser.add_argument("--budget-first-image", type=float, default=6.0,
+                        help="Budget pour le premier chargement d'une image dans un processus neuf (s)")
+    parser.add_argument("--budget-analyze", type=float, default=1.0,
+                        help="Budget pour `--step analyze`, jusqu'à la fin du processus (s)")
+    parser.add_argument("--json", help="Écrit les mesures dans ce fichier JSON")
+    args = parser.parse_args()
+
+    python_startup = min(_time_command(["-c", "pass"]) for _ in range(args.repeat))
+    timings = {
+        "import": min(_time_command(["-c", "import main"]) for _ in range(args.repeat)),
+        "help": min(_time_command(["main.py", "--help"]) for _ in range(args.repeat)),
+        "first_image": min(_time_command(["-c", FIRST_IMAGE_CODE]) for _ in range(args.repeat)),
+        "analyze": min(_time_command(["main.py", "--step", "analyze", "--no-results"]) for _ in range(args.repeat)),
+    }
+    budgets = {"help": args.budget_help, "first_image": args.budget_first_image, "analyze": args.budget_analyze}
+
+    print(f"Démarrage de Python seul : {python_startup:.3f} s")
+    failed = False
+    for name, seconds in timings.items():
+        if name not in budgets:
+            print(f"{name:11s} {seconds:.3f} s")
+            continue
+        status = "ok" if seconds <= budgets[name] else "DÉPASSÉ"
+        failed |= status != "ok"
+        print(f"{name:11s} {seconds:.3f} s (budget {budgets[name]:.2f} s) {status}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python_startup": python_startup, "timings": timings, "budgets": budgets}, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Volumes IRM synthétiques avec vérité terrain, pour les benchmarks.
+
+Le fantôme est défini en coordonnées physiques (mm) : un cerveau ellipsoïdal texturé, une tumeur
+ellipsoïdale hyperintense et du bruit gaussien. La taille physique de la tête ne dépend pas de la
+résolution : un volume 64³ a des voxels de 2 mm, un volume 512³ des voxels de 0,25 mm.
+Le scan mobile est le même fantôme vu à travers une transformation rigide connue.
+"""
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import itk
+
+FIELD_OF_VIEW_MM = 128.0
+SPACING_RATIO = (1.0, 1.0, 1.2)   # x, y, z
+BRAIN_RADII_MM = (45.0, 54.0, 55.0)  # x, y, z
+TUMOR_CENTER_MM = (22.0, 12.0, 8.0)  # par rapport au centre du volume (x, y, z)
+TUMOR_RADII_MM = (12.0, 10.0, 9.0)
+DEFAULT_ROTATION_DEG = 4.0
+DEFAULT_TRANSLATION_MM = (3.0, -4.0, 2.5)
+
+def _geometry(size):
+    spacing = np.array(SPACING_RATIO) * FIELD_OF_VIEW_MM / size
+    # Origine choisie pour centrer le volume sur (0, 0, 0)
+    origin = -spacing * (size - 1) / 2.0
+    return spacing, origin
+
+def _phantom(x, y, z, tumor_radii=TUMOR_RADII_MM):
+    """Intensités et masque tumoral du fantôme aux points physiques (x, y, z)"""
+    brain = (x / BRAIN_RADII_MM[0]) ** 2 + (y / BRAIN_RADII_MM[1]) ** 2 + (z / BRAIN_RADII_MM[2]) ** 2 < 1
+    tumor = sum(((c - c0) / r) ** 2 for c, c0, r in zip((x, y, z), TUMOR_CENTER_MM, tumor_radii)) < 1
+    image = np.where(brain, 400.0, 20.0).astype(np.float32)
+    image += (80.0 * np.sin(x / 7.0) * brain).astype(np.float32)
+    image[tumor] = 700.0
+    return image, tumor
+
+def true_transform(rotation_deg=DEFAULT_ROTATION_DEG, translation_mm=DEFAULT_TRANSLATION_MM):
+    """Transformation rigide fixe -> mobile (rotation autour de z, centrée sur le volume, puis translation)"""
+    transform = itk.VersorRigid3DTransform[itk.D].New()
+    axis = itk.Vector[itk.D, 3]()
+    axis[0], axis[1], axis[2] = 0.0, 0.0, 1.0
+    transform.SetRotation(axis, np.deg2rad(rotation_deg))
+    translation = itk.Vector[itk.D, 3]()
+    for a in range(3):
+        translation[a] = translation_mm[a]
+    transform.SetTranslation(translation)
+    return transform
+
+def make_volume(size, transform=None, tumor_radii=TUMOR_RADII_MM, noise=10.0, seed=0, slab=32):
+    """Volume size³ du fantôme, vu à travers `transform` (fixe -> mobile) si elle est donnée.
+
+    Le voxel q du scan mobile vaut le fantôme en T⁻¹(q) : le recalage du scan mobile sur le scan
+    non transformé doit retrouver T. Calcul par tranches de `slab` coupes pour borner la mémoire.
+    Retourne (image ITK float, masque tumoral vrai en uint8).
+    """
+    spacing, origin = _geometry(size)
+    inverse_matrix, inverse_offset = np.eye(3), np.zeros(3)
+    if transform is not None:
+        matrix = itk.array_from_matrix(transform.GetMatrix())
+        offset = np.array(transform.GetOffset())
+        inverse_matrix = np.linalg.inv(matrix)
+        inverse_offset = -inverse_matrix @ offset
+
+    rng = np.random.default_rng(seed)
+    image = np.empty((size, size, size), dtype=np.float32)
+    truth = np.empty((size, size, size), dtype=np.uint8)
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32)
+    for start in range(0, size, slab):
+        stop = min(start + slab, size)
+        zz = np.arange(start, stop, dtype=np.float32)[:, None, None]
+        points = [origin[0] + xx[None] * spacing[0], origin[1] + yy[None] * spacing[1], origin[2] + zz * spacing[2]]
+        points = [np.broadcast_to(p, (stop - start, size, size)) for p in points]
+        x, y, z = (inverse_matrix[a, 0] * points[0] + inverse_matrix[a, 1] * points[1]
+                   + inverse_matrix[a, 2] * points[2] + inverse_offset[a] for a in range(3))
+        slab_image, slab_tumor = _phantom(x, y, z, tumor_radii)
+        slab_image += rng.normal(0.0, noise, slab_image.shape).astype(np.float32)
+        image[start:stop] = slab_image
+        truth[start:stop] = slab_tumor
+
+    itk_image = itk.image_from_array(image)
+    itk_image.SetSpacing(spacing.tolist())
+    itk_image.SetOrigin(origin.tolist())
+    truth_image = itk.image_from_array(truth)
+    truth_image.CopyInformation(itk_image)
+    return itk_image, truth_image
+
+def tumor_seed(size):
+    """Indice (z, y, x) du centre de la tumeur dans le scan fixe"""
+    spacing, origin = _geometry(size)
+    return tuple(int(round((TUMOR_CENTER_MM[a] - origin[a]) / spacing[a])) for a in (2, 1, 0))
+
+def make_case(size, rotation_deg=DEFAULT_ROTATION_DEG, translation_mm=DEFAULT_TRANSLATION_MM, growth=1.0):
+    """Paire fixe / mobile avec vérité terrain.
+
+    growth agrandit la tumeur du scan mobile (facteur sur chaque rayon).
+    """
+    transform = true_transform(rotation_deg, translation_mm)
+    fixed, fixed_truth = make_volume(size, seed=0)
+    moving, moving_truth = make_volume(size, transform, tuple(r * growth for r in TUMOR_RADII_MM), seed=1)
+    return {
+        "size": size, "fixed": fixed, "moving": moving, "fixed_truth": fixed_truth,
+        "moving_truth": moving_truth, "transform": transform, "seed": tumor_seed(size),
+    }
@@ -1,129 +1,458 @@
 import os
 import sys
 import argparse
-import itk
-import locale
 
-from contextlib import contextmanager
+from contextlib import nullcontext
 
-from src.registration import register_images, data_path
-from src.segmentation import segment_tumor, segment_brain
-from src.analysis import compute_volume_difference, compute_intensity_statistics, compute_dice_coefficient
-from src.visualization import visualize_with_vtk, visualize_volume_vtk, visualize_two_tumors_vtk
-
-@contextmanager
-def force_c_locale():
-    """Force temporairement la locale numérique en 'C' (utile pour ITK)"""
-    current = locale.setlocale(locale.LC_NUMERIC)
-    try:
-        locale.setlocale(locale.LC_NUMERIC, "C")
-        yield
-    finally:
-        locale.setlocale(locale.LC_NUMERIC, current)
-
-def safe_itk_write(image, path):
-    """Écrit un fichier ITK tout en forçant la locale C"""
-    with force_c_locale():
-        itk.imwrite(image, path)
+# ITK, VTK et matplotlib ne sont importés que par les étapes qui s'en servent :
+# --help ou --step analyze ne paient pas le chargement de VTK ni de matplotlib.
+from src.config import (data_path, REGISTRATION_PRESETS, MASK_FORMATS, DEFAULT_MEMORY_BUDGET_MB,
+                        DEFAULT_IMAGE_CACHE_MB, DEFAULT_INTERACTIVE_FPS)
+from src.cache import DEFAULT_CACHE_DIR, cache_key, cache_lookup, cache_store, cache_evict
+from src.profiling import enable_profiling, disable_profiling, print_profile_summary, profile_span
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 fixed_path = data_path("case6_gre1.nrrd")
 moving_path = data_path("case6_gre2.nrrd")
 registered_path = data_path("registered.nrrd")
-fixed_brain_mask_path = data_path("fixed_brain_mask.nrrd")
-fixed_tumor_mask_path = data_path("fixed_tumor_mask.nrrd")
-registered_brain_mask_path = data_path("registered_brain_mask.nrrd")
-registered_tumor_mask_path = data_path("registered_tumor_mask.nrrd")
+registered_transform_path = data_path("registered_transform.tfm")
+snapshots_dir = data_path("snapshots")
+profile_path = data_path("profile/profile.jsonl")
+
+def set_mask_format(mask_format):
+    """Chemins des masques selon leur format d'enregistrement (NRRD dense ou compact)"""
+    global fixed_brain_mask_path, fixed_tumor_mask_path, registered_brain_mask_path, registered_tumor_mask_path
+    suffix = MASK_FORMATS[mask_format]
+    fixed_brain_mask_path = data_path("fixed_brain_mask" + suffix)
+    fixed_tumor_mask_path = data_path("fixed_tumor_mask" + suffix)
+    registered_brain_mask_path = data_path("registered_brain_mask" + suffix)
+    registered_tumor_mask_path = data_path("registered_tumor_mask" + suffix)
+
+set_mask_format("nrrd")
 
-def step_register(viz=False):
+def step_register(viz=False, preset="exact", warm_start=False, cache_dir=None, memory_budget_mb=None,
+                  interactive_fps=DEFAULT_INTERACTIVE_FPS):
     print("RECALAGE...")
+    from src.registration import register_images, registration_settings
+    from src.image_io import safe_itk_write, safe_transform_write, safe_transform_read, flush_writes
+    if viz:
+        from src.visualization import visualize_volume_vtk
     if not os.path.exists(fixed_path) or not os.path.exists(moving_path):
         print("Erreur: Images sources manquantes.")
         return
-    registered_image = register_images(fixed_path, moving_path)
-    safe_itk_write(registered_image, registered_path)
+    warm_start = warm_start and os.path.exists(registered_transform_path)
+
+    outputs = {"registered": registered_path, "transform": registered_transform_path}
+    if cache_dir is not None:
+        inputs = [fixed_path, moving_path] + ([registered_transform_path] if warm_start else [])
+        key = cache_key("register", inputs, registration_settings(preset))
+        if cache_lookup(cache_dir, key, outputs):
+            print("Recalage inchangé : sorties chargées depuis le cache.")
+            if viz:
+                visualize_volume_vtk(registered_path, "Registered Image", interactive_fps)
+            return
+
+    initial_transform = None
+    if warm_start:
+        print("Reprise depuis la transformation enregistrée.")
+        initial_transform = safe_transform_read(registered_transform_path)
+    if memory_budget_mb is not None:
+        from src.out_of_core import register_out_of_core
+        print("Hors mémoire : seul le rééchantillonnage est borné par --memory-budget, pas l'optimisation.")
+        transform = register_out_of_core(fixed_path, moving_path, registered_path, preset, initial_transform,
+                                         memory_budget_mb)
+        registered_image = registered_path
+    else:
+        registered_image, transform = register_images(fixed_path, moving_path, preset, initial_transform)
+        safe_itk_write(registered_image, registered_path, background=True)
+    safe_transform_write(transform, registered_transform_path)
+    flush_writes()
+    if cache_dir is not None:
+        cache_store(cache_dir, key, outputs, "register")
 
     if viz:
-        visualize_volume_vtk(registered_image, "Registered Image")
+        # Depuis le fichier : la pyramide des niveaux de détail est gardée en cache à côté
+        visualize_volume_vtk(registered_path, "Registered Image", interactive_fps)
+
+# Suffixes en plusieurs parties, que os.path.splitext couperait au dernier point
+MULTIPART_SUFFIXES = tuple(suffix for suffix in MASK_FORMATS.values() if suffix.count(".") > 1) + (".nii.gz",)
+
+def registered_name(input_path):
+    """Nom de sortie de step_resample : `_registered` avant l'extension complète (x.mask.npz, scan.nii.gz)"""
+    name = os.path.basename(input_path)
+    for suffix in MULTIPART_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return f"{name[:-len(suffix)]}_registered{name[-len(suffix):]}"
+    name, ext = os.path.splitext(name)
+    return f"{name}_registered{ext or '.nrrd'}"
 
-def step_segment(viz=False, hardcode=None):
+def step_resample(input_paths, memory_budget_mb=None):
+    """Applique la transformation enregistrée à d'autres images ou masques, sans recalage"""
+    print("RÉÉCHANTILLONNAGE...")
+    from src.registration import resample_with_transform
+    from src.image_io import safe_itk_write, safe_transform_read
+    if not os.path.exists(registered_transform_path):
+        print("Erreur: Transformation manquante, lancer d'abord --step register.")
+        return
+    transform = safe_transform_read(registered_transform_path)
+    output_paths = [data_path(registered_name(input_path)) for input_path in input_paths]
+    if memory_budget_mb is not None:
+        from src.out_of_core import resample_out_of_core
+        for input_path, output_path in zip(input_paths, output_paths):
+            resample_out_of_core(input_path, transform, fixed_path, output_path, interpolation="nearest",
+                                 memory_budget_mb=memory_budget_mb)
+            print(f"{input_path} -> {output_path}")
+        return
+    resampled = resample_with_transform(transform, input_paths, fixed_path)
+    for input_path, output_path, image in zip(input_paths, output_paths, resampled):
+        safe_itk_write(image, output_path)
+        print(f"{input_path} -> {output_path}")
+
+def select_tumor_parameters(image, seed):
+    """Balayage des seeds voisins et des facteurs de seuil ; retourne la combinaison la plus stable"""
+    from src.segmentation import sweep_tumor_parameters, seed_neighbourhood
+    results, best = sweep_tumor_parameters(image, seed_neighbourhood(seed, image.shape))
+    print(f"Balayage : {len(results)} combinaisons évaluées")
+    print(f"Retenu : seed={best['seed']}, facteurs=({best['lower_factor']}, {best['upper_factor']}), "
+          f"volume={best['volume']:.2f} mm³, composantes={best['components']}, stabilité={best['stability']:.3f}")
+    return best['seed'], best['lower_factor'], best['upper_factor']
+
+def step_segment(viz=False, hardcode=None, lower_factor=0.8, upper_factor=1.2, roi=False, sweep=False, cache_dir=None,
+                 memory_budget_mb=None, threads=None, fast_brain=False):
     print("SEGMENTATION...")
+    import itk
+    from src.segmentation import segment_scans
+    from src.image_io import load_image, safe_itk_write, flush_writes, prefetch_images
+    if viz:
+        from src.visualization import visualize_with_vtk
     if hardcode is None :
         print("La segmentation est semi-automatique. Cliquer sur la tumeur dans l'interface.")
 
-    fixed_brain_mask = segment_brain(fixed_path)
-    safe_itk_write(fixed_brain_mask, fixed_brain_mask_path)
-    fixed_tumor_mask, seed = segment_tumor(fixed_path, hardcode)
-    safe_itk_write(fixed_tumor_mask, fixed_tumor_mask_path)
-    registered_brain_mask = segment_brain(registered_path)
-    safe_itk_write(registered_brain_mask, registered_brain_mask_path)
-    registered_tumor_mask, _ = segment_tumor(registered_path, seed)
-    safe_itk_write(registered_tumor_mask, registered_tumor_mask_path)
+    outputs = {
+        "fixed_brain_mask": fixed_brain_mask_path,
+        "fixed_tumor_mask": fixed_tumor_mask_path,
+        "registered_brain_mask": registered_brain_mask_path,
+        "registered_tumor_mask": registered_tumor_mask_path,
+    }
+    # Le seed interactif n'est connu qu'après la sélection : seul un seed fixé permet de réutiliser le cache
+    if cache_dir is not None and hardcode is not None:
+        params = {"seed": list(hardcode), "lower_factor": lower_factor, "upper_factor": upper_factor,
+                  "roi": roi, "sweep": sweep, "masks": os.path.basename(fixed_tumor_mask_path),
+                  "fast_brain": fast_brain}
+        key = cache_key("segment", [fixed_path, registered_path], params)
+        if cache_lookup(cache_dir, key, outputs):
+            print("Segmentation inchangée : masques chargés depuis le cache.")
+            if viz:
+                visualize_with_vtk(load_image(registered_brain_mask_path), load_image(registered_tumor_mask_path))
+            return
+
+    fixed, registered = fixed_path, registered_path
+    if memory_budget_mb is not None:
+        # Images vues à travers leur projection mémoire plutôt que lues
+        from src.out_of_core import float_volume_image
+        print("Hors mémoire : masques calculés en volume complet, mémoire non bornée par --memory-budget.")
+        fixed, registered = float_volume_image(fixed_path), float_volume_image(registered_path)
+    else:
+        # Lue pendant le chargement de l'image fixe
+        prefetch_images([registered_path], itk.F)
+
+    # Cerveaux et tumeurs segmentés en parallèle (--threads) ; chaque masque est écrit en
+    # arrière-plan dès qu'il est prêt, pendant les segmentations suivantes
+    masks, _, _, _ = segment_scans(
+        fixed, registered, hardcode, lower_factor, upper_factor, roi=roi, threads=threads,
+        select_parameters=select_tumor_parameters if sweep else None,
+        on_mask=lambda name, mask: safe_itk_write(mask, outputs[name], background=True), fast_brain=fast_brain)
+    registered_brain_mask, registered_tumor_mask = masks["registered_brain_mask"], masks["registered_tumor_mask"]
+    flush_writes()
+    if cache_dir is not None and hardcode is not None:
+        cache_store(cache_dir, key, outputs, "segment")
 
     if viz:
         visualize_with_vtk(registered_brain_mask, registered_tumor_mask)
 
-def step_analysis():
+def step_analysis(memory_budget_mb=None, results_store=None, record_fields=None, surface_distances=False):
+    """Analyse des deux masques ; avec `results_store`, le résultat est ajouté à l'entrepôt des résultats
+    avec les champs d'identification et de paramètres `record_fields` (voir src/results_store.py).
+    `surface_distances` ajoute Hausdorff, HD95 et ASSD."""
     print("ANALYSE...")
-    fixed_tumor_mask = itk.imread(fixed_tumor_mask_path)
-    registered_tumor_mask = itk.imread(registered_tumor_mask_path)
-
-    vol_diff, vol1, vol2 = compute_volume_difference(fixed_tumor_mask, registered_tumor_mask)
-    dice = compute_dice_coefficient(fixed_tumor_mask, registered_tumor_mask)
-    stats1, stats2 = compute_intensity_statistics(fixed_path, registered_path, fixed_tumor_mask, registered_tumor_mask)
+    from src.analysis import analyze_masks
+    from src.out_of_core import is_raw_volume
+    # Les NRRD bruts écrits par le pipeline sont projetés en mémoire, sans ITK ; les autres formats
+    # passent par ITK et sont lus en arrière-plan pendant le chargement des masques
+    if memory_budget_mb is None and not all(is_raw_volume(path) for path in (fixed_path, registered_path)):
+        import itk
+        from src.image_io import prefetch_images
+        prefetch_images([fixed_path, registered_path], itk.F)
+    result = analyze_masks(fixed_tumor_mask_path, registered_tumor_mask_path, fixed_path, registered_path,
+                           memory_budget_mb=memory_budget_mb, surface_distances=surface_distances)
+    stats1, stats2 = result['stats1'], result['stats2']
 
     print()
-    print(f"Volume tumeur 1 : {vol1:.2f} mm³")
-    print(f"Volume tumeur 2 : {vol2:.2f} mm³")
-    print(f"Différence : {vol_diff:.2f} mm³")
-    print(f"Dice : {dice:.3f}")
+    print(f"Volume tumeur 1 : {result['volume1']:.2f} mm³")
+    print(f"Volume tumeur 2 : {result['volume2']:.2f} mm³")
+    print(f"Différence : {result['volume_diff']:.2f} mm³")
+    print(f"Dice : {result['dice']:.3f}")
+    print(f"Jaccard : {result['jaccard']:.3f}")
+    if surface_distances:
+        print(f"Hausdorff / HD95 / ASSD : {result['hausdorff']:.2f} / {result['hd95']:.2f} / {result['assd']:.2f} mm")
+    print(f"Voxels communs / apparus / disparus : {result['overlap_voxels']} / "
+          f"{result['growth_voxels']} / {result['regression_voxels']}")
     print(f"Moyennes d'intensité : T1={stats1['mean']:.2f} ± {stats1['std']:.2f}, "
           f"T2={stats2['mean']:.2f} ± {stats2['std']:.2f}")
+    print(f"Médianes d'intensité : T1={stats1['median']:.2f}, T2={stats2['median']:.2f}")
     print(f"Différence moyenne d'intensité : {stats2['mean'] - stats1['mean']:.2f}")
     print()
 
-def step_visualization():
+    if results_store:
+        from src.cache import code_version, file_digest
+        from src.results_store import analysis_record, append_records
+        record = analysis_record(result, source="analysis", reference_digest=file_digest(fixed_path),
+                                 digest=file_digest(moving_path),
+                                 code_version=code_version(),
+                                 **(record_fields or {}))
+        rows = append_records(results_store, [record])
+        print(f"Entrepôt des résultats : {results_store} (lignes : {rows})")
+
+def step_visualization(offscreen=False):
     print("VISUALISATION...")
-    fixed_tumor_mask = itk.imread(fixed_tumor_mask_path)
-    registered_tumor_mask = itk.imread(registered_tumor_mask_path)
-    registered_brain_mask = itk.imread(registered_brain_mask_path)
+    if offscreen:
+        from src.visualization import render_snapshots, render_overlay_mosaic
+        paths = render_snapshots(fixed_tumor_mask_path, registered_tumor_mask_path, registered_brain_mask_path, snapshots_dir)
+        paths.append(render_overlay_mosaic(fixed_path, fixed_tumor_mask_path, registered_tumor_mask_path,
+                                           os.path.join(snapshots_dir, "overlay_mosaic.png")))
+        print("Captures :", ", ".join(paths))
+        return
+    from src.visualization import visualize_two_tumors_vtk
+    from src.image_io import load_image
+    fixed_tumor_mask = load_image(fixed_tumor_mask_path)
+    registered_tumor_mask = load_image(registered_tumor_mask_path)
+    registered_brain_mask = load_image(registered_brain_mask_path)
     visualize_two_tumors_vtk(fixed_tumor_mask, registered_tumor_mask, registered_brain_mask)
 
-def parse_args():
+def step_series(paths, output_dir, seed, args):
+    print("SÉRIE LONGITUDINALE...")
+    from src.series import run_series
+    timepoints = run_series(paths, output_dir, seed, args.registration_preset, args.lower_factor,
+                            args.upper_factor, args.roi, args.workers, args.threads_per_worker,
+                            results_store=None if args.no_results else args.results_store,
+                            patient_id=args.patient_id, image_cache_mb=args.image_cache)
+    succeeded = [timepoint for timepoint in timepoints if timepoint["status"] == "ok"]
+    for timepoint in succeeded:
+        print(f"{timepoint['id']} : {timepoint['volume']:.2f} mm³")
+    if args.offscreen or not succeeded:
+        return
+    from src.visualization import visualize_series_vtk
+    visualize_series_vtk([timepoint["reference_mask"] for timepoint in succeeded],
+                         os.path.join(output_dir, "brain_mask.nrrd"),
+                         [f"{timepoint['id']} ({timepoint['volume']:.0f} mm³)" for timepoint in succeeded])
+
+def analysis_record_fields(args, seed):
+    """Identification et paramètres de la commande pour l'entrepôt des résultats (--step analyze)"""
+    reference, timepoint = (os.path.basename(path).split(".")[0] for path in (fixed_path, moving_path))
+    reference_date, date = args.scan_dates or (None, None)
+    return {
+        "patient_id": args.patient_id or reference, "reference": reference, "timepoint": timepoint,
+        "reference_date": reference_date, "date": date, "preset": args.registration_preset,
+        "seed": " ".join(str(v) for v in seed) if seed else "", "lower_factor": args.lower_factor,
+        "upper_factor": args.upper_factor, "roi": args.roi, "fast_brain": args.fast_brain,
+    }
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description="Pipeline d'analyse de tumeur")
-    parser.add_argument("--step", choices=["register", "segment", "analyze", "viz"], help="Étape à exécuter")
+    parser.add_argument("--step", choices=["register", "resample", "segment", "analyze", "viz"], help="Étape à exécuter")
     parser.add_argument("--all", action="store_true", help="Tout exécuter")
     parser.add_argument("--viz", action="store_true", help="Activer la visualisation à chaque étape")
+    parser.add_argument("--offscreen", action="store_true",
+                        help="Sans affichage : écrit des captures PNG dans Data/snapshots au lieu d'ouvrir des fenêtres")
+    parser.add_argument("--registration-preset", choices=list(REGISTRATION_PRESETS), default="exact",
+                        help="Compromis vitesse/précision du recalage : fast, balanced, exact (recalage historique, "
+                             "un seul niveau) ou accurate (pyramide sans échantillonnage)")
+    parser.add_argument("--warm-start", action="store_true",
+                        help="Reprend le recalage depuis la transformation enregistrée")
+    parser.add_argument("--resample-inputs", nargs="+", default=[],
+                        help="Images ou masques à rééchantillonner avec la transformation enregistrée (--step resample)")
+    parser.add_argument("--lower-factor", type=float, default=0.8,
+                        help="Borne basse de la croissance de région (facteur de l'intensité du seed)")
+    parser.add_argument("--upper-factor", type=float, default=1.2,
+                        help="Borne haute de la croissance de région (facteur de l'intensité du seed)")
+    parser.add_argument("--roi", action="store_true",
+                        help="Segmente la tumeur dans une boîte adaptative autour du seed plutôt que sur tout le volume")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Choisit automatiquement le seed voisin et les facteurs de seuil les plus stables")
+    parser.add_argument("--surface-distances", action="store_true",
+                        help="Analyse : ajoute Hausdorff, HD95 et ASSD (transformée de distance NumPy dans la boîte "
+                             "des masques : quelques dizaines de ms pour une tumeur, environ 2 s pour deux cerveaux 256³)")
+    parser.add_argument("--fast-brain", action="store_true",
+                        help="Masque du cerveau rapide : seuil sur un histogramme sous-échantillonné, morphologie "
+                             "sur une grille grossière, affinage en pleine résolution près du bord")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Recalcule toutes les étapes sans utiliser le cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Dossier du cache des étapes (recalage, segmentation)")
+    parser.add_argument("--batch", metavar="MANIFEST",
+                        help="Traite une cohorte décrite par un manifeste CSV/JSON (sans visualisation)")
+    parser.add_argument("--batch-output", default=data_path("cohort"),
+                        help="Dossier des sorties par patient et du tableau agrégé (--batch)")
+    parser.add_argument("--workers", type=int, help="Nombre de processus pour --batch (défaut : nombre de cœurs)")
+    parser.add_argument("--threads-per-worker", type=int,
+                        help="Threads ITK par processus pour --batch (défaut : cœurs / processus)")
+    parser.add_argument("--interactive-fps", type=float, default=DEFAULT_INTERACTIVE_FPS, metavar="FPS",
+                        help="Cadence visée du rendu volumique pendant les mouvements de caméra : niveau de "
+                             "détail réduit en conséquence, pleine résolution à l'arrêt")
+    parser.add_argument("--threads", type=int,
+                        help="Threads ITK du processus, répartis entre les segmentations simultanées de "
+                             "--step segment (défaut : nombre de cœurs)")
+    parser.add_argument("--mask-format", choices=list(MASK_FORMATS), default="nrrd",
+                        help="Format des masques : NRRD dense, ou compact (boîte englobante codée par plages et "
+                             "compressée, .mask.npz)")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="Grands volumes : NRRD non compressés projetés en mémoire, rééchantillonnage et "
+                             "analyse par tranches. La segmentation et l'optimisation du recalage lisent les "
+                             "projections sans copie mais allouent des images de la taille du volume : leur "
+                             "mémoire n'est pas bornée")
+    parser.add_argument("--memory-budget", type=int, default=DEFAULT_MEMORY_BUDGET_MB, metavar="MO",
+                        help="Mémoire de travail du rééchantillonnage et de l'analyse par tranches (--out-of-core)")
+    parser.add_argument("--image-cache", type=int, metavar="MO",
+                        help="Budget du cache des images gardées en mémoire d'une étape à l'autre, distinct de "
+                             f"--memory-budget (défaut : {DEFAULT_IMAGE_CACHE_MB} Mo, ou la valeur de la variable "
+                             "d'environnement VITK_IMAGE_CACHE_MB)")
     parser.add_argument("--hardcodeseed", action="store_true", help="Utilise une valeur hardcode pour la seed de la tumeur")
-    return parser.parse_args()
-
-def main():
-    args = parse_args()
+    parser.add_argument("--seed", type=int, nargs=3, metavar=("Z", "Y", "X"),
+                        help="Seed de la tumeur (indices z y x), à la place de la sélection interactive")
+    parser.add_argument("--series", nargs="+", metavar="SCAN",
+                        help="Suivi sur N examens (le premier sert de référence) ; relancer avec un nouvel examen "
+                             "ne traite que celui-ci")
+    parser.add_argument("--series-output", default=data_path("series"),
+                        help="Dossier des sorties et de l'état de la série (--series)")
+    parser.add_argument("--results-store", default=data_path("results"), metavar="DIR",
+                        help="Entrepôt en colonnes des résultats d'analyse (--step analyze, --batch, --series)")
+    parser.add_argument("--no-results", action="store_true", help="N'ajoute rien à l'entrepôt des résultats")
+    parser.add_argument("--patient-id",
+                        help="Patient des résultats enregistrés (défaut : nom du scan fixe, ou du dossier de --series)")
+    parser.add_argument("--scan-dates", nargs=2, metavar=("FIXE", "MOBILE"),
+                        help="Dates des deux scans (AAAA-MM-JJ) pour l'entrepôt des résultats")
+    parser.add_argument("--worker", action="store_true",
+                        help="Exécute la commande dans le processus de travail persistant (démarré si besoin)")
+    parser.add_argument("--serve", action="store_true",
+                        help="Lance le processus de travail persistant (ITK chargé, images gardées en mémoire)")
+    parser.add_argument("--stop-worker", action="store_true", help="Arrête le processus de travail persistant")
+    parser.add_argument("--worker-address", help="Socket Unix du processus de travail")
+    parser.add_argument("--profile", nargs="?", const=profile_path, metavar="JSONL",
+                        help="Mesure durée, CPU et mémoire de chaque étape et filtre ITK (lignes JSON, "
+                             f"défaut {profile_path}) ; avec --batch, un profil par patient")
+    parser.add_argument("--profile-chrome", metavar="JSON",
+                        help="Écrit aussi une trace pour chrome://tracing ou Perfetto (avec --profile)")
+    args = parser.parse_args(argv)
 
-    if not args.all and not args.step:
+    if not args.all and not args.step and not args.batch and not args.series:
         args.all = True
         args.hardcodeseed = True
+    return args
+
+def needs_local_run(args):
+    """Les fenêtres (sélection du seed, VTK), le mode cohorte et les séries restent dans le processus courant"""
+    interactive_seed = (args.all or args.step == "segment") and not (args.hardcodeseed or args.seed)
+    windows = not args.offscreen and (args.viz or args.all or args.step == "viz")
+    return bool(args.batch or args.series) or interactive_seed or windows
+
+def run(args):
+    if args.batch:
+        from src.batch import run_batch
+        run_batch(args.batch, args.batch_output, args.workers, args.threads_per_worker,
+                  args.registration_preset, args.lower_factor, args.upper_factor, args.roi, args.sweep,
+                  snapshots=args.offscreen, profile=bool(args.profile), mask_format=args.mask_format,
+                  fast_brain=args.fast_brain, results_store=None if args.no_results else args.results_store,
+                  surface_distances=args.surface_distances, image_cache_mb=args.image_cache)
+        return
+    if not args.profile:
+        run_steps(args)
+        return
+
+    enable_profiling(args.profile, args.profile_chrome)
+    try:
+        with profile_span("pipeline"):
+            run_steps(args)
+    finally:
+        totals = disable_profiling()
+        print_profile_summary(totals)
+        print(f"Profil : {args.profile}" + (f", trace : {args.profile_chrome}" if args.profile_chrome else ""))
 
+def run_steps(args):
     seed = None
     if args.hardcodeseed :
         seed = (53, 63, 83)
+    if args.seed:
+        seed = tuple(args.seed)
 
-    if args.all:
-        step_register(viz=args.viz)
-        step_segment(viz=args.viz, hardcode=seed)
-        step_analysis()
-        step_visualization()
-    elif args.step == "register":
-        step_register(viz=args.viz)
-    elif args.step == "segment":
-        step_segment(viz=args.viz, hardcode=seed)
-    elif args.step == "analyze":
-        step_analysis()
-    elif args.step == "viz":
-        step_visualization()
-    else:
+    # --image-cache et --threads sont rétablis après la commande : un processus de travail persistant
+    # (--worker) en sert d'autres
+    image_cache = nullcontext()
+    if args.image_cache is not None:
+        from src.image_io import image_cache_budget
+        image_cache = image_cache_budget(args.image_cache)
+
+    if args.series:
+        with image_cache:
+            step_series(args.series, args.series_output, seed, args)
+        return
+
+    cache_dir = None if args.no_cache else args.cache_dir
+    set_mask_format(args.mask_format)
+    threads_context = nullcontext()
+    if args.threads:
+        from src.parallel import itk_threads
+        threads_context = itk_threads(args.threads)
+    memory_budget_mb = args.memory_budget if args.out_of_core else None
+    if args.offscreen:
+        # Pas de fenêtre interactive en mode hors écran
+        args.viz = False
+
+    steps = ["register", "segment", "analyze", "viz"] if args.all else [args.step] if args.step else []
+    with threads_context, image_cache:
+        for step in steps:
+            with profile_span(f"step_{step}"):
+                if step == "register":
+                    step_register(viz=args.viz, preset=args.registration_preset, warm_start=args.warm_start,
+                                  cache_dir=cache_dir, memory_budget_mb=memory_budget_mb,
+                                  interactive_fps=args.interactive_fps)
+                elif step == "resample":
+                    step_resample(args.resample_inputs, memory_budget_mb)
+                elif step == "segment":
+                    step_segment(viz=args.viz, hardcode=seed, lower_factor=args.lower_factor,
+                                 upper_factor=args.upper_factor, roi=args.roi, sweep=args.sweep, cache_dir=cache_dir,
+                                 memory_budget_mb=memory_budget_mb, threads=args.threads, fast_brain=args.fast_brain)
+                elif step == "analyze":
+                    step_analysis(memory_budget_mb, None if args.no_results else args.results_store,
+                                  analysis_record_fields(args, seed), args.surface_distances)
+                elif step == "viz":
+                    step_visualization(offscreen=args.offscreen)
+    if not steps:
         print("Spécifier --step ou --all. Utilise --help pour les options.")
 
+    if cache_dir is not None:
+        cache_evict(cache_dir)
+
+def main():
+    args = parse_args()
+    if args.serve or args.stop_worker or args.worker:
+        from src.worker import DEFAULT_WORKER_ADDRESS, serve, stop_worker, run_remote
+        address = args.worker_address or DEFAULT_WORKER_ADDRESS
+
+    if args.serve:
+        serve(lambda argv: run(parse_args(argv)), address)
+        return
+    if args.stop_worker:
+        print("Processus de travail arrêté." if stop_worker(address) else "Aucun processus de travail actif.")
+        return
+    if args.worker:
+        if needs_local_run(args):
+            print("Fenêtres interactives ou mode cohorte : exécution dans ce processus.")
+        else:
+            argv = [arg for arg in sys.argv[1:] if arg != "--worker"]
+            server_command = [sys.executable, os.path.abspath(__file__), "--serve", "--worker-address", address]
+            sys.exit(run_remote(argv, server_command, address))
+    run(args)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
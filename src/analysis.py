@@ -1,72 +1,369 @@
-import itk
 import numpy as np
 
-def compute_volume_difference(mask1, mask2):
-    if isinstance(mask1, str):
-        mask1 = itk.imread(mask1, itk.ctype("unsigned char"))
-    if isinstance(mask2, str):
-        mask2 = itk.imread(mask2, itk.ctype("unsigned char"))
-    
-    arr1 = itk.GetArrayFromImage(mask1)
-    arr2 = itk.GetArrayFromImage(mask2)
-    
-    count1 = np.count_nonzero(arr1)
-    count2 = np.count_nonzero(arr2)
-    
-    spacing = mask1.GetSpacing()
+from src.mask_store import is_compact_mask, open_compact_mask, compact_mask_roi, nonzero_bounding_box
+from src.out_of_core import is_raw_volume, open_volume, release_pages, slab_slices
+from src.profiling import profile_span
+
+# ITK n'est importé que pour les images ITK et les formats qu'open_volume ne projette pas : l'analyse
+# de masques NRRD bruts ou compacts (--step analyze après segmentation) ne le charge pas.
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Bytes par voxel d'une tranche : deux masques, deux images float et les masques booléens temporaires
+_SLAB_BYTES_PER_VOXEL = 16
+
+def _load(image, pixel_type, out_of_core=False):
+    """Volume projeté en mémoire (open_volume) pour un chemin NRRD brut, toujours en mode hors mémoire ;
+    sinon image ITK (lecture mémorisée de src/image_io.py)"""
+    if isinstance(image, str) and (out_of_core or is_raw_volume(image)):
+        return open_volume(image)
+    import itk
+    from src.image_io import load_image
+    return load_image(image, itk.ctype(pixel_type))
+
+def _load_mask(mask, out_of_core=False):
+    """Comme _load ; seulement l'en-tête d'un masque compact (décodé plus tard, boîte par boîte)"""
+    if is_compact_mask(mask):
+        return open_compact_mask(mask)
+    return _load(mask, "unsigned char", out_of_core)
+
+def _array(source, bbox, crop):
+    if isinstance(source, dict):
+        if "array" in source:
+            return source["array"][crop]
+        return compact_mask_roi(source, bbox)
+    import itk
+    return itk.array_view_from_image(source)[crop]
+
+def _new_accumulator():
+    return {'count': 0, 'sum': 0.0, 'sum_sq': 0.0, 'min': np.inf, 'max': -np.inf, 'values': []}
+
+def _accumulate(acc, values):
+    if values.size == 0:
+        return
+    # Volume projeté : le type stocké dans le fichier (entiers possibles), comme la lecture ITK en float
+    values = values.astype(np.float32, copy=False)
+    acc['count'] += values.size
+    acc['sum'] += float(values.sum(dtype=np.float64))
+    acc['sum_sq'] += float(np.dot(values.astype(np.float64), values))
+    acc['min'] = min(acc['min'], float(values.min()))
+    acc['max'] = max(acc['max'], float(values.max()))
+    acc['values'].append(values)
+
+def _intensity_summary(acc, percentiles):
+    count = acc['count']
+    if count == 0:
+        return {'mean': np.nan, 'std': np.nan, 'median': np.nan, 'min': np.nan, 'max': np.nan,
+                'percentiles': {p: np.nan for p in percentiles}}
+
+    mean = acc['sum'] / count
+    std = float(np.sqrt(max(acc['sum_sq'] / count - mean * mean, 0.0)))
+
+    # Percentiles par sélection partielle (np.partition) plutôt qu'un tri complet
+    values = np.concatenate(acc['values'])
+    ranks = {p: p / 100.0 * (count - 1) for p in set(percentiles) | {50}}
+    kth = sorted({int(np.floor(r)) for r in ranks.values()} | {int(np.ceil(r)) for r in ranks.values()})
+    values = np.partition(values, kth)
+
+    def at(rank):
+        low, high = int(np.floor(rank)), int(np.ceil(rank))
+        return float(values[low] + (values[high] - values[low]) * (rank - low))
+
+    return {
+        'mean': mean,
+        'std': std,
+        'median': at(ranks[50]),
+        'min': acc['min'],
+        'max': acc['max'],
+        'percentiles': {p: at(ranks[p]) for p in percentiles},
+    }
+
+def _bounding_box(mask):
+    if not isinstance(mask, dict):
+        from src.image_io import mask_bounding_box
+        return mask_bounding_box(mask)
+    if "array" in mask:
+        bbox = mask["metadata"].get("roi_bbox")
+        return None if bbox is None else tuple(int(v) for v in bbox.split())
+    return mask["bbox"]
+
+def _union_bounding_box(*masks):
+    """Boîte englobant les masques, si tous portent la leur (toujours le cas d'un masque compact)"""
+    boxes = [_bounding_box(mask) for mask in masks]
+    if None in boxes:
+        return None
+    # Boîte vide d'un masque compact sans voxel
+    boxes = [bbox for bbox in boxes if all(bbox[a + 3] > bbox[a] for a in range(3))] or [(0,) * 6]
+    return tuple(min(bbox[a] for bbox in boxes) for a in range(3)) + \
+        tuple(max(bbox[a] for bbox in boxes) for a in range(3, 6))
+
+def _surface(mask):
+    """Voxels de bord d'un masque booléen : voxels du masque dont un des 6 voisins est hors du masque"""
+    padded = np.pad(mask, 1)
+    surface = ~mask
+    for axis in range(3):
+        for offset in (0, 2):
+            neighbors = [slice(1, -1)] * 3
+            neighbors[axis] = slice(offset, offset + mask.shape[axis])
+            surface |= ~padded[tuple(neighbors)]
+    return surface & mask
+
+def _column_distance(points):
+    """Nombre de coupes (axe 0) jusqu'au voxel de `points` le plus proche de la même colonne (inf si aucun)"""
+    distance = np.empty(points.shape, np.float32)
+    last = np.full(points.shape[1:], np.inf, np.float32)
+    for i in range(points.shape[0]):
+        last = np.where(points[i], 0.0, last + 1.0)
+        distance[i] = last
+    last[:] = np.inf
+    for i in reversed(range(points.shape[0])):
+        last = np.where(points[i], 0.0, last + 1.0)
+        np.minimum(distance[i], last, out=distance[i])
+    return distance
+
+def _window_minimum(squared, axis, window, spacing):
+    """min sur |t| <= window de squared[i + t] + (t × spacing)², le long de `axis`"""
+    result = squared.copy()
+    for t in range(1, min(window, squared.shape[axis] - 1) + 1):
+        cost = np.float32((t * spacing) ** 2)
+        low, high = [slice(None)] * 3, [slice(None)] * 3
+        low[axis], high[axis] = slice(None, -t), slice(t, None)
+        low, high = tuple(low), tuple(high)
+        np.minimum(result[high], squared[low] + cost, out=result[high])
+        np.minimum(result[low], squared[high] + cost, out=result[low])
+    return result
+
+def _distance_to(points, queries, spacing):
+    """Distance euclidienne (mm) de chaque voxel de `queries` au voxel de `points` le plus proche.
+
+    Transformée de distance séparable en NumPy : distance exacte le long de l'axe 0 par balayage,
+    puis minimum sur une fenêtre de ±w voxels le long des axes 1 et 2. Un résultat au plus égal à
+    w fois le plus petit espacement de ces deux axes est exact ; w double tant qu'un voxel demandé
+    dépasse cette borne. Le coût suit donc la distance entre les surfaces, pas la taille de la boîte.
+    `spacing` est dans l'ordre d'ITK (x, y, z).
+    """
+    sx, sy, sz = (float(s) for s in spacing)
+    column = _column_distance(points) * np.float32(sz)
+    column *= column
+    window = 4
+    while True:
+        squared = _window_minimum(_window_minimum(column, 1, window, sy), 2, window, sx)[queries]
+        exact = window >= max(points.shape[1:]) - 1
+        if exact or squared.max() <= (window * min(sx, sy)) ** 2:
+            return np.sqrt(squared)
+        window *= 2
+
+def _surface_distances(arr1, arr2, spacing):
+    """Distances de surface entre deux masques (tableaux z, y, x), restreintes à leur boîte commune.
+
+    Retourne les métriques et la carte signée sur la surface du masque 2 (dans la boîte `bbox`,
+    relative aux tableaux), ou None si un des masques est vide.
+    """
+    m1, m2 = arr1 != 0, arr2 != 0
+    bbox = nonzero_bounding_box(m1 | m2)
+    if bbox is None:
+        return None
+    crop = tuple(slice(bbox[a], bbox[a + 3]) for a in range(3))
+    m1, m2 = m1[crop], m2[crop]
+    surface1, surface2 = _surface(m1), _surface(m2)
+    if not surface1.any() or not surface2.any():
+        return None
+
+    d12 = _distance_to(surface2, surface1, spacing)
+    d21 = _distance_to(surface1, surface2, spacing)
+
+    # Bord du masque 2 hors du masque 1 : croissance (distance positive) ; dedans : régression (négative)
+    signed = np.zeros(m2.shape, np.float32)
+    signed[surface2] = np.where(m1[surface2], -d21, d21)
+    return {
+        'hausdorff': float(max(d12.max(), d21.max())),
+        'hd95': float(max(np.percentile(d12, 95), np.percentile(d21, 95))),
+        'assd': float((d12.sum() + d21.sum()) / (d12.size + d21.size)),
+        'surface_map': signed,
+        'bbox': bbox,
+    }
+
+def analyze_masks(mask1, mask2, image1=None, image2=None, percentiles=DEFAULT_PERCENTILES, slab_size=16,
+                  memory_budget_mb=None, surface_distances=False):
+    """Analyse complète de deux masques (et des intensités sous-jacentes) en un seul passage.
+
+    Chaque volume est chargé une fois puis lu sans copie (array_view_from_image), par tranches
+    de `slab_size` coupes : la mémoire de travail est bornée par la taille d'une tranche et par
+    le nombre de voxels segmentés. Si les masques portent leur boîte englobante (segment_tumor,
+    format compact), seule la boîte commune est parcourue ; les masques compacts (.mask.npz) ne
+    sont alors décodés que dans cette boîte. Avec `memory_budget_mb` (mode hors mémoire), les
+    chemins NRRD non compressés sont projetés en mémoire au lieu d'être lus, la taille des tranches
+    découle du budget et les pages lues sont rendues au système après chaque tranche.
+    Retourne un dictionnaire avec volumes, Dice, Jaccard, nombres de voxels communs / apparus /
+    disparus et statistiques d'intensité ('stats1', 'stats2'). Avec `surface_distances`, ajoute
+    les distances de surface en mm ('hausdorff', 'hd95', 'assd', voir compute_surface_distances).
+    """
+    with profile_span("analyze_masks", out_of_core=memory_budget_mb is not None):
+        return _analyze_masks(mask1, mask2, image1, image2, percentiles, slab_size, memory_budget_mb,
+                              surface_distances)
+
+def _analyze_masks(mask1, mask2, image1, image2, percentiles, slab_size, memory_budget_mb, surface_distances):
+    out_of_core = memory_budget_mb is not None
+    mask1 = _load_mask(mask1, out_of_core)
+    mask2 = _load_mask(mask2, out_of_core)
+    with_intensities = image1 is not None and image2 is not None
+    if with_intensities:
+        image1 = _load(image1, "float", out_of_core)
+        image2 = _load(image2, "float", out_of_core)
+    volumes = [source for source in (mask1, mask2, image1, image2)
+               if out_of_core and isinstance(source, dict) and "array" in source]
+
+    bbox = _union_bounding_box(mask1, mask2)
+    crop = (slice(None),) * 3 if bbox is None else tuple(slice(bbox[a], bbox[a + 3]) for a in range(3))
+
+    arr1 = _array(mask1, bbox, crop)
+    arr2 = _array(mask2, bbox, crop)
+    if with_intensities:
+        img1_arr = _array(image1, bbox, crop)
+        img2_arr = _array(image2, bbox, crop)
+    if out_of_core and arr1.size:
+        slab_size = slab_slices(arr1.shape, _SLAB_BYTES_PER_VOXEL, memory_budget_mb)
+
+    count1 = count2 = intersection = 0
+    acc1, acc2 = _new_accumulator(), _new_accumulator()
+
+    for start in range(0, arr1.shape[0], slab_size):
+        slab = slice(start, start + slab_size)
+        m1 = arr1[slab] != 0
+        m2 = arr2[slab] != 0
+        count1 += int(np.count_nonzero(m1))
+        count2 += int(np.count_nonzero(m2))
+        intersection += int(np.count_nonzero(m1 & m2))
+
+        if with_intensities:
+            _accumulate(acc1, img1_arr[slab][m1])
+            _accumulate(acc2, img2_arr[slab][m2])
+        for volume in volumes:
+            release_pages(volume)
+
+    spacing = mask1["spacing"] if isinstance(mask1, dict) else mask1.GetSpacing()
     voxel_volume = spacing[0] * spacing[1] * spacing[2]
-    
     vol1 = count1 * voxel_volume
     vol2 = count2 * voxel_volume
-    
-    return vol2 - vol1, vol1, vol2
+    union = count1 + count2 - intersection
 
-def compute_intensity_statistics(image1, image2, mask1, mask2):
-    if isinstance(image1, str):
-        image1 = itk.imread(image1, itk.ctype("float"))
-    if isinstance(image2, str):
-        image2 = itk.imread(image2, itk.ctype("float"))
-    if isinstance(mask1, str):
-        mask1 = itk.imread(mask1, itk.ctype("unsigned char"))
-    if isinstance(mask2, str):
-        mask2 = itk.imread(mask2, itk.ctype("unsigned char"))
-    
-    img1_arr = itk.GetArrayFromImage(image1)
-    img2_arr = itk.GetArrayFromImage(image2)
-    mask1_arr = itk.GetArrayFromImage(mask1)
-    mask2_arr = itk.GetArrayFromImage(mask2)
-    
-    intensities1 = img1_arr[mask1_arr > 0]
-    intensities2 = img2_arr[mask2_arr > 0]
-    
-    stats1 = {
-        'mean': np.mean(intensities1),
-        'std': np.std(intensities1),
-        'median': np.median(intensities1),
-        'min': np.min(intensities1),
-        'max': np.max(intensities1)
+    result = {
+        'voxel_volume': voxel_volume,
+        'count1': count1,
+        'count2': count2,
+        'volume1': vol1,
+        'volume2': vol2,
+        'volume_diff': vol2 - vol1,
+        'dice': 2.0 * intersection / (count1 + count2) if count1 + count2 else np.nan,
+        'jaccard': intersection / union if union else np.nan,
+        'overlap_voxels': intersection,
+        'growth_voxels': count2 - intersection,
+        'regression_voxels': count1 - intersection,
     }
-    
-    stats2 = {
-        'mean': np.mean(intensities2),
-        'std': np.std(intensities2),
-        'median': np.median(intensities2),
-        'min': np.min(intensities2),
-        'max': np.max(intensities2)
-    }
-    
-    return stats1, stats2
+    if with_intensities:
+        result['stats1'] = _intensity_summary(acc1, percentiles)
+        result['stats2'] = _intensity_summary(acc2, percentiles)
+    if surface_distances:
+        with profile_span("surface_distances"):
+            distances = _surface_distances(arr1, arr2, spacing)
+        for name in ('hausdorff', 'hd95', 'assd'):
+            result[name] = np.nan if distances is None else distances[name]
+    return result
+
+def analyze_mask(mask, image=None, percentiles=DEFAULT_PERCENTILES, slab_size=16, memory_budget_mb=None):
+    """Volume d'un seul masque et statistiques d'intensité de l'image sous-jacente.
+
+    Même parcours qu'analyze_masks (boîte englobante, tranches, mode hors mémoire), sans le second
+    masque. Retourne 'voxel_volume', 'count', 'volume' et, avec une image, 'stats'.
+    """
+    with profile_span("analyze_mask", out_of_core=memory_budget_mb is not None):
+        return _analyze_mask(mask, image, percentiles, slab_size, memory_budget_mb)
+
+def _analyze_mask(mask, image, percentiles, slab_size, memory_budget_mb):
+    out_of_core = memory_budget_mb is not None
+    mask = _load_mask(mask, out_of_core)
+    if image is not None:
+        image = _load(image, "float", out_of_core)
+    volumes = [source for source in (mask, image) if out_of_core and isinstance(source, dict) and "array" in source]
+
+    bbox = _union_bounding_box(mask)
+    crop = (slice(None),) * 3 if bbox is None else tuple(slice(bbox[a], bbox[a + 3]) for a in range(3))
+
+    arr = _array(mask, bbox, crop)
+    if image is not None:
+        img_arr = _array(image, bbox, crop)
+    if out_of_core and arr.size:
+        slab_size = slab_slices(arr.shape, _SLAB_BYTES_PER_VOXEL, memory_budget_mb)
+
+    count = 0
+    acc = _new_accumulator()
+    for start in range(0, arr.shape[0], slab_size):
+        slab = slice(start, start + slab_size)
+        m = arr[slab] != 0
+        count += int(np.count_nonzero(m))
+        if image is not None:
+            _accumulate(acc, img_arr[slab][m])
+        for volume in volumes:
+            release_pages(volume)
+
+    spacing = mask["spacing"] if isinstance(mask, dict) else mask.GetSpacing()
+    voxel_volume = spacing[0] * spacing[1] * spacing[2]
+    result = {'voxel_volume': voxel_volume, 'count': count, 'volume': count * voxel_volume}
+    if image is not None:
+        result['stats'] = _intensity_summary(acc, percentiles)
+    return result
+
+def _mask_geometry(mask):
+    import itk
+    if isinstance(mask, dict):
+        return mask["shape"], mask["spacing"], mask["origin"], np.asarray(mask["direction"], dtype=np.float64)
+    return (tuple(itk.size(mask))[::-1], tuple(mask.GetSpacing()), tuple(mask.GetOrigin()),
+            itk.array_from_matrix(mask.GetDirection()))
+
+def compute_surface_distances(mask1, mask2):
+    """Distances de surface (mm) entre deux masques, calculées dans la boîte englobant les deux.
+
+    - 'hausdorff' : plus grande distance d'un voxel de bord d'un masque au bord de l'autre
+    - 'hd95' : maximum des 95e percentiles des distances dans chaque sens
+    - 'assd' : distance moyenne, sur les voxels de bord des deux masques
+    - 'surface_map' : image ITK (float, grille du masque 2) portant sur chaque voxel de bord du masque 2
+      sa distance signée au bord du masque 1 : positive hors du masque 1 (croissance), négative
+      dedans (régression) ; nulle ailleurs
+
+    Les distances utilisent l'espacement du masque 1, comme compute_volume_difference. Métriques
+    NaN et carte nulle si un des masques est vide.
+    """
+    import itk
+    mask1, mask2 = _load_mask(mask1), _load_mask(mask2)
+    bbox = _union_bounding_box(mask1, mask2)
+    crop = (slice(None),) * 3 if bbox is None else tuple(slice(bbox[a], bbox[a + 3]) for a in range(3))
+    spacing = mask1["spacing"] if isinstance(mask1, dict) else mask1.GetSpacing()
+    with profile_span("surface_distances"):
+        distances = _surface_distances(_array(mask1, bbox, crop), _array(mask2, bbox, crop), spacing)
+
+    shape, spacing2, origin, direction = _mask_geometry(mask2)
+    surface_map = np.zeros(shape, np.float32)
+    if distances is not None:
+        offset = (0, 0, 0) if bbox is None else bbox[:3]
+        inner = distances['bbox']
+        surface_map[tuple(slice(offset[a] + inner[a], offset[a] + inner[a + 3]) for a in range(3))] = \
+            distances['surface_map']
+    image = itk.image_from_array(surface_map)
+    image.SetSpacing(spacing2)
+    image.SetOrigin(origin)
+    image.SetDirection(itk.matrix_from_array(np.ascontiguousarray(direction)))
+
+    result = {name: np.nan if distances is None else distances[name] for name in ('hausdorff', 'hd95', 'assd')}
+    result['surface_map'] = image
+    return result
+
+def compute_volume_difference(mask1, mask2):
+    result = analyze_masks(mask1, mask2)
+    return result['volume_diff'], result['volume1'], result['volume2']
+
+def compute_intensity_statistics(image1, image2, mask1, mask2):
+    result = analyze_masks(mask1, mask2, image1, image2)
+    return result['stats1'], result['stats2']
 
 def compute_dice_coefficient(mask1, mask2):
-    if isinstance(mask1, str):
-        mask1 = itk.imread(mask1, itk.ctype("unsigned char"))
-    if isinstance(mask2, str):
-        mask2 = itk.imread(mask2, itk.ctype("unsigned char"))
-    
-    arr1 = itk.GetArrayFromImage(mask1)
-    arr2 = itk.GetArrayFromImage(mask2)
-    
-    intersection = np.logical_and(arr1, arr2)
-    dice = 2.0 * intersection.sum() / (arr1.sum() + arr2.sum())
-    
-    return dice
\ No newline at end of file
+    return analyze_masks(mask1, mask2)['dice']
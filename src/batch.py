@@ -0,0 +1,300 @@
+import csv
+import json
+import multiprocessing
+import os
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from src.config import MASK_FORMATS
+from src.image_io import (safe_itk_write, safe_transform_write, clear_image_cache, flush_writes, prefetch_files,
+                          set_image_cache_budget)
+from src.profiling import enable_profiling, disable_profiling
+
+RESULT_FIELDS = [
+    "patient_id", "status", "error", "seconds",
+    "seed", "lower_factor", "upper_factor", "stability",
+    "volume1", "volume2", "volume_diff", "dice", "jaccard", "hausdorff", "hd95", "assd",
+    "mean1", "std1", "median1", "mean2", "std2", "median2",
+]
+
+def _parse_seed(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = value.replace(",", " ").split()
+    seed = tuple(int(v) for v in value)
+    if len(seed) != 3:
+        raise ValueError(f"Seed invalide : {value} (attendu : z y x)")
+    return seed
+
+def load_manifest(manifest_path):
+    """Lit un manifeste de cohorte (CSV ou JSON).
+
+    Chaque patient a un identifiant `patient_id`, deux scans `fixed` et `moving`, un `seed`
+    optionnel (z y x) et les dates optionnelles des deux scans `fixed_date` et `moving_date`
+    (AAAA-MM-JJ). Les chemins relatifs sont résolus par rapport au dossier du manifeste.
+    """
+    if manifest_path.endswith(".json"):
+        with open(manifest_path) as f:
+            rows = json.load(f)
+    else:
+        with open(manifest_path, newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    cases = []
+    for row in rows:
+        cases.append({
+            "patient_id": str(row["patient_id"]),
+            "fixed": os.path.join(base_dir, row["fixed"]),
+            "moving": os.path.join(base_dir, row["moving"]),
+            "seed": _parse_seed(row.get("seed")),
+            "fixed_date": row.get("fixed_date") or None,
+            "moving_date": row.get("moving_date") or None,
+        })
+    return cases
+
+def _init_worker(threads_per_worker, image_cache_mb=None):
+    # Environnement du seul processus de travail, fixé avant tout import d'ITK ou de matplotlib
+    os.environ["ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS"] = str(threads_per_worker)
+    os.environ["MPLBACKEND"] = "Agg"
+    import itk
+    itk.MultiThreaderBase.SetGlobalDefaultNumberOfThreads(threads_per_worker)
+    if image_cache_mb is not None:
+        set_image_cache_budget(image_cache_mb)
+
+def process_pool(task_count, workers=None, threads_per_worker=None, image_cache_mb=None):
+    """Pool de processus ("spawn") pour des tâches ITK indépendantes.
+
+    Les cœurs sont partagés entre processus : workers × threads_per_worker ne dépasse pas
+    le nombre de cœurs, ce qui évite la sur-souscription des threads ITK. `image_cache_mb` fixe le
+    budget du cache des images de chaque processus (défaut : DEFAULT_IMAGE_CACHE_MB).
+    Retourne (pool, workers, threads_per_worker).
+    """
+    cpu_count = os.cpu_count() or 1
+    workers = workers or min(task_count, cpu_count) or 1
+    threads_per_worker = threads_per_worker or max(1, cpu_count // workers)
+
+    context = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                               initializer=_init_worker, initargs=(threads_per_worker, image_cache_mb))
+    return pool, workers, threads_per_worker
+
+def process_patient(case, output_dir, preset="exact", lower_factor=0.8, upper_factor=1.2, roi=False, sweep=False,
+                    snapshots=False, profile=False, mask_format="nrrd", fast_brain=False, surface_distances=False):
+    """Recalage -> segmentation -> analyse d'un patient, sans aucune fenêtre.
+
+    snapshots=True ajoute des captures PNG de contrôle qualité (rendu hors écran) dans `<patient>/snapshots`.
+    profile=True écrit le profil des étapes dans `<patient>/profile.jsonl` (voir src/profiling.py).
+    mask_format="compact" enregistre les masques au format compact (voir src/mask_store.py).
+    fast_brain=True choisit le mode rapide de segment_brain.
+    surface_distances=True ajoute les distances de surface (hausdorff, hd95, assd) aux résultats.
+    Le résultat porte aussi, sous "record", la ligne de l'entrepôt des résultats (src/results_store.py).
+
+    Les erreurs sont capturées et rapportées dans le résultat : un patient en échec
+    n'interrompt pas le reste de la cohorte.
+    """
+    result = {"patient_id": case["patient_id"], "status": "ok", "error": ""}
+    start = time.perf_counter()
+    if profile:
+        enable_profiling(os.path.join(output_dir, case["patient_id"], "profile.jsonl"))
+    try:
+        from src.registration import register_images
+        from src.segmentation import segment_scans, sweep_tumor_parameters, seed_neighbourhood
+        from src.analysis import analyze_masks
+        from src.cache import code_version, file_digest
+        from src.results_store import analysis_record
+        from src.series import timepoint_id
+
+        if case["seed"] is None:
+            raise ValueError("Seed manquant : le mode cohorte ne peut pas ouvrir l'interface de sélection.")
+
+        patient_dir = os.path.join(output_dir, case["patient_id"])
+        os.makedirs(patient_dir, exist_ok=True)
+        mask_suffix = MASK_FORMATS[mask_format]
+
+        registered_image, transform = register_images(case["fixed"], case["moving"], preset)
+        registered_path = os.path.join(patient_dir, "registered.nrrd")
+        # Écritures en arrière-plan : elles se recouvrent avec la segmentation et l'analyse
+        safe_itk_write(registered_image, registered_path, background=True)
+        safe_transform_write(transform, os.path.join(patient_dir, "registered_transform.tfm"))
+
+        output_path = lambda name: os.path.join(patient_dir, name + mask_suffix)
+
+        def select_parameters(image, seed):
+            _, best = sweep_tumor_parameters(image, seed_neighbourhood(seed, image.shape))
+            result.update({"seed": " ".join(str(v) for v in best["seed"]), "lower_factor": best["lower_factor"],
+                           "upper_factor": best["upper_factor"], "stability": best["stability"]})
+            return best["seed"], best["lower_factor"], best["upper_factor"]
+
+        # Threads ITK du processus (threads_per_worker) répartis entre les segmentations simultanées
+        masks, _, _, _ = segment_scans(
+            case["fixed"], registered_image, case["seed"], lower_factor, upper_factor, roi=roi,
+            select_parameters=select_parameters if sweep else None,
+            on_mask=lambda name, mask: safe_itk_write(mask, output_path(name), background=True), fast_brain=fast_brain)
+        fixed_tumor_mask, registered_tumor_mask = masks["fixed_tumor_mask"], masks["registered_tumor_mask"]
+        registered_brain_mask = masks["registered_brain_mask"]
+
+        analysis = analyze_masks(fixed_tumor_mask, registered_tumor_mask, case["fixed"], registered_image,
+                                 surface_distances=surface_distances)
+        stats1, stats2 = analysis["stats1"], analysis["stats2"]
+
+        result.update({
+            "volume1": analysis["volume1"], "volume2": analysis["volume2"],
+            "volume_diff": analysis["volume_diff"], "dice": analysis["dice"], "jaccard": analysis["jaccard"],
+            "mean1": stats1["mean"], "std1": stats1["std"], "median1": stats1["median"],
+            "mean2": stats2["mean"], "std2": stats2["std"], "median2": stats2["median"],
+        })
+        if surface_distances:
+            result.update({name: analysis[name] for name in ("hausdorff", "hd95", "assd")})
+        result["record"] = analysis_record(
+            analysis, source="batch", patient_id=case["patient_id"], timepoint=timepoint_id(case["moving"]),
+            reference=timepoint_id(case["fixed"]), reference_date=case.get("fixed_date"),
+            date=case.get("moving_date"), preset=preset,
+            seed=result.get("seed") or " ".join(str(v) for v in case["seed"]),
+            lower_factor=result.get("lower_factor", lower_factor),
+            upper_factor=result.get("upper_factor", upper_factor),
+            roi=roi, fast_brain=fast_brain, reference_digest=file_digest(case["fixed"]),
+            digest=file_digest(case["moving"]), code_version=code_version())
+
+        if snapshots:
+            from src.visualization import render_snapshots, render_overlay_mosaic
+            snapshots_dir = os.path.join(patient_dir, "snapshots")
+            render_snapshots(fixed_tumor_mask, registered_tumor_mask, registered_brain_mask, snapshots_dir)
+            render_overlay_mosaic(case["fixed"], fixed_tumor_mask, registered_tumor_mask,
+                                  os.path.join(snapshots_dir, "overlay_mosaic.png"))
+        # Un patient n'est réussi qu'une fois ses fichiers écrits
+        flush_writes()
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    finally:
+        try:
+            flush_writes()
+        except Exception:
+            pass  # Patient déjà en échec : l'erreur d'écriture ne doit pas retomber sur le suivant
+        # Les images d'un patient ne servent plus aux suivants
+        clear_image_cache()
+        disable_profiling()
+    result["seconds"] = round(time.perf_counter() - start, 2)
+    return result
+
+def _remove_marker(running_dir, index):
+    try:
+        os.remove(os.path.join(running_dir, str(index)))
+    except FileNotFoundError:
+        pass
+
+def _process_case(index, running_dir, case, *args):
+    """process_patient, marqué en cours par un fichier `<running_dir>/<index>` retiré à la fin.
+
+    Un processus qui meurt laisse le fichier : run_batch sait quels patients tournaient.
+    """
+    open(os.path.join(running_dir, str(index)), "w").close()
+    result = process_patient(case, *args)
+    _remove_marker(running_dir, index)
+    return result
+
+def write_results(results, results_path):
+    with open(results_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result)
+
+def run_batch(manifest_path, output_dir, workers=None, threads_per_worker=None,
+              preset="exact", lower_factor=0.8, upper_factor=1.2, roi=False, sweep=False, snapshots=False,
+              profile=False, mask_format="nrrd", fast_brain=False, results_store=None, surface_distances=False,
+              image_cache_mb=None):
+    """Traite une cohorte dans un pool de processus (voir process_pool) et agrège les résultats dans un tableau CSV.
+
+    Avec `results_store`, chaque patient réussi est ajouté à l'entrepôt des résultats dès qu'il se termine.
+    Si un processus de travail meurt (erreur native, mémoire), le pool est cassé : seul le patient qu'il
+    traitait est compté en échec (voir _process_case), les patients non terminés sont relancés dans un pool neuf.
+    """
+    cases = load_manifest(manifest_path)
+    os.makedirs(output_dir, exist_ok=True)
+
+    pool, workers, threads_per_worker = process_pool(len(cases), workers, threads_per_worker, image_cache_mb)
+    print(f"Cohorte : {len(cases)} patients, {workers} processus × {threads_per_worker} threads ITK")
+    results = []
+    # Les fichiers des patients suivants sont lus vers le cache du système pendant que les premiers
+    # sont traités ; la fenêtre d'avance est bornée pour ne pas évincer ce qui n'a pas encore servi
+    prefetch_window = 2 * workers
+    for case in cases[:prefetch_window]:
+        prefetch_files([case["fixed"], case["moving"]])
+    running_dir = os.path.join(output_dir, ".running")
+    os.makedirs(running_dir, exist_ok=True)
+    for name in os.listdir(running_dir):
+        os.remove(os.path.join(running_dir, name))  # Marqueurs d'une exécution interrompue
+
+    def _finish(result):
+        print(f"[{len(results) + 1}/{len(cases)}] {result['patient_id']} : {result['status']} {result['error']}")
+        record = result.pop("record", None)
+        if results_store and record is not None and result["status"] == "ok":
+            # Un seul processus écrit dans l'entrepôt
+            from src.results_store import append_records
+            append_records(results_store, [record])
+        results.append(result)
+        if len(results) + prefetch_window <= len(cases):
+            upcoming = cases[len(results) + prefetch_window - 1]
+            prefetch_files([upcoming["fixed"], upcoming["moving"]])
+
+    queue, suspects = list(range(len(cases))), []
+    while queue or suspects:
+        # Après la mort d'un processus, les patients qui tournaient sont relancés seuls, un par un :
+        # celui qui fait encore tomber son processus est le seul compté en échec
+        isolated = bool(suspects)
+        if isolated:
+            batch = [suspects.pop(0)]
+        else:
+            batch, queue = queue, []
+        if pool is None:
+            pool, _, _ = process_pool(len(batch), 1 if isolated else min(workers, len(batch)), threads_per_worker,
+                                      image_cache_mb)
+        lost = []
+        with pool:
+            futures = {
+                pool.submit(_process_case, index, running_dir, cases[index], output_dir, preset, lower_factor,
+                            upper_factor, roi, sweep, snapshots, profile, mask_format, fast_brain,
+                            surface_distances): index
+                for index in batch
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                case = cases[index]
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    lost.append(index)
+                    continue
+                except Exception as e:
+                    result = {"patient_id": case["patient_id"], "status": "error", "error": f"{type(e).__name__}: {e}"}
+                _finish(result)
+        pool = None
+        if lost:
+            started = [index for index in lost if os.path.exists(os.path.join(running_dir, str(index)))]
+            for index in lost:
+                _remove_marker(running_dir, index)
+            if len(started) > 1:
+                failed = []
+                suspects += started
+            else:
+                # Processus mort en traitant ce patient, ou avant tout patient (démarrage du pool) : tous en échec
+                failed = started or lost
+            for index in failed:
+                _finish({"patient_id": cases[index]["patient_id"], "status": "error",
+                         "error": "Processus de travail mort (erreur native ou mémoire)"})
+            queue += [index for index in lost if index not in failed and index not in suspects]
+            print(f"Processus de travail mort : {len(queue) + len(suspects)} patients relancés")
+    os.rmdir(running_dir)
+
+    results.sort(key=lambda result: result["patient_id"])
+    results_path = os.path.join(output_dir, "cohort_results.csv")
+    write_results(results, results_path)
+    print(f"Résultats : {results_path}" + (f", entrepôt : {results_store}" if results_store else ""))
+    return results
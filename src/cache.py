@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), "../Data/.cache")
+DEFAULT_MAX_SIZE_MB = 5000
+DEFAULT_MAX_AGE_DAYS = 30
+
+MANIFEST_NAME = "manifest.json"
+_CHUNK_SIZE = 1 << 20
+
+# Empreintes déjà calculées dans ce processus : (chemin, taille, date de modification) -> sha256
+_digest_memo = {}
+
+def file_digest(path):
+    """Empreinte sha256 du contenu d'un fichier (mémorisée tant que le fichier ne change pas)"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _digest_memo:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+                sha.update(chunk)
+        _digest_memo[memo_key] = sha.hexdigest()
+    return _digest_memo[memo_key]
+
+def code_version():
+    """Empreinte du code source de tous les modules de src/.
+
+    Chaque étape importe, directement ou non, presque tous les modules (configuration, lecture
+    des images, parallélisme...) : tout le dossier compte, plutôt qu'une liste à tenir à jour.
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    names = sorted(name for name in os.listdir(src_dir) if name.endswith(".py"))
+    return hashlib.sha256("".join(
+        f"{name}:{file_digest(os.path.join(src_dir, name))}\n" for name in names
+    ).encode()).hexdigest()
+
+def cache_key(step, input_paths, params):
+    """Clé d'une étape : contenu des entrées, paramètres et version du code"""
+    description = {
+        "step": step,
+        "inputs": [file_digest(path) for path in input_paths],
+        "params": params,
+        "code": code_version(),
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+def cache_lookup(cache_dir, key, output_paths):
+    """Restaure les sorties d'une étape déjà calculée.
+
+    output_paths associe un nom logique au chemin où la sortie est attendue.
+    Retourne False si l'entrée est absente ou incomplète.
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if any(name not in manifest["files"] for name in output_paths):
+        return False
+
+    for name, path in output_paths.items():
+        shutil.copyfile(os.path.join(entry_dir, manifest["files"][name]), path)
+    # La date de modification du manifeste sert d'horodatage LRU pour l'éviction
+    os.utime(manifest_path)
+    return True
+
+def cache_store(cache_dir, key, output_paths, step=None):
+    """Copie les sorties d'une étape dans le cache sous la clé donnée"""
+    entry_dir = os.path.join(cache_dir, key)
+    tmp_dir = f"{entry_dir}.tmp{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    files = {}
+    for name, path in output_paths.items():
+        files[name] = f"{name}{os.path.splitext(path)[1]}"
+        shutil.copyfile(path, os.path.join(tmp_dir, files[name]))
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), "w") as f:
+        json.dump({"step": step, "created": time.time(), "files": files}, f, indent=2)
+
+    # Publication atomique : une entrée visible est toujours complète
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    os.replace(tmp_dir, entry_dir)
+
+def _remove_entry(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def cache_evict(cache_dir, max_size_mb=DEFAULT_MAX_SIZE_MB, max_age_days=DEFAULT_MAX_AGE_DAYS):
+    """Supprime les entrées trop anciennes puis les moins récemment utilisées au-delà de la taille maximale.
+
+    Une entrée est un dossier d'étape (horodaté par son manifeste) ou un fichier isolé, comme les
+    maillages .vtp de src/meshing.py (horodaté par sa propre date de modification, rafraîchie à
+    chaque lecture). Les dossiers sans manifeste (sous-caches, écritures en cours) sont ignorés.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+
+    now = time.time()
+    entries = []
+    for entry in os.scandir(cache_dir):
+        try:
+            if entry.is_dir():
+                last_used = os.path.getmtime(os.path.join(entry.path, MANIFEST_NAME))
+                size = sum(item.stat().st_size for item in os.scandir(entry.path))
+            else:
+                last_used = entry.stat().st_mtime
+                size = entry.stat().st_size
+        except FileNotFoundError:
+            continue
+        if now - last_used > max_age_days * 86400:
+            _remove_entry(entry.path)
+            continue
+        entries.append((last_used, size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size_mb * 1024 * 1024:
+            break
+        _remove_entry(path)
+        total_size -= size
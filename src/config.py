@@ -0,0 +1,64 @@
+import os
+
+# Module sans dépendance lourde (ni ITK, ni VTK, ni matplotlib) : importé au démarrage de main.py
+
+def data_path(data_file):
+    return os.path.join(os.path.dirname(__file__), "../Data/", data_file)
+
+# Préréglages vitesse/précision du recalage.
+# - shrink_factors / smoothing_sigmas : pyramide multi-résolution (sigmas en voxels)
+# - iterations : budget d'itérations de l'optimiseur pour chaque niveau
+# - sampling_strategy / sampling_percentage : échantillonnage de la métrique (NONE, RANDOM, REGULAR)
+# "exact" reproduit le recalage historique (un seul niveau, tous les voxels, 300 itérations) : c'est
+# la référence des tolérances de "fast" et "balanced". "accurate" garde la pyramide de "balanced"
+# sans échantillonnage : sans lissage, "exact" peut s'arrêter dans un minimum local quand le
+# déplacement dépasse quelques millimètres.
+REGISTRATION_PRESETS = {
+    "fast": {
+        "shrink_factors": [4, 2],
+        "smoothing_sigmas": [2, 1],
+        "iterations": [100, 50],
+        "sampling_strategy": "REGULAR",
+        "sampling_percentage": 0.1,
+    },
+    "balanced": {
+        "shrink_factors": [4, 2, 1],
+        "smoothing_sigmas": [2, 1, 0],
+        "iterations": [150, 75, 30],
+        "sampling_strategy": "RANDOM",
+        "sampling_percentage": 0.2,
+    },
+    "exact": {
+        "shrink_factors": [1],
+        "smoothing_sigmas": [0],
+        "iterations": [300],
+        "sampling_strategy": "NONE",
+        "sampling_percentage": 1.0,
+    },
+    "accurate": {
+        "shrink_factors": [4, 2, 1],
+        "smoothing_sigmas": [2, 1, 0],
+        "iterations": [300, 150, 100],
+        "sampling_strategy": "NONE",
+        "sampling_percentage": 1.0,
+    },
+}
+
+# Formats d'enregistrement des masques : NRRD dense, ou boîte englobante codée par plages et
+# compressée (src/mask_store.py)
+MASK_FORMATS = {
+    "nrrd": ".nrrd",
+    "compact": ".mask.npz",
+}
+
+# Budget mémoire par défaut des traitements par tranches (--out-of-core), en Mo
+DEFAULT_MEMORY_BUDGET_MB = 256
+
+# Budget par défaut du cache des images lues ou écrites (src/image_io.py), en Mo : distinct du budget
+# des tranches, il doit contenir des volumes complets (512³ en float : 512 Mo). Variable
+# d'environnement VITK_IMAGE_CACHE_MB, ou option --image-cache
+DEFAULT_IMAGE_CACHE_MB = int(os.environ.get("VITK_IMAGE_CACHE_MB", 2048))
+
+# Cadence visée (images par seconde) du rendu volumique pendant les mouvements de caméra
+# (--interactive-fps, voir src/volume_lod.py)
+DEFAULT_INTERACTIVE_FPS = 15.0
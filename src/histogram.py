@@ -0,0 +1,16 @@
+import numpy as np
+
+# Seuillage d'histogramme en NumPy seul, partagé par la segmentation et le rendu volumique
+# (src/volume_lod.py) : l'importer ne charge ni ITK ni VTK.
+
+def otsu_threshold(counts, centers):
+    """Seuil d'Otsu d'un histogramme : maximise la variance interclasse"""
+    weights = np.cumsum(counts)
+    sums = np.cumsum(counts * centers)
+    total, total_sum = weights[-1], sums[-1]
+    background, foreground = weights[:-1], total - weights[:-1]
+    valid = (background > 0) & (foreground > 0)
+    mean_background = np.where(valid, sums[:-1] / np.maximum(background, 1), 0.0)
+    mean_foreground = np.where(valid, (total_sum - sums[:-1]) / np.maximum(foreground, 1), 0.0)
+    variance = np.where(valid, background * foreground * (mean_background - mean_foreground) ** 2, -1.0)
+    return float(centers[int(np.argmax(variance))])
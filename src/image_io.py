@@ -0,0 +1,262 @@
+import atexit
+import itk
+import locale
+import os
+import queue
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from src.config import DEFAULT_IMAGE_CACHE_MB
+from src.mask_store import is_compact_mask, read_compact_mask, write_compact_mask, nonzero_bounding_box
+from src.profiling import profile_span
+
+# Images déjà chargées ou écrites dans ce processus : (chemin, type de pixel) -> (date de modification,
+# image, octets). Les moins récemment utilisées sont évincées dès que les images gardées dépassent le
+# budget (une image plus grosse que le budget n'est pas gardée) : le processus de travail persistant
+# et le mode cohorte ne gardent pas les volumes des commandes ou des patients précédents
+IMAGE_CACHE_BUDGET_MB = DEFAULT_IMAGE_CACHE_MB
+_image_cache = OrderedDict()
+_cache_lock = threading.RLock()
+
+# Entrées/sorties en arrière-plan. Les lectures et écritures d'ITK gardent le GIL : ce qui se
+# recouvre avec le calcul, ce sont les appels système faits depuis Python (lecture des fichiers
+# vers le cache du système, écriture des NRRD bruts et des masques compacts).
+IO_THREADS = 2
+WRITE_QUEUE_SIZE = 4
+_READ_CHUNK_SIZE = 4 << 20
+_io_pool = None
+_pending_reads = {}
+_write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+_pending_writes = set()
+_write_errors = []
+_writer = None
+
+# La locale est globale au processus : elle passe en 'C' à la première entrée et n'est rétablie
+# qu'à la sortie de la dernière, même si des écritures se chevauchent dans plusieurs threads
+_locale_lock = threading.Lock()
+_locale_users = 0
+_saved_locale = None
+
+@contextmanager
+def force_c_locale():
+    """Force temporairement la locale numérique en 'C' (utile pour ITK) ; utilisable depuis plusieurs threads"""
+    global _locale_users, _saved_locale
+    with _locale_lock:
+        if _locale_users == 0:
+            _saved_locale = locale.setlocale(locale.LC_NUMERIC)
+            locale.setlocale(locale.LC_NUMERIC, "C")
+        _locale_users += 1
+    try:
+        yield
+    finally:
+        with _locale_lock:
+            _locale_users -= 1
+            if _locale_users == 0:
+                locale.setlocale(locale.LC_NUMERIC, _saved_locale)
+
+def _image_cache_key(path, pixel_type):
+    return os.path.abspath(path), None if pixel_type is None else str(pixel_type)
+
+def _image_cache_bytes():
+    # Une image écrite est gardée sous deux clés (voir _remember_written) : comptée une fois
+    return sum({id(entry[1]): entry[2] for entry in _image_cache.values()}.values())
+
+def _evict_images():
+    with _cache_lock:
+        while _image_cache and _image_cache_bytes() > IMAGE_CACHE_BUDGET_MB * 1024 * 1024:
+            _image_cache.popitem(last=False)
+
+def _remember_image(key, image):
+    nbytes = itk.array_view_from_image(image).nbytes
+    with _cache_lock:
+        _image_cache[key] = (os.stat(key[0]).st_mtime_ns, image, nbytes)
+        _image_cache.move_to_end(key)
+        _evict_images()
+
+def set_image_cache_budget(budget_mb):
+    """Fixe le budget du cache des images (Mo) et évince ce qui le dépasse ; retourne l'ancien budget"""
+    global IMAGE_CACHE_BUDGET_MB
+    with _cache_lock:
+        previous, IMAGE_CACHE_BUDGET_MB = IMAGE_CACHE_BUDGET_MB, budget_mb
+        _evict_images()
+    return previous
+
+@contextmanager
+def image_cache_budget(budget_mb):
+    """Budget du cache des images fixé le temps du contexte, puis rétabli (processus de travail persistant)"""
+    previous = set_image_cache_budget(budget_mb)
+    try:
+        yield budget_mb
+    finally:
+        set_image_cache_budget(previous)
+
+def _read_image(path, pixel_type, key):
+    with force_c_locale(), profile_span("imread", path=path):
+        if is_compact_mask(path):
+            loaded = read_compact_mask(path, pixel_type=pixel_type)
+        else:
+            loaded = itk.imread(path, pixel_type) if pixel_type is not None else itk.imread(path)
+    _remember_image(key, loaded)
+    return loaded
+
+def load_image(image, pixel_type=None):
+    """Retourne l'image telle quelle, ou la lit si c'est un chemin.
+
+    Les lectures sont mémorisées (LRU bornée à IMAGE_CACHE_BUDGET_MB, voir set_image_cache_budget)
+    tant que le fichier ne change pas : plusieurs étapes qui ouvrent le même fichier partagent une
+    seule lecture, et une image écrite par safe_itk_write est reprise en mémoire sans relecture. Les masques au format compact
+    (.mask.npz, voir src/mask_store.py) sont décodés en image complète. Une lecture lancée
+    par prefetch_images est attendue plutôt que refaite.
+    """
+    if not isinstance(image, str):
+        return image
+    if os.path.abspath(image) in _pending_writes:
+        flush_writes()
+    key = _image_cache_key(image, pixel_type)
+    with _cache_lock:
+        pending = _pending_reads.pop(key, None)
+    if pending is not None:
+        try:
+            pending.result()
+        except Exception:
+            pass  # Relue ci-dessous : l'erreur éventuelle est levée dans le thread appelant
+    with _cache_lock:
+        cached = _image_cache.get(key)
+        if cached is not None and cached[0] == os.stat(image).st_mtime_ns:
+            _image_cache.move_to_end(key)
+            return cached[1]
+    return _read_image(image, pixel_type, key)
+
+def clear_image_cache():
+    with _cache_lock:
+        _image_cache.clear()
+
+def _pool():
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="vitk-io")
+    return _io_pool
+
+def _warm_file(path):
+    """Lit le fichier vers le cache du système, sans le garder : la lecture ITK qui suit ne touche plus le disque"""
+    buffer = bytearray(_READ_CHUNK_SIZE)
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        while f.readinto(buffer):
+            pass
+
+def prefetch_files(paths):
+    """Précharge des fichiers dans le cache du système en arrière-plan (partagé avec les autres processus)"""
+    return [_pool().submit(_warm_file, path) for path in paths if isinstance(path, str) and os.path.exists(path)]
+
+def prefetch_images(paths, pixel_type=None):
+    """Lit des images en arrière-plan pendant que le calcul continue ; load_image les reprend à la fin.
+
+    Le fichier est d'abord lu vers le cache du système (sans le GIL), puis décodé par ITK.
+    """
+    for path in paths:
+        if not isinstance(path, str) or not os.path.exists(path):
+            continue
+        key = _image_cache_key(path, pixel_type)
+        with _cache_lock:
+            if key in _pending_reads or key in _image_cache:
+                continue
+
+            def read(path=path, key=key):
+                _warm_file(path)
+                return _read_image(path, pixel_type, key)
+
+            _pending_reads[key] = _pool().submit(read)
+
+def _write_now(image, path):
+    from src.out_of_core import can_write_volume, write_volume
+    if is_compact_mask(path):
+        write_compact_mask(image, path, mask_bounding_box(image))
+    elif path.endswith(".nrrd") and can_write_volume(image):
+        write_volume(image, path)
+    else:
+        itk.imwrite(image, path)
+
+def _write_loop():
+    while True:
+        image, path = _write_queue.get()
+        try:
+            with force_c_locale(), profile_span("imwrite_background", path=path):
+                _write_now(image, path)
+            _remember_written(image, path)
+        except Exception as e:
+            _write_errors.append(e)
+        finally:
+            _pending_writes.discard(os.path.abspath(path))
+            _write_queue.task_done()
+
+def _remember_written(image, path):
+    # Relire le fichier, avec ou sans type explicite, redonnerait exactement cette image
+    _remember_image(_image_cache_key(path, itk.template(image)[1][0]), image)
+    _remember_image(_image_cache_key(path, None), image)
+
+def safe_itk_write(image, path, background=False):
+    """Écrit un fichier ITK tout en forçant la locale C (format compact si le chemin finit par .mask.npz).
+
+    background=True met l'écriture dans une file bornée (WRITE_QUEUE_SIZE) traitée par un thread :
+    l'appel ne bloque que si la file est pleine. L'image ne doit plus être modifiée ensuite ;
+    flush_writes attend la fin des écritures (avant de lire les fichiers autrement que par load_image).
+    """
+    global _writer
+    if background:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name="vitk-writer", daemon=True)
+            _writer.start()
+        _pending_writes.add(os.path.abspath(path))
+        _write_queue.put((image, path))
+        return
+    with force_c_locale(), profile_span("imwrite", path=path):
+        if is_compact_mask(path):
+            write_compact_mask(image, path, mask_bounding_box(image))
+        else:
+            itk.imwrite(image, path)
+    _remember_written(image, path)
+
+def flush_writes():
+    """Attend les écritures en arrière-plan ; relève la première erreur survenue"""
+    _write_queue.join()
+    if _write_errors:
+        error = _write_errors[0]
+        _write_errors.clear()
+        raise error
+
+# Une sortie du programme n'abandonne pas les écritures en cours
+atexit.register(flush_writes)
+
+def read_transform(transform_path):
+    """Lit une transformation rigide enregistrée au format ITK (.tfm)"""
+    return itk.transformread(transform_path)[0]
+
+def write_transform(transform, transform_path):
+    itk.transformwrite([transform], transform_path)
+
+def safe_transform_write(transform, path):
+    """Écrit une transformation ITK (.tfm) tout en forçant la locale C"""
+    with force_c_locale():
+        write_transform(transform, path)
+
+def safe_transform_read(path):
+    """Lit une transformation ITK (.tfm) tout en forçant la locale C"""
+    with force_c_locale():
+        return read_transform(path)
+
+def mask_bounding_box(mask):
+    """Boîte englobante (z0, y0, x0, z1, y1, x1) portée par un masque, ou None si inconnue.
+
+    Indices de tableau (bornes hautes exclues) dans la grille de l'image complète.
+    """
+    if "roi_bbox" not in mask.GetMetaDataDictionary().GetKeys():
+        return None
+    return tuple(int(v) for v in mask["roi_bbox"].split())
+
+def set_bounding_box(mask, bbox):
+    mask["roi_bbox"] = " ".join(str(v) for v in bbox)
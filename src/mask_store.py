@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+
+from src.config import MASK_FORMATS
+
+# Format compact des masques (.mask.npz) : seule la boîte englobante des voxels non nuls est
+# enregistrée, codée par plages (valeur, longueur) dans l'ordre du tableau (z, y, x), puis compressée.
+# La géométrie de l'image complète (taille, espacement, origine, direction) et le nombre de voxels
+# non nuls sont stockés à part : np.load ne décompresse un champ qu'à son accès, l'en-tête se lit
+# donc sans décoder le masque. ITK n'est importé que pour convertir depuis ou vers une image ITK.
+COMPACT_MASK_SUFFIX = MASK_FORMATS["compact"]
+_HEADER_FIELDS = ("shape", "bbox", "spacing", "origin", "direction", "count")
+
+def is_compact_mask(path):
+    return isinstance(path, str) and path.endswith(COMPACT_MASK_SUFFIX)
+
+def nonzero_bounding_box(array):
+    """Boîte englobante (z0, y0, x0, z1, y1, x1) des voxels non nuls d'un tableau, ou None"""
+    bounds = []
+    for axis in range(3):
+        other_axes = tuple(a for a in range(3) if a != axis)
+        nonzero = np.flatnonzero(array.any(axis=other_axes))
+        if nonzero.size == 0:
+            return None
+        bounds.append((nonzero[0], nonzero[-1] + 1))
+    return tuple(int(b[0]) for b in bounds) + tuple(int(b[1]) for b in bounds)
+
+def _crop(bbox):
+    return tuple(slice(bbox[a], bbox[a + 3]) for a in range(3))
+
+def _run_length_encode(flat):
+    if flat.size == 0:
+        return np.zeros(0, flat.dtype), np.zeros(0, np.uint32)
+    starts = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1))
+    lengths = np.diff(np.append(starts, flat.size))
+    return flat[starts], lengths.astype(np.uint32 if flat.size < 2 ** 32 else np.uint64)
+
+def write_compact_mask(mask, path, bbox=None):
+    """Enregistre un masque ITK au format compact.
+
+    bbox, si elle est connue (boîte de la ROI de segment_tumor), limite la recherche des voxels non nuls.
+    """
+    import itk
+    array = itk.array_view_from_image(mask)
+    search = (0, 0, 0) + array.shape if bbox is None else bbox
+    tight = nonzero_bounding_box(array[_crop(search)])
+    if tight is None:
+        tight = (0,) * 6
+    else:
+        tight = tuple(tight[a] + search[a % 3] for a in range(6))
+    values, lengths = _run_length_encode(np.ascontiguousarray(array[_crop(tight)]).ravel())
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(
+            f, shape=np.array(array.shape), bbox=np.array(tight), spacing=np.array(mask.GetSpacing()),
+            origin=np.array(mask.GetOrigin()), direction=itk.array_from_matrix(mask.GetDirection()),
+            count=np.array(int(lengths[values != 0].sum())), dtype=np.array(array.dtype.str),
+            values=values, lengths=lengths,
+        )
+    os.replace(tmp_path, path)
+
+def open_compact_mask(path):
+    """En-tête d'un masque compact (géométrie, boîte englobante, nombre de voxels), sans décoder le masque"""
+    with np.load(path) as data:
+        header = {name: data[name] for name in _HEADER_FIELDS}
+    return {
+        "path": path,
+        "shape": tuple(int(v) for v in header["shape"]),
+        "bbox": tuple(int(v) for v in header["bbox"]),
+        "spacing": tuple(float(v) for v in header["spacing"]),
+        "origin": tuple(float(v) for v in header["origin"]),
+        "direction": header["direction"],
+        "count": int(header["count"]),
+    }
+
+def compact_mask_count(mask):
+    """Nombre de voxels non nuls, lu dans l'en-tête"""
+    if isinstance(mask, str):
+        mask = open_compact_mask(mask)
+    return mask["count"]
+
+def compact_mask_roi(mask, bbox=None):
+    """Tableau (z, y, x) du masque dans la boîte `bbox` (par défaut l'image complète).
+
+    Seule la boîte enregistrée est décodée ; le reste de `bbox` est nul.
+    """
+    if isinstance(mask, str):
+        mask = open_compact_mask(mask)
+    with np.load(mask["path"]) as data:
+        values, lengths, dtype = data["values"], data["lengths"], np.dtype(str(data["dtype"]))
+    bbox = (0, 0, 0) + mask["shape"] if bbox is None else tuple(bbox)
+    roi = np.zeros(tuple(bbox[a + 3] - bbox[a] for a in range(3)), dtype)
+
+    stored = mask["bbox"]
+    low = [max(stored[a], bbox[a]) for a in range(3)]
+    high = [min(stored[a + 3], bbox[a + 3]) for a in range(3)]
+    if values.size and all(low[a] < high[a] for a in range(3)):
+        crop = np.repeat(values, lengths).reshape(tuple(stored[a + 3] - stored[a] for a in range(3)))
+        roi[tuple(slice(low[a] - bbox[a], high[a] - bbox[a]) for a in range(3))] = \
+            crop[tuple(slice(low[a] - stored[a], high[a] - stored[a]) for a in range(3))]
+    return roi
+
+def _numpy_dtype(pixel_type):
+    import itk
+    dtypes = {itk.UC: np.uint8, itk.US: np.uint16, itk.UI: np.uint32, itk.F: np.float32, itk.D: np.float64}
+    if pixel_type not in dtypes:
+        raise ValueError(f"Type de pixel non géré pour un masque compact : {pixel_type}")
+    return dtypes[pixel_type]
+
+def read_compact_mask(path, bbox=None, pixel_type=None):
+    """Image ITK d'un masque compact : complète, ou seulement la boîte `bbox` (origine ajustée).
+
+    L'image complète porte sa boîte englobante (set_bounding_box) : analyse et maillage ne
+    parcourent que cette boîte.
+    """
+    import itk
+    mask = open_compact_mask(path)
+    array = compact_mask_roi(mask, bbox)
+    if pixel_type is not None:
+        array = array.astype(_numpy_dtype(pixel_type), copy=False)
+    image = itk.image_from_array(array)
+    image.SetSpacing(mask["spacing"])
+    image.SetDirection(itk.matrix_from_array(np.ascontiguousarray(mask["direction"], dtype=np.float64)))
+    if bbox is None:
+        image.SetOrigin(mask["origin"])
+        if mask["count"]:
+            image["roi_bbox"] = " ".join(str(v) for v in mask["bbox"])
+    else:
+        # Origine de la boîte : coin (x0, y0, z0) de l'image complète en coordonnées physiques
+        start = np.array([bbox[2], bbox[1], bbox[0]], dtype=np.float64) * np.array(mask["spacing"])
+        image.SetOrigin((np.array(mask["origin"]) + mask["direction"] @ start).tolist())
+    return image
@@ -0,0 +1,128 @@
+import hashlib
+import os
+
+import itk
+import vtk
+import numpy as np
+
+from src.cache import cache_evict
+from src.image_io import load_image, mask_bounding_box, nonzero_bounding_box
+from src.profiling import profile_span
+
+DEFAULT_MESH_CACHE_DIR = os.path.join(os.path.dirname(__file__), "../Data/.cache/meshes")
+
+def _cropped_vtk_image(mask, label):
+    """Masque binaire recadré sur sa boîte englobante (+1 voxel de bord), en vtkImageData.
+
+    Le bord de zéros ferme la surface ; l'origine est décalée pour rester dans l'espace physique
+    du masque complet. Retourne (image VTK, tableau recadré) ou (None, None) si le masque est vide.
+    """
+    array = itk.array_view_from_image(mask)
+    bbox = mask_bounding_box(mask) or nonzero_bounding_box(array == label)
+    if bbox is None:
+        return None, None
+
+    crop = tuple(slice(bbox[a], bbox[a + 3]) for a in range(3))
+    cropped = np.pad((array[crop] == label).astype(np.uint8), 1)
+
+    index = itk.Index[3]()
+    for axis in range(3):
+        index[axis] = int(bbox[2 - axis]) - 1
+    cropped_image = itk.image_from_array(cropped)
+    cropped_image.SetOrigin(mask.TransformIndexToPhysicalPoint(index))
+    cropped_image.SetSpacing(mask.GetSpacing())
+    cropped_image.SetDirection(mask.GetDirection())
+    return itk.vtk_image_from_image(cropped_image), cropped
+
+def _mesh_key(cropped, vtk_image, direction, target_triangles, smoothing_iterations):
+    sha = hashlib.sha256(cropped.tobytes())
+    sha.update(repr((cropped.shape, vtk_image.GetOrigin(), vtk_image.GetSpacing(), direction,
+                     target_triangles, smoothing_iterations)).encode())
+    return sha.hexdigest()
+
+def extract_surface(mask, label=1, target_triangles=None, smoothing_iterations=0,
+                    cache_dir=DEFAULT_MESH_CACHE_DIR):
+    """Surface d'un masque (chemin ou image ITK) sous forme de vtkPolyData.
+
+    Contourage discret (vtkDiscreteFlyingEdges3D) limité à la boîte englobante du label,
+    lissage optionnel, puis décimation jusqu'à environ `target_triangles` triangles.
+    Le résultat est mis en cache en .vtp, indexé par le contenu et la géométrie (origine, espacement,
+    direction) du masque et par les paramètres : les lancements suivants sur le même masque ne
+    recalculent rien. Le cache est borné comme celui des étapes (cache_evict, après chaque ajout).
+    cache_dir=None désactive le cache.
+    """
+    mask = load_image(mask, itk.UC)
+    vtk_image, cropped = _cropped_vtk_image(mask, label)
+    if vtk_image is None:
+        return vtk.vtkPolyData()
+
+    cache_path = None
+    if cache_dir is not None:
+        direction = tuple(itk.array_from_matrix(mask.GetDirection()).ravel().tolist())
+        key = _mesh_key(cropped, vtk_image, direction, target_triangles, smoothing_iterations)
+        cache_path = os.path.join(cache_dir, f"{key}.vtp")
+        if os.path.exists(cache_path):
+            # Horodatage LRU pour cache_evict
+            os.utime(cache_path)
+            reader = vtk.vtkXMLPolyDataReader()
+            reader.SetFileName(cache_path)
+            reader.Update()
+            return reader.GetOutput()
+
+    contour = vtk.vtkDiscreteFlyingEdges3D()
+    contour.SetInputData(vtk_image)
+    contour.SetValue(0, 1)
+    contour.ComputeNormalsOff()
+    contour.ComputeGradientsOff()
+    with profile_span("flying_edges", label=label):
+        contour.Update()
+    surface = contour.GetOutput()
+
+    if smoothing_iterations > 0:
+        smoother = vtk.vtkWindowedSincPolyDataFilter()
+        smoother.SetInputData(surface)
+        smoother.SetNumberOfIterations(smoothing_iterations)
+        smoother.SetPassBand(0.1)
+        smoother.NormalizeCoordinatesOn()
+        with profile_span("smoothing", iterations=smoothing_iterations):
+            smoother.Update()
+        surface = smoother.GetOutput()
+
+    triangles = surface.GetNumberOfPolys()
+    if target_triangles is not None and triangles > target_triangles:
+        # vtkDecimatePro : nettement plus rapide que vtkQuadricDecimation sur les surfaces en marches d'escalier
+        decimate = vtk.vtkDecimatePro()
+        decimate.SetInputData(surface)
+        decimate.SetTargetReduction(1.0 - target_triangles / triangles)
+        decimate.PreserveTopologyOff()
+        with profile_span("decimation", triangles=triangles, target_triangles=target_triangles):
+            decimate.Update()
+        surface = decimate.GetOutput()
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Publication atomique : un fichier visible est toujours complet
+        tmp_path = f"{cache_path}.tmp{os.getpid()}"
+        writer = vtk.vtkXMLPolyDataWriter()
+        writer.SetFileName(tmp_path)
+        writer.SetInputData(surface)
+        writer.SetDataModeToBinary()
+        writer.Write()
+        os.replace(tmp_path, cache_path)
+        cache_evict(cache_dir)
+    return surface
+
+def surface_actor(mask, color, opacity, target_triangles=None, smoothing_iterations=0,
+                  cache_dir=DEFAULT_MESH_CACHE_DIR):
+    surface = extract_surface(mask, target_triangles=target_triangles,
+                              smoothing_iterations=smoothing_iterations, cache_dir=cache_dir)
+
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputData(surface)
+    mapper.ScalarVisibilityOff()
+
+    actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+    actor.GetProperty().SetColor(*color)
+    actor.GetProperty().SetOpacity(opacity)
+    return actor
@@ -0,0 +1,291 @@
+import mmap
+import os
+import re
+
+from contextlib import contextmanager
+
+import numpy as np
+
+from src.config import DEFAULT_MEMORY_BUDGET_MB
+from src.profiling import profile_span
+
+# Traitement hors mémoire des grands volumes (--out-of-core). Les volumes NRRD non compressés sont
+# projetés en mémoire (mmap) plutôt que lus : seules les coupes parcourues sont chargées, et
+# release_pages rend au système les pages déjà lues. Les réductions et le rééchantillonnage
+# travaillent par tranches de coupes dont la taille découle du budget mémoire. ITK n'est importé
+# que par les fonctions qui construisent des images : open_volume n'en dépend pas (--step analyze).
+_NRRD_TYPES = {
+    "signed char": "i1", "int8": "i1", "uchar": "u1", "unsigned char": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "unsigned short": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "unsigned int": "u4", "uint32": "u4",
+    "float": "f4", "double": "f8",
+}
+_NRRD_NAMES = {"i1": "signed char", "u1": "unsigned char", "i2": "short", "u2": "unsigned short",
+               "i4": "int", "u4": "unsigned int", "f4": "float", "f8": "double"}
+
+def _read_nrrd_header(path):
+    with open(path, "rb") as f:
+        header = b""
+        while b"\n\n" not in header:
+            chunk = f.read(4096)
+            if not chunk:
+                raise ValueError(f"En-tête NRRD incomplet : {path}")
+            header += chunk
+    text, _, _ = header.partition(b"\n\n")
+    lines = text.decode("latin-1").split("\n")
+    if not lines[0].startswith("NRRD"):
+        raise ValueError(f"Pas un fichier NRRD : {path}")
+
+    fields, metadata = {}, {}
+    for line in lines[1:]:
+        if line.startswith("#") or not line.strip():
+            continue
+        if ":=" in line:
+            key, value = line.split(":=", 1)
+            metadata[key.strip()] = value.strip()
+        else:
+            key, value = line.split(":", 1)
+            fields[key.strip()] = value.strip()
+    return fields, metadata, len(text) + 2
+
+def _vectors(text):
+    return [np.array([float(v) for v in group.split(",")]) for group in re.findall(r"\(([^)]*)\)", text)]
+
+def is_raw_volume(path):
+    """Vrai si open_volume peut projeter le fichier : NRRD 3D brut, non compressé, de type connu"""
+    if not path.lower().endswith((".nrrd", ".nhdr")):
+        return False
+    try:
+        fields, _, _ = _read_nrrd_header(path)
+    except (OSError, ValueError):
+        return False
+    return (fields.get("dimension") == "3" and fields.get("encoding") == "raw"
+            and fields.get("type") in _NRRD_TYPES)
+
+def open_volume(path):
+    """Volume NRRD non compressé projeté en mémoire, sans lecture.
+
+    Retourne un dictionnaire : "array" (tableau (z, y, x) en lecture seule, adossé au fichier),
+    "spacing", "origin" (x, y, z), "direction" (matrice 3×3) et "metadata" (champs clé:=valeur,
+    par exemple roi_bbox). Lève ValueError si le fichier est compressé : il faut alors le
+    réécrire sans compression (itk.imwrite par défaut, ou write_volume).
+    """
+    fields, metadata, header_size = _read_nrrd_header(path)
+    if int(fields.get("dimension", 0)) != 3:
+        raise ValueError(f"Volume 3D attendu : {path}")
+    if fields.get("encoding") != "raw":
+        raise ValueError(f"Encodage NRRD '{fields.get('encoding')}' : le mode hors mémoire demande des données "
+                         f"brutes non compressées ({path})")
+    if fields["type"] not in _NRRD_TYPES:
+        raise ValueError(f"Type NRRD non géré : {fields['type']}")
+    dtype = np.dtype(("<" if fields.get("endian", "little") == "little" else ">") + _NRRD_TYPES[fields["type"]])
+
+    data_path, offset = path, header_size
+    if "data file" in fields or "datafile" in fields:
+        data_path = os.path.join(os.path.dirname(path), fields.get("data file", fields.get("datafile")))
+        offset = int(fields.get("byte skip", 0))
+    elif int(fields.get("byte skip", 0)):
+        offset += int(fields["byte skip"])
+
+    size = [int(v) for v in fields["sizes"].split()]
+    directions = np.array(_vectors(fields["space directions"])).T if "space directions" in fields else np.eye(3)
+    origin = _vectors(fields["space origin"])[0] if "space origin" in fields else np.zeros(3)
+    if fields.get("space", "left-posterior-superior") in ("right-anterior-superior", "RAS"):
+        # Même conversion vers LPS que NrrdImageIO
+        directions[:2] *= -1
+        origin[:2] *= -1
+    spacing = np.linalg.norm(directions, axis=0)
+
+    with open(data_path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    array = np.frombuffer(mapping, dtype, count=int(np.prod(size)), offset=offset).reshape(size[::-1])
+    return {
+        "path": path, "array": array, "mmap": mapping, "shape": array.shape, "dtype": dtype,
+        "spacing": tuple(float(v) for v in spacing), "origin": tuple(float(v) for v in origin),
+        "direction": directions / spacing, "metadata": metadata,
+    }
+
+def release_pages(volume):
+    """Rend au système les pages déjà lues du volume (elles seront relues du fichier si besoin)"""
+    if hasattr(mmap, "MADV_DONTNEED"):
+        volume["mmap"].madvise(mmap.MADV_DONTNEED)
+
+def volume_image(volume, start=0, stop=None):
+    """Image ITK des coupes [start, stop) du volume.
+
+    Le volume complet est une vue sur la projection mémoire, sans copie ; une tranche est copiée
+    (et ses pages rendues au système) avec l'origine correspondant à sa première coupe.
+    """
+    import itk
+    if start == 0 and stop is None:
+        image = itk.image_view_from_array(volume["array"])
+    else:
+        image = itk.image_from_array(np.ascontiguousarray(volume["array"][start:stop]))
+        release_pages(volume)
+    image.SetSpacing(volume["spacing"])
+    image.SetDirection(itk.matrix_from_array(np.ascontiguousarray(volume["direction"])))
+    image.SetOrigin(slice_origin(volume, start).tolist())
+    return image
+
+def slice_origin(volume, index):
+    """Point physique (x, y, z) du premier voxel de la coupe `index`"""
+    return np.array(volume["origin"]) + volume["direction"] @ (np.array(volume["spacing"]) * [0.0, 0.0, index])
+
+def slab_slices(shape, bytes_per_voxel, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """Nombre de coupes par tranche pour que `bytes_per_voxel` octets par voxel tiennent dans le budget"""
+    slice_bytes = shape[1] * shape[2] * bytes_per_voxel
+    return max(1, min(shape[0], int(memory_budget_mb * 2 ** 20 // slice_bytes)))
+
+@contextmanager
+def volume_writer(path, shape, dtype, spacing, origin, direction, metadata=None):
+    """Écrit un volume NRRD brut tranche par tranche : `write(tranche)` ajoute des coupes (z, y, x).
+
+    Le fichier n'apparaît à `path` qu'une fois toutes les coupes écrites.
+    """
+    dtype = np.dtype(dtype).newbyteorder("<")
+    directions = np.asarray(direction) * np.asarray(spacing)
+    vector = lambda v: "(" + ",".join(f"{float(c):.17g}" for c in v) + ")"
+    lines = [
+        "NRRD0004",
+        f"type: {_NRRD_NAMES[dtype.kind + str(dtype.itemsize)]}",
+        "dimension: 3",
+        "space: left-posterior-superior",
+        f"sizes: {shape[2]} {shape[1]} {shape[0]}",
+        "space directions: " + " ".join(vector(directions[:, a]) for a in range(3)),
+        "kinds: domain domain domain",
+        "endian: little",
+        "encoding: raw",
+        f"space origin: {vector(origin)}",
+    ] + [f"{key}:={value}" for key, value in (metadata or {}).items()]
+
+    written = [0]
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(("\n".join(lines) + "\n\n").encode("latin-1"))
+
+            def write(slab):
+                f.write(np.ascontiguousarray(slab, dtype=dtype).tobytes())
+                written[0] += slab.shape[0]
+
+            yield write
+        if written[0] != shape[0]:
+            raise ValueError(f"{written[0]} coupes écrites sur {shape[0]} : {path}")
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+def can_write_volume(image):
+    """Vrai si write_volume sait écrire l'image (3D, une composante, type NRRD connu)"""
+    import itk
+    if image.GetImageDimension() != 3 or image.GetNumberOfComponentsPerPixel() != 1:
+        return False
+    dtype = itk.array_view_from_image(image).dtype
+    return dtype.kind + str(dtype.itemsize) in _NRRD_NAMES
+
+def write_volume(image, path):
+    """Écrit une image ITK en NRRD brut non compressé, lisible par open_volume et par ITK.
+
+    Comme NrrdImageIO, les métadonnées texte (hors champs NRRD_) sont écrites en clé:=valeur.
+    L'écriture se fait depuis Python : elle ne garde pas le GIL pendant les appels système.
+    """
+    import itk
+    array = itk.array_view_from_image(image)
+    metadata = {}
+    for key in image.GetMetaDataDictionary().GetKeys():
+        value = image[key] if not key.startswith("NRRD_") else None
+        if isinstance(value, str):
+            metadata[key] = value
+    with volume_writer(path, array.shape, array.dtype, image.GetSpacing(), image.GetOrigin(),
+                       itk.array_from_matrix(image.GetDirection()), metadata) as write:
+        write(array)
+
+def _moving_slice_range(reference, moving, transform, start, stop):
+    """Coupes du volume mobile nécessaires pour rééchantillonner les coupes [start, stop) de la référence.
+
+    Pour une transformation rigide, l'image d'une boîte est dans l'enveloppe de ses coins ; une coupe de
+    marge de chaque côté couvre les voisins de l'interpolation linéaire.
+    """
+    nz, ny, nx = reference["shape"]
+    to_moving = np.linalg.inv(moving["direction"] * np.array(moving["spacing"]))
+    z_indices = []
+    for x in (0, nx - 1):
+        for y in (0, ny - 1):
+            for z in (start, stop - 1):
+                point = np.array(reference["origin"]) + reference["direction"] @ (np.array(reference["spacing"]) * [x, y, z])
+                moved = np.array(transform.TransformPoint(point.tolist()))
+                z_indices.append((to_moving @ (moved - np.array(moving["origin"])))[2])
+    first = max(0, int(np.floor(min(z_indices))) - 1)
+    last = min(moving["shape"][0], int(np.ceil(max(z_indices))) + 2)
+    return first, last
+
+def _resample_slab(moving_slab, transform, reference, start, stop, default_value, interpolation):
+    import itk
+    ImageType = type(moving_slab)
+    resampler = itk.ResampleImageFilter[ImageType, ImageType].New()
+    resampler.SetTransform(transform)
+    resampler.SetInput(moving_slab)
+    resampler.SetOutputSpacing(reference["spacing"])
+    resampler.SetOutputDirection(itk.matrix_from_array(np.ascontiguousarray(reference["direction"])))
+    resampler.SetOutputOrigin(slice_origin(reference, start).tolist())
+    resampler.SetSize([reference["shape"][2], reference["shape"][1], stop - start])
+    resampler.SetDefaultPixelValue(default_value)
+    if interpolation == "nearest":
+        resampler.SetInterpolator(itk.NearestNeighborInterpolateImageFunction[ImageType, itk.D].New())
+    else:
+        resampler.SetInterpolator(itk.LinearInterpolateImageFunction[ImageType, itk.D].New())
+    resampler.Update()
+    return itk.array_from_image(resampler.GetOutput())
+
+def resample_out_of_core(moving_path, transform, reference_path, output_path, default_value=0,
+                         interpolation="linear", memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """resample_image par tranches, de fichier à fichier, sans charger les volumes complets.
+
+    Seule la géométrie de la référence est lue. Pour chaque tranche de sortie, seules les coupes
+    du volume mobile dont elle dépend sont copiées dans une image ITK ; le résultat est ajouté au
+    fichier de sortie (NRRD brut) au fur et à mesure.
+    """
+    moving = open_volume(moving_path)
+    reference = open_volume(reference_path)
+    # Tranche de sortie, coupes mobiles correspondantes (un peu plus, selon la rotation) et copies ITK
+    slices = slab_slices(reference["shape"], 4 * moving["dtype"].itemsize, memory_budget_mb)
+
+    with profile_span("resample_out_of_core", slices=slices), \
+            volume_writer(output_path, reference["shape"], moving["dtype"], reference["spacing"],
+                          reference["origin"], reference["direction"]) as write:
+        for start in range(0, reference["shape"][0], slices):
+            stop = min(start + slices, reference["shape"][0])
+            first, last = _moving_slice_range(reference, moving, transform, start, stop)
+            if first >= last:
+                write(np.full((stop - start,) + reference["shape"][1:], default_value, moving["dtype"]))
+                continue
+            write(_resample_slab(volume_image(moving, first, last), transform, reference, start, stop,
+                                 default_value, interpolation))
+    return output_path
+
+def float_volume_image(path):
+    """Image ITK float d'un volume : vue sur sa projection mémoire s'il est stocké en float, sinon lecture"""
+    import itk
+    volume = open_volume(path)
+    if volume["dtype"] == np.dtype("<f4"):
+        return volume_image(volume)
+    from src.image_io import load_image
+    return load_image(path, itk.F)
+
+def register_out_of_core(fixed_path, moving_path, output_path, preset="exact", initial_transform=None,
+                         memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """register_images en mode hors mémoire ; retourne la transformation.
+
+    ITK voit les deux volumes à travers leur projection mémoire, sans copie. L'optimisation parcourt
+    toujours les volumes entiers, mais l'image recalée est produite par tranches et écrite
+    directement dans `output_path` (NRRD brut).
+    """
+    from src.registration import estimate_rigid_transform
+    fixed_image = float_volume_image(fixed_path)
+    moving_image = float_volume_image(moving_path)
+    transform = estimate_rigid_transform(fixed_image, moving_image, preset, initial_transform)
+    del fixed_image, moving_image
+    resample_out_of_core(moving_path, transform, fixed_path, output_path, memory_budget_mb=memory_budget_mb)
+    return transform
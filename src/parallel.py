@@ -0,0 +1,70 @@
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Répartition des threads ITK entre segmentations simultanées (--threads). Les filtres ITK
+# partagent un pool de threads de la taille du nombre de threads global ; chaque filtre découpe
+# son travail en « unités de travail » (work units) traitées par ce pool. Des tâches lancées en
+# parallèle depuis des threads Python (Update relâche le GIL) reçoivent chacune une part des
+# unités : le pool reste occupé sans que chaque filtre réclame tous les cœurs pour lui seul.
+_local = threading.local()
+
+def configure_threads(threads=None):
+    """Fixe le nombre de threads ITK du processus (défaut : nombre de cœurs) ; retourne ce nombre"""
+    threads = max(1, threads or os.cpu_count() or 1)
+    # Sans passer par os.environ : les processus lancés ensuite gardent leur propre réglage
+    import itk
+    itk.MultiThreaderBase.SetGlobalDefaultNumberOfThreads(threads)
+    return threads
+
+def configured_threads():
+    import itk
+    return itk.MultiThreaderBase.GetGlobalDefaultNumberOfThreads()
+
+@contextmanager
+def itk_threads(threads):
+    """Nombre de threads ITK fixé le temps du contexte, puis rétabli (processus de travail persistant)"""
+    previous = configured_threads()
+    configure_threads(threads)
+    try:
+        yield threads
+    finally:
+        configure_threads(previous)
+
+def split_threads(threads, jobs):
+    """Unités de travail par tâche pour `jobs` tâches simultanées sur `threads` threads"""
+    return max(1, threads // max(1, jobs))
+
+@contextmanager
+def work_units(units):
+    """Les filtres créés dans ce contexte (thread courant) utilisent `units` unités de travail"""
+    previous = getattr(_local, "units", None)
+    _local.units = units
+    try:
+        yield
+    finally:
+        _local.units = previous
+
+def apply_work_units(itk_filter):
+    """Applique au filtre les unités de travail du contexte courant (work_units) ; retourne le filtre"""
+    units = getattr(_local, "units", None)
+    if units is not None:
+        itk_filter.SetNumberOfWorkUnits(units)
+    return itk_filter
+
+def _run_job(units, function, args, kwargs):
+    with work_units(units):
+        return function(*args, **kwargs)
+
+def job_pool(jobs, threads=None):
+    """Pool de threads pour `jobs` tâches ITK simultanées.
+
+    Retourne (pool, unités de travail par tâche) ; soumettre les tâches avec submit_job.
+    """
+    threads = threads or configured_threads()
+    return ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="vitk-job"), split_threads(threads, jobs)
+
+def submit_job(pool, units, function, *args, **kwargs):
+    return pool.submit(_run_job, units, function, args, kwargs)
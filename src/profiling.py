@@ -0,0 +1,207 @@
+import json
+import os
+import resource
+import threading
+import time
+
+from contextlib import contextmanager, nullcontext
+
+# Instrumentation des étapes (--profile). Désactivée, chaque point de mesure se réduit à un test
+# sur `_profiler` : profile_span retourne un contexte vide partagé et profile_filter ne touche pas au filtre.
+# Activée, chaque intervalle mesuré écrit une ligne JSON (durée, temps CPU du processus, mémoire
+# résidente au début, à la fin et pic pendant l'intervalle) ; les itérations de l'optimiseur du
+# recalage sont écrites au fil de l'eau. Une trace au format Chrome (chrome://tracing, Perfetto)
+# peut être produite en plus.
+_profiler = None
+_NULL_CONTEXT = nullcontext()
+
+def reset_peak_rss():
+    """Remet à zéro le pic de mémoire résidente du processus (Linux) ; False si ce n'est pas possible"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def memory_mb(field):
+    """Champ mémoire de /proc/self/status en Mo (VmRSS : courante, VmHWM : pic)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    if field == "VmHWM":
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return float("nan")
+
+class _Profiler:
+    def __init__(self, path, chrome_trace_path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.chrome_trace_path = chrome_trace_path
+        self.file = open(path, "w")
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.origin = time.perf_counter()
+        self.open_spans = []
+        self.chrome_events = []
+        self.totals = {}
+        self.pid = os.getpid()
+
+    def _stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def _observe_peak(self):
+        # Pic du processus depuis la dernière remise à zéro, reporté sur tous les intervalles ouverts
+        peak = memory_mb("VmHWM")
+        for span in self.open_spans:
+            span["peak_rss_mb"] = max(span["peak_rss_mb"], peak)
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, default=str) + "\n")
+
+    def begin(self, name, attrs):
+        stack = self._stack()
+        span = {
+            "name": name, "attrs": attrs, "parent": stack[-1]["name"] if stack else None, "depth": len(stack),
+            "tid": threading.get_ident(), "wall_start": time.perf_counter(), "cpu_start": time.process_time(),
+            "rss_start_mb": memory_mb("VmRSS"), "peak_rss_mb": 0.0,
+        }
+        with self.lock:
+            self._observe_peak()
+            reset_peak_rss()
+            span["peak_rss_mb"] = memory_mb("VmHWM")
+            self.open_spans.append(span)
+        stack.append(span)
+        return span
+
+    def end(self, span):
+        wall = time.perf_counter() - span["wall_start"]
+        cpu = time.process_time() - span["cpu_start"]
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+        record = {
+            "type": "span", "name": span["name"], "parent": span["parent"], "depth": span["depth"],
+            "start_s": round(span["wall_start"] - self.origin, 6), "wall_s": round(wall, 6), "cpu_s": round(cpu, 6),
+            "rss_start_mb": round(span["rss_start_mb"], 1), "rss_end_mb": round(memory_mb("VmRSS"), 1),
+            "pid": self.pid, "tid": span["tid"], **span["attrs"],
+        }
+        with self.lock:
+            self._observe_peak()
+            self.open_spans.remove(span)
+            record["peak_rss_mb"] = round(span["peak_rss_mb"], 1)
+            self._write(record)
+            total = self.totals.setdefault(span["name"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0})
+            total["count"] += 1
+            total["wall_s"] += wall
+            total["cpu_s"] += cpu
+            total["peak_rss_mb"] = max(total["peak_rss_mb"], record["peak_rss_mb"])
+            if self.chrome_trace_path:
+                self.chrome_events.append({
+                    "name": span["name"], "ph": "X", "pid": self.pid, "tid": span["tid"],
+                    "ts": record["start_s"] * 1e6, "dur": wall * 1e6,
+                    "args": {key: value for key, value in record.items() if key not in ("type", "name", "pid", "tid")},
+                })
+
+    def event(self, name, values):
+        now = time.perf_counter() - self.origin
+        with self.lock:
+            self._write({"type": "event", "name": name, "time_s": round(now, 6), "pid": self.pid, **values})
+            if self.chrome_trace_path:
+                numeric = {key: value for key, value in values.items() if isinstance(value, (int, float))}
+                self.chrome_events.append({"name": name, "ph": "C", "pid": self.pid, "ts": now * 1e6, "args": numeric})
+
+    def close(self):
+        self.file.close()
+        if self.chrome_trace_path:
+            with open(self.chrome_trace_path, "w") as f:
+                json.dump({"traceEvents": self.chrome_events, "displayTimeUnit": "ms"}, f)
+        return self.totals
+
+def enable_profiling(path, chrome_trace_path=None):
+    """Active l'instrumentation : lignes JSON dans `path`, trace Chrome optionnelle à la désactivation"""
+    global _profiler
+    if _profiler is not None:
+        disable_profiling()
+    _profiler = _Profiler(path, chrome_trace_path)
+
+def disable_profiling():
+    """Termine l'instrumentation ; retourne les totaux par nom d'intervalle"""
+    global _profiler
+    if _profiler is None:
+        return {}
+    profiler, _profiler = _profiler, None
+    return profiler.close()
+
+def profiling_enabled():
+    return _profiler is not None
+
+@contextmanager
+def _span(name, attrs):
+    span = _profiler.begin(name, attrs)
+    try:
+        yield
+    finally:
+        if _profiler is not None:
+            _profiler.end(span)
+
+def profile_span(name, **attrs):
+    """Contexte mesurant un intervalle (durée, CPU, mémoire) ; sans effet si le profilage est désactivé"""
+    if _profiler is None:
+        return _NULL_CONTEXT
+    return _span(name, attrs)
+
+def profile_event(name, **values):
+    if _profiler is not None:
+        _profiler.event(name, values)
+
+def profile_filter(itk_filter, name=None):
+    """Mesure l'exécution d'un filtre ITK (entre ses événements Start et End) ; retourne le filtre"""
+    if _profiler is None:
+        return itk_filter
+    import itk
+    name = name or itk_filter.GetNameOfClass()
+    spans = []
+
+    def on_start():
+        if _profiler is not None:
+            spans.append(_profiler.begin(name, {"itk_filter": True}))
+
+    def on_end():
+        if _profiler is not None and spans:
+            _profiler.end(spans.pop())
+
+    itk_filter.AddObserver(itk.StartEvent(), on_start)
+    itk_filter.AddObserver(itk.EndEvent(), on_end)
+    return itk_filter
+
+def profile_registration(registration, optimizer):
+    """Trace de convergence du recalage : niveau, itération, valeur de la métrique et pas de l'optimiseur"""
+    if _profiler is None:
+        return
+    import itk
+
+    def on_iteration():
+        profile_event("registration_iteration", level=int(registration.GetCurrentLevel()),
+                      iteration=int(optimizer.GetCurrentIteration()), metric=float(optimizer.GetValue()),
+                      step_length=float(optimizer.GetCurrentStepLength()))
+
+    def on_level():
+        profile_event("registration_level", level=int(registration.GetCurrentLevel()))
+
+    optimizer.AddObserver(itk.IterationEvent(), on_iteration)
+    registration.AddObserver(itk.MultiResolutionIterationEvent(), on_level)
+
+def print_profile_summary(totals, limit=15):
+    """Intervalles les plus longs (durées inclusives : un intervalle compte aussi ses sous-intervalles)"""
+    if not totals:
+        return
+    print(f"{'Intervalle':40s} {'appels':>6s} {'durée (s)':>10s} {'CPU (s)':>10s} {'pic (Mo)':>10s}")
+    for name, total in sorted(totals.items(), key=lambda item: -item[1]["wall_s"])[:limit]:
+        print(f"{name:40s} {total['count']:6d} {total['wall_s']:10.3f} {total['cpu_s']:10.3f} {total['peak_rss_mb']:10.1f}")
@@ -1,81 +1,181 @@
 import itk
-import os
 import numpy as np
 
-def data_path(data_file):
-    return os.path.join(os.path.dirname(__file__), "../Data/", data_file)
+from src.config import data_path, REGISTRATION_PRESETS
+from src.image_io import load_image, read_transform, prefetch_images
+from src.profiling import profile_span, profile_event, profile_filter, profile_registration
+
+def registration_settings(preset="exact", **overrides):
+    """Retourne les paramètres du préréglage, éventuellement surchargés (valeurs None ignorées)"""
+    if preset not in REGISTRATION_PRESETS:
+        raise ValueError(f"Préréglage de recalage inconnu : {preset} (choix : {', '.join(REGISTRATION_PRESETS)})")
+    settings = dict(REGISTRATION_PRESETS[preset])
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+
+    levels = len(settings["shrink_factors"])
+    if len(settings["smoothing_sigmas"]) != levels or len(settings["iterations"]) != levels:
+        raise ValueError("shrink_factors, smoothing_sigmas et iterations doivent avoir un élément par niveau.")
+    return settings
+
+def estimate_rigid_transform(fixed_image, moving_image, preset="exact", initial_transform=None, **overrides):
+    """Estime la transformation rigide fixe -> mobile.
+
+    initial_transform (transformation ou chemin .tfm) permet de repartir d'un recalage précédent
+    au lieu de l'initialisation géométrique.
+    """
+    # L'intervalle "registration" ne couvre que l'optimisation ; celui-ci inclut la construction
+    # des objets ITK (chargement des modules au premier appel)
+    with profile_span("estimate_rigid_transform", preset=preset):
+        return _estimate_rigid_transform(fixed_image, moving_image, preset, initial_transform, **overrides)
+
+def _estimate_rigid_transform(fixed_image, moving_image, preset, initial_transform, **overrides):
+    settings = registration_settings(preset, **overrides)
 
-def register_images(fixed_path, moving_path):
-    PixelType = itk.ctype("float")
-    
-    fixed_image = itk.imread(fixed_path, PixelType)
-    moving_image = itk.imread(moving_path, PixelType)
-    
     FixedImageType = type(fixed_image)
     MovingImageType = type(moving_image)
-    
+
     TransformType = itk.VersorRigid3DTransform[itk.D]
-    initial_transform = TransformType.New()
-    
-    InitializerType = itk.CenteredTransformInitializer[TransformType, FixedImageType, MovingImageType]
-    initializer = InitializerType.New()
-    initializer.SetTransform(initial_transform)
-    initializer.SetFixedImage(fixed_image)
-    initializer.SetMovingImage(moving_image)
-    initializer.GeometryOn()
-    initializer.InitializeTransform()
-    
+    transform = TransformType.New()
+
+    if initial_transform is not None:
+        if isinstance(initial_transform, str):
+            initial_transform = read_transform(initial_transform)
+        transform.SetFixedParameters(initial_transform.GetFixedParameters())
+        transform.SetParameters(initial_transform.GetParameters())
+    else:
+        InitializerType = itk.CenteredTransformInitializer[TransformType, FixedImageType, MovingImageType]
+        initializer = InitializerType.New()
+        initializer.SetTransform(transform)
+        initializer.SetFixedImage(fixed_image)
+        initializer.SetMovingImage(moving_image)
+        initializer.GeometryOn()
+        initializer.InitializeTransform()
+
     MetricType = itk.MattesMutualInformationImageToImageMetricv4[FixedImageType, MovingImageType]
     metric = MetricType.New()
     metric.SetNumberOfHistogramBins(50)
     metric.SetUseMovingImageGradientFilter(False)
     metric.SetUseFixedImageGradientFilter(False)
-    
+
+    iterations = settings["iterations"]
+
     OptimizerType = itk.RegularStepGradientDescentOptimizerv4[itk.D]
     optimizer = OptimizerType.New()
     optimizer.SetLearningRate(0.2)
     optimizer.SetMinimumStepLength(0.001)
-    optimizer.SetNumberOfIterations(300)
+    optimizer.SetNumberOfIterations(iterations[0])
     optimizer.SetRelaxationFactor(0.5)
-    
-    optimizer_scales = itk.OptimizerParameters[itk.D](initial_transform.GetNumberOfParameters())
+
+    optimizer_scales = itk.OptimizerParameters[itk.D](transform.GetNumberOfParameters())
     optimizer_scales[0] = 1000.0  # versor x
-    optimizer_scales[1] = 1000.0  # versor y  
+    optimizer_scales[1] = 1000.0  # versor y
     optimizer_scales[2] = 1000.0  # versor z
     optimizer_scales[3] = 1.0     # translation x
     optimizer_scales[4] = 1.0     # translation y
     optimizer_scales[5] = 1.0     # translation z
     optimizer.SetScales(optimizer_scales)
-    
+
     RegistrationType = itk.ImageRegistrationMethodv4[FixedImageType, MovingImageType]
     registration = RegistrationType.New()
-    
+
     registration.SetFixedImage(fixed_image)
     registration.SetMovingImage(moving_image)
     registration.SetMetric(metric)
     registration.SetOptimizer(optimizer)
-    registration.SetInitialTransform(initial_transform)
-    
-    registration.SetSmoothingSigmasPerLevel([0])
-    registration.SetShrinkFactorsPerLevel([1])
-    registration.SetNumberOfLevels(1)
-    registration.Update()
-    
-    transform = registration.GetTransform()
-    
-    ResampleFilterType = itk.ResampleImageFilter[MovingImageType, FixedImageType]
+    registration.SetInitialTransform(transform)
+
+    registration.SetNumberOfLevels(len(settings["shrink_factors"]))
+    registration.SetShrinkFactorsPerLevel(settings["shrink_factors"])
+    registration.SetSmoothingSigmasPerLevel(settings["smoothing_sigmas"])
+    registration.SetSmoothingSigmasAreSpecifiedInPhysicalUnits(False)
+
+    strategy = settings["sampling_strategy"].upper()
+    registration.SetMetricSamplingStrategy(
+        getattr(itk.ImageRegistrationMethodv4Enums, f"MetricSamplingStrategy_{strategy}"))
+    registration.SetMetricSamplingPercentage(settings["sampling_percentage"])
+    # Graine fixe : l'échantillonnage aléatoire donne le même résultat d'une exécution à l'autre
+    registration.MetricSamplingReinitializeSeed(121212)
+
+    # Budget d'itérations propre à chaque niveau de la pyramide
+    def on_new_level():
+        level = registration.GetCurrentLevel()
+        optimizer.SetNumberOfIterations(iterations[level])
+
+    registration.AddObserver(itk.MultiResolutionIterationEvent(), on_new_level)
+    profile_registration(registration, optimizer)
+    with profile_span("registration", preset=preset):
+        registration.Update()
+    profile_event("registration_done", metric=float(optimizer.GetValue()),
+                  stop_condition=optimizer.GetStopConditionDescription())
+
+    return registration.GetTransform()
+
+def resample_image(moving_image, transform, reference_image, default_value=0, interpolation="linear"):
+    MovingImageType = type(moving_image)
+
+    ResampleFilterType = itk.ResampleImageFilter[MovingImageType, MovingImageType]
     resampler = ResampleFilterType.New()
     resampler.SetTransform(transform)
     resampler.SetInput(moving_image)
-    resampler.SetReferenceImage(fixed_image)
+    resampler.SetReferenceImage(reference_image)
     resampler.SetUseReferenceImage(True)
-    resampler.SetDefaultPixelValue(0)
-    
-    InterpolatorType = itk.LinearInterpolateImageFunction[MovingImageType, itk.D]
+    resampler.SetDefaultPixelValue(default_value)
+
+    if interpolation == "nearest":
+        InterpolatorType = itk.NearestNeighborInterpolateImageFunction[MovingImageType, itk.D]
+    else:
+        InterpolatorType = itk.LinearInterpolateImageFunction[MovingImageType, itk.D]
     interpolator = InterpolatorType.New()
     resampler.SetInterpolator(interpolator)
-    
+
+    profile_filter(resampler)
     resampler.Update()
-    registered_image = resampler.GetOutput()
-        
-    return registered_image
\ No newline at end of file
+    return resampler.GetOutput()
+
+def transform_discrepancy(transform1, transform2, reference_image):
+    """Écart maximal (mm) entre deux transformations rigides sur les coins du volume de référence.
+
+    Pour une transformation rigide, l'écart maximal sur le volume est atteint à un coin :
+    c'est la tolérance utilisée pour comparer les préréglages rapides au recalage "exact".
+    """
+    size = reference_image.GetLargestPossibleRegion().GetSize()
+    max_distance = 0.0
+    for corner in np.ndindex(2, 2, 2):
+        index = itk.ContinuousIndex[itk.D, 3]()
+        for axis in range(3):
+            index[axis] = corner[axis] * (size[axis] - 1)
+        point = reference_image.TransformContinuousIndexToPhysicalPoint(index)
+        p1 = np.array(transform1.TransformPoint(point))
+        p2 = np.array(transform2.TransformPoint(point))
+        max_distance = max(max_distance, float(np.linalg.norm(p1 - p2)))
+    return max_distance
+
+def resample_with_transform(transform, images, reference_image, interpolation="nearest"):
+    """Applique une transformation déjà calculée à plusieurs images ou masques, sans recalage.
+
+    Les images (ou chemins) gardent leur type de pixel ; l'interpolation au plus proche
+    voisin par défaut conserve les étiquettes des masques.
+    """
+    if isinstance(transform, str):
+        transform = read_transform(transform)
+    reference_image = load_image(reference_image)
+
+    resampled = []
+    for image in images:
+        image = load_image(image)
+        resampled.append(resample_image(image, transform, reference_image, interpolation=interpolation))
+    return resampled
+
+def register_images(fixed_path, moving_path, preset="exact", initial_transform=None, **overrides):
+    """Recale l'image mobile sur l'image fixe ; retourne l'image recalée et la transformation"""
+    PixelType = itk.ctype("float")
+
+    # L'image mobile est lue en arrière-plan pendant la lecture de l'image fixe
+    prefetch_images([moving_path], PixelType)
+    fixed_image = load_image(fixed_path, PixelType)
+    moving_image = load_image(moving_path, PixelType)
+
+    transform = estimate_rigid_transform(fixed_image, moving_image, preset, initial_transform, **overrides)
+    registered_image = resample_image(moving_image, transform, fixed_image)
+
+    return registered_image, transform
@@ -0,0 +1,293 @@
+import fcntl
+import json
+import os
+import time
+
+from contextlib import contextmanager
+
+import numpy as np
+
+# Entrepôt des résultats d'analyse, en colonnes. Une ligne par comparaison de deux examens d'un
+# patient (--step analyze, mode cohorte, série longitudinale). Chaque colonne est un fichier binaire
+# brut (<colonne>.bin) auquel un ajout écrit seulement ses nouvelles valeurs. Les chaînes sont codées
+# par dictionnaire : codes int32 dans le .bin, valeurs distinctes en lignes JSON dans <colonne>.dict.
+# `meta.json`, remplacé en dernier, fixe le nombre de lignes validées : un ajout interrompu laisse
+# des octets en trop, ignorés à la lecture et tronqués par l'ajout suivant. La lecture projette les
+# colonnes en mémoire (np.memmap) sans jamais relire d'image.
+META_NAME = "meta.json"
+LOCK_NAME = ".lock"
+STORE_VERSION = 1
+
+# Colonnes et types NumPy ("U" : chaîne codée par dictionnaire). Valeur absente : NaN, "", NaT, -1.
+RESULT_COLUMNS = [
+    # Identification
+    ("patient_id", "U"), ("timepoint", "U"), ("reference", "U"), ("source", "U"),
+    ("recorded_at", "datetime64[s]"), ("reference_date", "datetime64[D]"), ("date", "datetime64[D]"),
+    # Métriques
+    ("volume1", "f8"), ("volume2", "f8"), ("volume_diff", "f8"), ("dice", "f8"), ("jaccard", "f8"),
+    ("hausdorff", "f8"), ("hd95", "f8"), ("assd", "f8"),
+    ("overlap_voxels", "i8"), ("growth_voxels", "i8"), ("regression_voxels", "i8"),
+    ("mean1", "f8"), ("std1", "f8"), ("median1", "f8"), ("mean2", "f8"), ("std2", "f8"), ("median2", "f8"),
+    # Paramètres
+    ("preset", "U"), ("seed", "U"), ("lower_factor", "f8"), ("upper_factor", "f8"), ("roi", "i1"),
+    ("fast_brain", "i1"),
+    # Provenance : empreintes sha256 des deux examens et du code
+    ("reference_digest", "U"), ("digest", "U"), ("code_version", "U"),
+]
+COLUMN_TYPES = dict(RESULT_COLUMNS)
+# Codes de dictionnaire d'une colonne de chaînes, gardés à côté des valeurs par load_results :
+# regroupements et dédoublonnages comparent des entiers au lieu de chaînes
+CODES_SUFFIX = ":codes"
+# Dictionnaires déjà lus dans ce processus : chemin -> lignes validées (voir _read_dictionary)
+_dictionary_memo = {}
+_MISSING = {"U": "", "f8": np.nan, "i8": -1, "i1": -1, "datetime64[s]": "NaT", "datetime64[D]": "NaT"}
+
+def analysis_record(analysis, **fields):
+    """Ligne de l'entrepôt à partir du résultat d'analyze_masks et des champs d'identification,
+    de paramètres et de provenance (colonnes de RESULT_COLUMNS)"""
+    record = {name: analysis[name] for name in ("volume1", "volume2", "volume_diff", "dice", "jaccard",
+                                                "hausdorff", "hd95", "assd", "overlap_voxels",
+                                                "growth_voxels", "regression_voxels") if name in analysis}
+    for index in ("1", "2"):
+        stats = analysis.get("stats" + index) or {}
+        record.update({key + index: stats[key] for key in ("mean", "std", "median") if key in stats})
+    record.update(fields)
+    return record
+
+def _column_path(store_dir, name, suffix=".bin"):
+    return os.path.join(store_dir, name + suffix)
+
+def _read_meta(store_dir):
+    path = os.path.join(store_dir, META_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        meta = json.load(f)
+    if meta["columns"] != [list(column) for column in RESULT_COLUMNS]:
+        raise ValueError(f"Entrepôt {store_dir} (version {meta['version']}) : colonnes différentes de RESULT_COLUMNS")
+    return meta
+
+def _write_meta(store_dir, meta):
+    path = os.path.join(store_dir, META_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def _locked(store_dir):
+    """Verrou exclusif de l'entrepôt : plusieurs processus peuvent y ajouter des lignes"""
+    with open(os.path.join(store_dir, LOCK_NAME), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _read_dictionary(store_dir, name, meta):
+    """(valeurs, index valeur -> code) du dictionnaire validé d'une colonne de chaînes.
+
+    Les lignes validées ne changent plus : elles sont gardées en mémoire dans le processus,
+    et seules les lignes ajoutées depuis la dernière lecture sont relues.
+    """
+    path = os.path.abspath(_column_path(store_dir, name, ".dict"))
+    size = meta["dictionary_bytes"][name]
+    if size == 0:
+        return [], {}
+    inode = os.stat(path).st_ino
+    memo = _dictionary_memo.get(path)
+    if memo is None or memo["inode"] != inode or memo["bytes"] > size:
+        memo = _dictionary_memo[path] = {"inode": inode, "bytes": 0, "values": [], "index": {}}
+    if memo["bytes"] < size:
+        with open(path, "rb") as f:
+            f.seek(memo["bytes"])
+            data = f.read(size - memo["bytes"]).decode("ascii")
+        # Une ligne JSON par valeur : décodées en une fois comme un tableau JSON
+        values = json.loads("[" + data.rstrip("\n").replace("\n", ",") + "]")
+        memo["index"].update((value, i) for i, value in enumerate(values, start=len(memo["values"])))
+        memo["values"].extend(values)
+        memo["bytes"] = size
+    return memo["values"], memo["index"]
+
+def _encode(values, dtype, index=None):
+    """Valeurs d'une colonne pour les nouvelles lignes.
+
+    Les chaînes sont remplacées par leur code dans `index` ; retourne (codes, valeurs nouvelles
+    à ajouter au dictionnaire, dans l'ordre de leurs codes).
+    """
+    if dtype != "U":
+        return np.array([_MISSING[dtype] if value is None else value for value in values], dtype=dtype), []
+    codes = np.empty(len(values), dtype=np.int32)
+    added = {}
+    for i, value in enumerate(values):
+        value = "" if value is None else str(value)
+        code = index.get(value)
+        codes[i] = code if code is not None else added.setdefault(value, len(index) + len(added))
+    return codes, list(added)
+
+def append_records(store_dir, records):
+    """Ajoute des lignes (dictionnaires colonne -> valeur, voir analysis_record) ; retourne le nombre de lignes.
+
+    Les colonnes absentes d'un enregistrement prennent la valeur manquante de leur type ;
+    `recorded_at` vaut par défaut l'heure de l'ajout.
+    """
+    records = list(records)
+    os.makedirs(store_dir, exist_ok=True)
+    with _locked(store_dir):
+        meta = _read_meta(store_dir) or {
+            "version": STORE_VERSION, "columns": [list(column) for column in RESULT_COLUMNS], "rows": 0,
+            "dictionary_bytes": {name: 0 for name, dtype in RESULT_COLUMNS if dtype == "U"},
+        }
+        if not records:
+            return meta["rows"]
+        now = np.datetime64(int(time.time()), "s")
+        for name, dtype in RESULT_COLUMNS:
+            values = [record.get(name) for record in records]
+            if name == "recorded_at":
+                values = [now if value is None else value for value in values]
+            path = _column_path(store_dir, name)
+            if dtype == "U":
+                column, added = _encode(values, dtype, _read_dictionary(store_dir, name, meta)[1])
+                dict_path = _column_path(store_dir, name, ".dict")
+                # json.dumps échappe les caractères non ASCII : un caractère par octet
+                with open(dict_path, "a", encoding="ascii") as f:
+                    f.truncate(meta["dictionary_bytes"][name])
+                    f.write("".join(json.dumps(value) + "\n" for value in added))
+                meta["dictionary_bytes"][name] = os.path.getsize(dict_path)
+            else:
+                column, _ = _encode(values, dtype)
+            with open(path, "ab") as f:
+                # Octets d'un ajout interrompu : au-delà des lignes validées
+                f.truncate(meta["rows"] * column.dtype.itemsize)
+                f.write(column.tobytes())
+        meta["rows"] += len(records)
+        _write_meta(store_dir, meta)
+    return meta["rows"]
+
+def load_results(store_dir, columns=None):
+    """Colonnes de l'entrepôt (toutes par défaut) : nom -> tableau NumPy d'une valeur par ligne.
+
+    Les colonnes numériques sont projetées en mémoire ; les chaînes sont décodées en un tableau
+    NumPy de chaînes, leurs codes de dictionnaire sont aussi retournés sous `<colonne>:codes`.
+    Un entrepôt absent donne des colonnes vides.
+    """
+    columns = columns or [name for name, _ in RESULT_COLUMNS]
+    meta = _read_meta(store_dir) if os.path.isdir(store_dir) else None
+    rows = meta["rows"] if meta else 0
+    table = {}
+    for name in columns:
+        dtype = COLUMN_TYPES[name]
+        if rows == 0:
+            table[name] = np.empty(0, dtype=str if dtype == "U" else dtype)
+            if dtype == "U":
+                table[name + CODES_SUFFIX] = np.empty(0, dtype=np.int32)
+            continue
+        path = _column_path(store_dir, name)
+        if dtype != "U":
+            table[name] = np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+            continue
+        codes = np.memmap(path, dtype=np.int32, mode="r", shape=(rows,))
+        table[name] = np.array(_read_dictionary(store_dir, name, meta)[0], dtype=str)[codes]
+        table[name + CODES_SUFFIX] = codes
+    return table
+
+def table_rows(table):
+    return len(next(iter(table.values()))) if table else 0
+
+def _group_codes(table, name):
+    """Entiers égaux pour des valeurs égales de la colonne (codes de dictionnaire s'ils sont chargés)"""
+    codes = table.get(name + CODES_SUFFIX)
+    if codes is None:
+        codes = np.unique(table[name], return_inverse=True)[1]
+    return np.asarray(codes)
+
+def take(table, rows):
+    """Sous-table : lignes données par un masque booléen ou des indices"""
+    return {name: np.asarray(values)[rows] for name, values in table.items()}
+
+def select(table, patients=None, since=None, until=None, date_column="date", source=None):
+    """Lignes d'une sélection de patients et/ou d'un intervalle de dates [since, until] (inclus).
+
+    `since` et `until` sont des dates ISO ou des np.datetime64 ; les lignes sans date sont exclues
+    dès qu'une borne est donnée. Retourne la sous-table.
+    """
+    keep = np.ones(table_rows(table), dtype=bool)
+    if patients is not None:
+        keep &= np.isin(table["patient_id"], [patients] if isinstance(patients, str) else list(patients))
+    if source is not None:
+        keep &= table["source"] == source
+    dates = table[date_column] if since is not None or until is not None else None
+    if since is not None:
+        keep &= dates >= np.datetime64(since).astype(dates.dtype)
+    if until is not None:
+        keep &= dates <= np.datetime64(until).astype(dates.dtype)
+    return take(table, keep)
+
+LATEST_KEYS = ("patient_id", "reference", "timepoint", "source")
+
+def latest(table, keys=LATEST_KEYS):
+    """Dernière ligne ajoutée pour chaque comparaison (une analyse relancée remplace la précédente)"""
+    return take(table, latest_rows(table, keys))
+
+def latest_rows(table, keys=LATEST_KEYS):
+    """Indices croissants des lignes gardées par latest"""
+    rows = table_rows(table)
+    if rows == 0:
+        return np.empty(0, dtype=np.int64)
+    codes = [_group_codes(table, name) for name in keys]
+    # Tri par clé puis par ordre d'ajout : la dernière ligne de chaque clé précède un changement de clé
+    order = np.lexsort([np.arange(rows)] + codes[::-1])
+    same_key = np.ones(rows - 1, dtype=bool)
+    for key_codes in codes:
+        sorted_codes = key_codes[order]
+        same_key &= sorted_codes[1:] == sorted_codes[:-1]
+    return np.sort(order[np.append(~same_key, True)])
+
+def growth(table):
+    """Variations de volume de chaque ligne : absolue (mm³), relative, et par jour si les deux dates sont connues"""
+    volume1, volume2 = np.asarray(table["volume1"], dtype=np.float64), np.asarray(table["volume2"], dtype=np.float64)
+    change = volume2 - volume1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = np.where(volume1 > 0, change / volume1, np.nan)
+        days = (table["date"] - table["reference_date"]).astype(np.float64)
+        daily = np.where(days > 0, change / days, np.nan)
+    return {"volume_change": change, "relative_change": relative, "daily_change": daily}
+
+def distribution(values, percentiles=(5, 25, 50, 75, 95)):
+    """Effectif, moyenne et percentiles des valeurs connues (NaN ignorés)"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return {"count": 0, "mean": np.nan, **{f"p{p}": np.nan for p in percentiles}}
+    return {"count": len(values), "mean": float(values.mean()),
+            **{f"p{p}": float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))}}
+
+def growth_distribution(table, percentiles=(5, 25, 50, 75, 95)):
+    """Distribution dans la cohorte des variations de volume (voir growth), dernières analyses seulement"""
+    rows = latest_rows(table)
+    changes = growth(take({name: table[name] for name in ("volume1", "volume2", "reference_date", "date")}, rows))
+    return {name: distribution(values, percentiles) for name, values in changes.items()}
+
+def aggregate_by(table, column, by="patient_id"):
+    """Effectif, moyenne, minimum, maximum et dernière valeur de `column` par groupe (NaN ignorés).
+
+    Retourne un dictionnaire de tableaux alignés, un élément par groupe ; "last" suit l'ordre des lignes.
+    """
+    _, first, inverse = np.unique(_group_codes(table, by), return_index=True, return_inverse=True)
+    groups = np.asarray(table[by])[first]
+    values = np.asarray(table[column], dtype=np.float64)
+    known = ~np.isnan(values)
+    count = np.bincount(inverse, weights=known, minlength=len(groups))
+    total = np.bincount(inverse, weights=np.where(known, values, 0.0), minlength=len(groups))
+    minimum = np.full(len(groups), np.inf)
+    maximum = np.full(len(groups), -np.inf)
+    np.minimum.at(minimum, inverse[known], values[known])
+    np.maximum.at(maximum, inverse[known], values[known])
+    last_row = np.full(len(groups), -1)
+    np.maximum.at(last_row, inverse[known], np.flatnonzero(known))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+    empty = count == 0
+    minimum[empty] = maximum[empty] = np.nan
+    last = np.where(empty, np.nan, values[last_row])
+    return {by: groups, "count": count.astype(np.int64), "mean": mean, "min": minimum, "max": maximum, "last": last}
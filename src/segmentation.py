@@ -1,164 +1,582 @@
 import itk
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.widgets import Slider
+from concurrent.futures import ThreadPoolExecutor
 
-def segment_brain(image_path):
-    PixelType = itk.F
-    ImageType = itk.Image[PixelType, 3]
-    MaskPixelType = itk.UC
-    MaskType = itk.Image[MaskPixelType, 3]
+from src.histogram import otsu_threshold
+from src.image_io import load_image, nonzero_bounding_box, set_bounding_box
+from src.profiling import profile_span, profile_filter
+from src.parallel import apply_work_units, configured_threads, job_pool, submit_job, work_units
+
+def _pipeline_filter(itk_filter):
+    """Filtre mesuré (--profile) et limité aux unités de travail de la tâche courante (src/parallel.py)"""
+    return profile_filter(apply_work_units(itk_filter))
+
+def _load_float_image(image):
+    """Image float 3D à partir d'un chemin (lecture mémorisée) ou d'une image déjà chargée"""
+    ImageType = itk.Image[itk.F, 3]
+    image = load_image(image, itk.F)
+    if type(image) != ImageType:
+        cast = _pipeline_filter(itk.CastImageFilter[type(image), ImageType].New())
+        cast.SetInput(image)
+        cast.Update()
+        image = cast.GetOutput()
+    return image
+
+def _is_empty(mask):
+    """Test de masque vide par filtre de statistiques, sans copie du volume en tableau"""
+    minmax = itk.MinimumMaximumImageFilter[type(mask)].New()
+    minmax.SetInput(mask)
+    minmax.Update()
+    return minmax.GetMaximum() == 0
 
-    reader = itk.ImageFileReader[ImageType].New()
-    reader.SetFileName(image_path) 
-    reader.Update()
+# Histogramme du seuil d'Otsu du cerveau ; en mode rapide, nombre de voxels échantillonnés
+BRAIN_HISTOGRAM_BINS = 200
+BRAIN_HISTOGRAM_SAMPLES = 1 << 20
 
+def segment_brain(image, fast=False):
+    """Masque du cerveau d'une image (chemin ou image ITK déjà chargée).
 
-    otsu = itk.OtsuThresholdImageFilter[ImageType, MaskType].New()
-    otsu.SetInput(reader.GetOutput())
-    otsu.SetOutsideValue(0)
-    otsu.SetInsideValue(1)
-    otsu.SetNumberOfHistogramBins(200)
-    
+    fast=True : seuil estimé sur un histogramme sous-échantillonné, fermeture et plus grande
+    composante sur une grille deux fois plus grossière, puis seuillage en pleine résolution
+    seulement près du bord du cerveau (voir _segment_brain_fast).
+    """
+    # Mesure aussi la construction des filtres : le premier accès à un type ITK charge son module
+    with profile_span("segment_brain", fast=fast):
+        return _segment_brain_fast(image) if fast else _segment_brain(image)
+
+def _largest_component(labels):
+    """Masque (UC) de la plus grande composante d'une image de labels (UL).
+
+    Les labels restent sur 64 bits : un cast en 8 bits avant RelabelComponentImageFilter
+    confondait les composantes au-delà de 255 (le label 257 devenait 1).
+    """
+    array = itk.array_view_from_image(labels)
+    counts = np.bincount(array.ravel().view(np.int64 if array.itemsize == 8 else np.int32))
+    counts[0] = 0
+    mask = itk.image_from_array((array == np.argmax(counts)).astype(np.uint8) if counts.any()
+                                else np.zeros(array.shape, np.uint8))
+    mask.CopyInformation(labels)
+    return mask
+
+def _closed_largest_component(mask):
+    """Fermeture morphologique (boule de rayon 1) puis plus grande composante connexe d'un masque UC"""
+    MaskType = type(mask)
     StructuringElementType = itk.FlatStructuringElement[3]
-    structuring_element = StructuringElementType.Ball(1)
-    
-    morpho = itk.BinaryMorphologicalClosingImageFilter[MaskType, MaskType, StructuringElementType].New()
-    morpho.SetInput(otsu.GetOutput())
-    morpho.SetKernel(structuring_element)
+    morpho = _pipeline_filter(
+        itk.BinaryMorphologicalClosingImageFilter[MaskType, MaskType, StructuringElementType].New())
+    morpho.SetInput(mask)
+    morpho.SetKernel(StructuringElementType.Ball(1))
     morpho.SetForegroundValue(1)
-    
-    connected_components = itk.ConnectedComponentImageFilter[MaskType, itk.Image[itk.UL, 3]].New()
+
+    connected_components = _pipeline_filter(itk.ConnectedComponentImageFilter[MaskType, itk.Image[itk.UL, 3]].New())
     connected_components.SetInput(morpho.GetOutput())
+    # Une seule mise à jour : toute la chaîne s'exécute en une fois
+    connected_components.Update()
+    return _largest_component(connected_components.GetOutput())
 
-    cast = itk.CastImageFilter[itk.Image[itk.UL, 3], MaskType].New()
-    cast.SetInput(connected_components.GetOutput())
-    cast.Update()
-    
-    relabel = itk.RelabelComponentImageFilter[MaskType, MaskType].New()
-    relabel.SetInput(cast.GetOutput())
-    relabel.SortByObjectSizeOn()
-    
-    threshold = itk.BinaryThresholdImageFilter[MaskType, MaskType].New()
-    threshold.SetInput(relabel.GetOutput())
-    threshold.SetLowerThreshold(1)
-    threshold.SetUpperThreshold(1)
-    threshold.SetOutsideValue(0)
-    threshold.SetInsideValue(1)
-    threshold.Update()
-    
-    return threshold.GetOutput()
-
-
-def segment_tumor(image_path, seed=None, lower_factor=0.8, upper_factor=1.2, min_tumor_size=100):
+def _segment_brain(image):
     PixelType = itk.F
     ImageType = itk.Image[PixelType, 3]
-    LabelType = itk.UC
-    LabelImageType = itk.Image[LabelType, 3]
+    MaskPixelType = itk.UC
+    MaskType = itk.Image[MaskPixelType, 3]
 
-    reader = itk.ImageFileReader[ImageType].New(FileName=image_path)
-    reader.Update()
-    image = reader.GetOutput()
-    image_array = itk.GetArrayFromImage(image)
+    image = _load_float_image(image)
 
-    if seed is None:
-        fig, ax = plt.subplots(figsize=(8, 6))
-        plt.subplots_adjust(bottom=0.25)
-        current_slice = image_array.shape[0] // 2
-        img_disp = ax.imshow(image_array[current_slice], cmap='gray')
-        ax.set_title(f"Coupe axiale {current_slice}")
-        ax_slider = plt.axes([0.25, 0.1, 0.65, 0.03])
-        slider = Slider(ax_slider, 'Slice', 0, image_array.shape[0]-1,
-                        valinit=current_slice, valstep=1)
-
-        def update(val):
-            sl = int(slider.val)
-            img_disp.set_data(image_array[sl])
-            ax.set_title(f"Coupe axiale {sl}")
-            fig.canvas.draw_idle()
-        slider.on_changed(update)
-
-        seed_point = None
-        def onclick(event):
-            nonlocal seed_point
-            if event.inaxes == ax:
-                x, y = int(round(event.xdata)), int(round(event.ydata))
-                z = int(slider.val)
-                seed_point = (z, y, x)
-                ax.scatter(x, y, c='r', marker='+', s=100)
-                fig.canvas.draw_idle()
-        fig.canvas.mpl_connect('button_press_event', onclick)
-
-        plt.text(0.5, 0.02,
-                "Cliquez sur la tumeur puis fermez la fenêtre",
-                transform=fig.transFigure, ha='center')
-        plt.show()
-    else:
-        seed_point = seed
+    # Le filtre d'Otsu donne InsideValue aux voxels sous le seuil : le cerveau, plus clair que
+    # le fond, est à l'extérieur
+    otsu = _pipeline_filter(itk.OtsuThresholdImageFilter[ImageType, MaskType].New())
+    otsu.SetInput(image)
+    otsu.SetOutsideValue(1)
+    otsu.SetInsideValue(0)
+    otsu.SetNumberOfHistogramBins(BRAIN_HISTOGRAM_BINS)
+    return _closed_largest_component(otsu.GetOutput())
 
-    if seed_point is None:
-        raise RuntimeError("Sélectionner un seed point avant de fermer la fenêtre.")
+def _subsampled_otsu(array, bins=BRAIN_HISTOGRAM_BINS, samples=BRAIN_HISTOGRAM_SAMPLES):
+    """Seuil d'Otsu estimé sur un voxel sur step³ (environ `samples` voxels)"""
+    step = max(1, int(round((array.size / samples) ** (1.0 / 3.0))))
+    sample = array[::step, ::step, ::step]
+    low, high = float(sample.min()), float(sample.max())
+    counts, edges = np.histogram(sample, bins=bins, range=(low, high if high > low else low + 1.0))
+    return otsu_threshold(counts.astype(np.float64), (edges[:-1] + edges[1:]) / 2.0)
 
-    brain_only_img = image
-    seed_val = image_array[seed_point]
-    lower = int(max(0, seed_val * lower_factor))
-    upper = int(seed_val * upper_factor)
+def _dilate6(mask):
+    """Dilatation d'un masque booléen par les 6 voisins directs"""
+    padded = np.pad(mask, 1)
+    dilated = mask.copy()
+    for axis in range(3):
+        for offset in (0, 2):
+            neighbors = [slice(1, -1)] * 3
+            neighbors[axis] = slice(offset, offset + mask.shape[axis])
+            dilated |= padded[tuple(neighbors)]
+    return dilated
+
+def _segment_brain_fast(image):
+    """Masque du cerveau calculé sur une grille grossière, affiné en pleine résolution près du bord.
+
+    Le seuil d'Otsu est estimé sur un histogramme sous-échantillonné. La moyenne des blocs 2×2×2
+    est seuillée, fermée et réduite à sa plus grande composante (1/8 des voxels). Les voxels
+    grossiers loin du bord donnent directement le masque ; dans la bande des voxels grossiers du
+    bord et de leurs voisins, chaque voxel pleine résolution est seuillé.
+    """
+    image = _load_float_image(image)
+    array = itk.array_view_from_image(image)
+    threshold = _subsampled_otsu(array)
+
+    # Dimensions paires par réplication du bord
+    odd = [(0, n % 2) for n in array.shape]
+    padded = np.pad(array, odd, mode="edge") if any(pad for _, pad in odd) else array
+    nz, ny, nx = (n // 2 for n in padded.shape)
+    coarse = padded.reshape(nz, 2, ny, 2, nx, 2).mean(axis=(1, 3, 5), dtype=np.float32)
+    coarse_mask = itk.image_from_array((coarse > threshold).astype(np.uint8))
+    brain = itk.array_view_from_image(_closed_largest_component(coarse_mask)) != 0
 
-    reg = itk.ConnectedThresholdImageFilter[ImageType, ImageType].New()
-    reg.SetInput(brain_only_img)
+    interior = ~_dilate6(~brain)
+    band = _dilate6(brain) & ~interior
+    mask = np.empty(padded.shape, np.uint8)
+    mask.reshape(nz, 2, ny, 2, nx, 2)[...] = interior[:, None, :, None, :, None]
+    fine = np.broadcast_to(band[:, None, :, None, :, None], (nz, 2, ny, 2, nx, 2)).reshape(padded.shape)
+    mask[fine] = padded[fine] > threshold
+
+    result = itk.image_from_array(np.ascontiguousarray(mask[:array.shape[0], :array.shape[1], :array.shape[2]]))
+    result.CopyInformation(image)
+    return result
+
+def segment_brains(images, fast=False, threads=None):
+    """Masques du cerveau de plusieurs images (chemins ou images ITK) en un appel.
+
+    Les images sont traitées en parallèle, les threads ITK répartis entre elles (voir src/parallel.py).
+    Retourne la liste des masques, dans l'ordre des images.
+    """
+    images = list(images)
+    threads = threads or configured_threads()
+    if threads == 1 or len(images) < 2:
+        return [segment_brain(image, fast) for image in images]
+    _load_filter_modules()
+    pool, units = job_pool(len(images), threads)
+    with pool:
+        futures = [submit_job(pool, units, segment_brain, image, fast) for image in images]
+        return [future.result() for future in futures]
+
+def _grow_region(image, seed_point, lower, upper):
+    ImageType = type(image)
+    LabelImageType = itk.Image[itk.UC, 3]
+
+    reg = _pipeline_filter(itk.ConnectedThresholdImageFilter[ImageType, ImageType].New())
+    reg.SetInput(image)
     reg.SetLower(lower)
     reg.SetUpper(upper)
     reg.SetReplaceValue(1)
-    
+
     idx = itk.Index[3]()
     idx[0], idx[1], idx[2] = seed_point[2], seed_point[1], seed_point[0]
     reg.AddSeed(idx)
-    
-    reg.Update()
-    tumor_raw_float = reg.GetOutput()
-    
-    tumor_raw = itk.BinaryThresholdImageFilter[ImageType, LabelImageType].New()
-    tumor_raw.SetInput(tumor_raw_float)
+
+    tumor_raw = _pipeline_filter(itk.BinaryThresholdImageFilter[ImageType, LabelImageType].New())
+    tumor_raw.SetInput(reg.GetOutput())
     tumor_raw.SetLowerThreshold(1)
     tumor_raw.SetUpperThreshold(1)
     tumor_raw.SetInsideValue(1)
     tumor_raw.SetOutsideValue(0)
-    tumor_raw.Update()
-    tumor_raw_img = tumor_raw.GetOutput()
-    
-    tumor_array = itk.GetArrayFromImage(tumor_raw_img)
-    
-    if tumor_array.sum() == 0:
-        print("Erreur: Aucun pixel segmenté même après adaptation!")
-        return tumor_raw_img
-    
-    opening = itk.BinaryMorphologicalOpeningImageFilter[LabelImageType, LabelImageType, itk.FlatStructuringElement[3]].New()
+    # Pas de mise à jour ici : la croissance s'exécute avec le reste du pipeline.
+    # Les filtres sont retournés pour que l'appelant les garde en vie jusqu'à la mise à jour finale
+    # (une image ne garde qu'une référence faible vers le filtre qui la produit).
+    return reg, tumor_raw
+
+def _clean_tumor(tumor_raw_img, min_tumor_size):
+    LabelType = itk.UC
+    LabelImageType = itk.Image[LabelType, 3]
+
+    opening = _pipeline_filter(itk.BinaryMorphologicalOpeningImageFilter[LabelImageType, LabelImageType, itk.FlatStructuringElement[3]].New())
     opening.SetInput(tumor_raw_img)
     opening.SetKernel(itk.FlatStructuringElement[3].Ball(1))
     opening.SetForegroundValue(1)
-    opening.Update()
-    opened = opening.GetOutput()
-
-    opened_array = itk.GetArrayFromImage(opened)
-    if opened_array.sum() == 0:
-        print("Erreur: Opening a tout supprimé!")
-        return opened
 
-    cc = itk.ConnectedComponentImageFilter[LabelImageType, itk.Image[itk.UL, 3]].New()
-    cc.SetInput(opened)
-    cc.Update()
+    cc = _pipeline_filter(itk.ConnectedComponentImageFilter[LabelImageType, itk.Image[itk.UL, 3]].New())
+    cc.SetInput(opening.GetOutput())
 
-    relabel = itk.RelabelComponentImageFilter[itk.Image[itk.UL, 3], LabelImageType].New()
+    relabel = _pipeline_filter(itk.RelabelComponentImageFilter[itk.Image[itk.UL, 3], LabelImageType].New())
     relabel.SetInput(cc.GetOutput())
     relabel.SetMinimumObjectSize(min_tumor_size)
-    relabel.Update()
 
-    final_tumor = itk.BinaryThresholdImageFilter[LabelImageType, LabelImageType].New()
+    final_tumor = _pipeline_filter(itk.BinaryThresholdImageFilter[LabelImageType, LabelImageType].New())
     final_tumor.SetInput(relabel.GetOutput())
     final_tumor.SetLowerThreshold(1)
     final_tumor.SetUpperThreshold(itk.NumericTraits[LabelType].max())
     final_tumor.SetInsideValue(1)
     final_tumor.SetOutsideValue(0)
     final_tumor.Update()
-    
-    return final_tumor.GetOutput(), seed_point
\ No newline at end of file
+
+    # Le nombre de composantes tient lieu de test de vide ; le diagnostic n'est fait qu'en cas d'échec
+    if cc.GetObjectCount() == 0:
+        if _is_empty(tumor_raw_img):
+            print("Erreur: Aucun pixel segmenté même après adaptation!")
+        else:
+            print("Erreur: Opening a tout supprimé!")
+    return final_tumor.GetOutput()
+
+def _extract_roi(image, start, stop):
+    """Extrait la région [start, stop) (ordre z, y, x) en conservant l'espace physique"""
+    ImageType = type(image)
+    region = itk.ImageRegion[3]()
+    region.SetIndex([int(start[2]), int(start[1]), int(start[0])])
+    region.SetSize([int(stop[2] - start[2]), int(stop[1] - start[1]), int(stop[0] - start[0])])
+
+    extract = _pipeline_filter(itk.ExtractImageFilter[ImageType, ImageType].New())
+    extract.SetInput(image)
+    extract.SetExtractionRegion(region)
+    extract.SetDirectionCollapseToSubmatrix()
+    extract.Update()
+    return extract.GetOutput()
+
+def _grow_region_in_roi(image, seed_point, lower, upper, roi_radius, margin=2):
+    """Croissance de région dans une boîte autour du seed, agrandie tant que la région en touche les bords.
+
+    Une région qui n'atteint pas les bords de la boîte (hors bords de l'image) est identique
+    à celle obtenue sur le volume entier ; la marge protège aussi l'ouverture morphologique.
+    """
+    shape = tuple(itk.size(image))[::-1]
+    radius = roi_radius
+    while True:
+        start = [max(0, seed_point[a] - radius) for a in range(3)]
+        stop = [min(shape[a], seed_point[a] + radius + 1) for a in range(3)]
+        reg, tumor_raw = _grow_region(_extract_roi(image, start, stop), seed_point, lower, upper)
+        tumor_raw.Update()
+        tumor_raw_img = tumor_raw.GetOutput()
+
+        covers_image = all(start[a] == 0 and stop[a] == shape[a] for a in range(3))
+        bbox = nonzero_bounding_box(itk.array_view_from_image(tumor_raw_img))
+        if covers_image or bbox is None:
+            return tumor_raw_img, start, stop
+
+        touches_border = any(
+            (start[a] > 0 and bbox[a] < margin) or
+            (stop[a] < shape[a] and bbox[3 + a] > stop[a] - start[a] - margin)
+            for a in range(3)
+        )
+        if not touches_border:
+            return tumor_raw_img, start, stop
+        radius *= 2
+
+PREVIEW_RADIUS = 24
+
+def _roi_preview(image, image_array, seed_point, lower_factor, upper_factor, radius=PREVIEW_RADIUS):
+    """Croissance de région brute dans une boîte fixe autour du clic : aperçu quasi immédiat"""
+    seed_val = image_array[seed_point]
+    lower = int(max(0, seed_val * lower_factor))
+    upper = int(seed_val * upper_factor)
+    start = [max(0, seed_point[a] - radius) for a in range(3)]
+    stop = [min(image_array.shape[a], seed_point[a] + radius + 1) for a in range(3)]
+    reg, tumor_raw = _grow_region(_extract_roi(image, start, stop), seed_point, lower, upper)
+    tumor_raw.Update()
+    return itk.array_from_image(tumor_raw.GetOutput()), start
+
+def _refined_preview(image, seed_point, lower_factor, upper_factor, min_tumor_size):
+    """Segmentation complète (mode ROI) du seed cliqué, calculée en arrière-plan"""
+    mask, _ = segment_tumor(image, seed_point, lower_factor, upper_factor, min_tumor_size,
+                            roi=True, roi_output="cropped")
+    index = mask.GetLargestPossibleRegion().GetIndex()
+    return itk.array_from_image(mask), [index[2], index[1], index[0]]
+
+def _pick_seed(image, image_array, lower_factor, upper_factor, min_tumor_size):
+    """Sélection interactive du seed, avec aperçu de la croissance de région sur la coupe courante.
+
+    Un clic affiche tout de suite la croissance brute dans une boîte autour du point, puis la
+    segmentation complète calculée par un thread la remplace dès qu'elle est prête. Les artistes
+    mobiles (coupe, aperçu, seed, légende) sont redessinés seuls par blitting.
+    """
+    # Importé ici : seule l'interface de sélection a besoin de pyplot
+    import matplotlib.pyplot as plt
+    from matplotlib.widgets import Slider
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    plt.subplots_adjust(bottom=0.25)
+    current_slice = image_array.shape[0] // 2
+    img_disp = ax.imshow(image_array[current_slice], cmap='gray', animated=True)
+    overlay_disp = ax.imshow(np.ma.masked_all(image_array.shape[1:], dtype=np.uint8), cmap='autumn', vmin=0, vmax=1,
+                             alpha=0.5, interpolation='nearest', animated=True)
+    marker = ax.scatter([], [], c='r', marker='+', s=100, animated=True)
+    label = ax.text(0.02, 0.98, f"Coupe axiale {current_slice}", transform=ax.transAxes,
+                    va='top', color='w', animated=True)
+    ax.set_title("Aperçu de la croissance de région")
+    ax_slider = plt.axes([0.25, 0.1, 0.65, 0.03])
+    slider = Slider(ax_slider, 'Slice', 0, image_array.shape[0]-1,
+                    valinit=current_slice, valstep=1)
+
+    seed_point = None
+    preview = None          # (masque de la boîte, coin (z, y, x), affiné ?)
+    pending = None          # (seed, future) du calcul en arrière-plan le plus récent
+    background = None
+    refiner = ThreadPoolExecutor(max_workers=1)
+
+    def overlay_slice(sl):
+        overlay = np.ma.masked_all(image_array.shape[1:], dtype=np.uint8)
+        if preview is not None:
+            mask, start, _ = preview
+            z = sl - start[0]
+            if 0 <= z < mask.shape[0]:
+                region = (slice(start[1], start[1] + mask.shape[1]), slice(start[2], start[2] + mask.shape[2]))
+                overlay[region] = np.ma.masked_equal(mask[z], 0)
+        return overlay
+
+    def draw_artists():
+        for artist in (img_disp, overlay_disp, marker, label):
+            ax.draw_artist(artist)
+
+    def on_draw(event):
+        nonlocal background
+        background = fig.canvas.copy_from_bbox(ax.bbox)
+        draw_artists()
+
+    def redraw():
+        if background is None or not fig.canvas.supports_blit:
+            fig.canvas.draw_idle()
+            return
+        fig.canvas.restore_region(background)
+        draw_artists()
+        fig.canvas.blit(ax.bbox)
+
+    def update(val):
+        sl = int(slider.val)
+        img_disp.set_data(image_array[sl])
+        overlay_disp.set_data(overlay_slice(sl))
+        refined = preview is not None and preview[2]
+        label.set_text(f"Coupe axiale {sl}" + (" (segmentation complète)" if refined else ""))
+        redraw()
+    slider.on_changed(update)
+
+    def onclick(event):
+        nonlocal seed_point, preview, pending
+        if event.inaxes == ax:
+            x, y = int(round(event.xdata)), int(round(event.ydata))
+            z = int(slider.val)
+            seed_point = (z, y, x)
+            marker.set_offsets([[x, y]])
+            preview = _roi_preview(image, image_array, seed_point, lower_factor, upper_factor) + (False,)
+            pending = (seed_point, refiner.submit(_refined_preview, image, seed_point,
+                                                  lower_factor, upper_factor, min_tumor_size))
+            update(None)
+    fig.canvas.mpl_connect('button_press_event', onclick)
+    fig.canvas.mpl_connect('draw_event', on_draw)
+
+    def poll_refinement():
+        nonlocal preview, pending
+        if pending is not None and pending[1].done():
+            seed, future = pending
+            pending = None
+            # Un clic plus récent a pu remplacer ce seed entre-temps
+            if seed == seed_point and future.exception() is None:
+                preview = future.result() + (True,)
+                update(None)
+    timer = fig.canvas.new_timer(interval=100)
+    timer.add_callback(poll_refinement)
+    timer.start()
+
+    plt.text(0.5, 0.02,
+            "Cliquez sur la tumeur puis fermez la fenêtre",
+            transform=fig.transFigure, ha='center')
+    plt.show()
+    timer.stop()
+    refiner.shutdown(wait=False, cancel_futures=True)
+    return seed_point
+
+def _segment_tumor_at(image, image_array, seed_point, lower_factor, upper_factor, min_tumor_size,
+                      roi, roi_radius, roi_output):
+    """Segmentation de la tumeur à partir d'un seed déjà choisi (voir segment_tumor)"""
+    seed_val = image_array[seed_point]
+    lower = int(max(0, seed_val * lower_factor))
+    upper = int(seed_val * upper_factor)
+
+    if not roi:
+        reg, tumor_raw = _grow_region(image, seed_point, lower, upper)
+        tumor = _clean_tumor(tumor_raw.GetOutput(), min_tumor_size)
+        bbox = nonzero_bounding_box(itk.array_view_from_image(tumor))
+        if bbox is not None:
+            set_bounding_box(tumor, bbox)
+        return tumor
+
+    tumor_raw_img, start, stop = _grow_region_in_roi(image, seed_point, lower, upper, roi_radius)
+    roi_tumor = _clean_tumor(tumor_raw_img, min_tumor_size)
+    roi_array = itk.array_view_from_image(roi_tumor)
+    bbox = nonzero_bounding_box(roi_array)
+    if bbox is not None:
+        bbox = tuple(bbox[a] + start[a % 3] for a in range(6))
+
+    if roi_output == "cropped":
+        tumor = roi_tumor
+    else:
+        full_array = np.zeros(image_array.shape, dtype=np.uint8)
+        full_array[start[0]:stop[0], start[1]:stop[1], start[2]:stop[2]] = roi_array
+        tumor = itk.image_from_array(full_array)
+        tumor.CopyInformation(image)
+    if bbox is not None:
+        set_bounding_box(tumor, bbox)
+    return tumor
+
+def segment_tumor(image, seed=None, lower_factor=0.8, upper_factor=1.2, min_tumor_size=100,
+                  roi=False, roi_radius=16, roi_output="full"):
+    """Segmente la tumeur par croissance de région depuis un seed (z, y, x).
+
+    image est un chemin ou une image ITK déjà chargée.
+
+    roi=True limite tous les filtres à une boîte autour du seed, agrandie automatiquement tant que
+    la région y touche les bords. roi_output="full" recolle le résultat dans un masque de la taille
+    de l'image ; "cropped" retourne le masque recadré, dont l'origine est conservée.
+    Le masque porte sa boîte englobante (métadonnée "roi_bbox", voir image_io.mask_bounding_box).
+    """
+    image = _load_float_image(image)
+    image_array = itk.array_view_from_image(image)
+
+    if seed is None:
+        seed_point = _pick_seed(image, image_array, lower_factor, upper_factor, min_tumor_size)
+    else:
+        seed_point = seed
+
+    if seed_point is None:
+        raise RuntimeError("Sélectionner un seed point avant de fermer la fenêtre.")
+
+    with profile_span("segment_tumor", roi=roi):
+        tumor = _segment_tumor_at(image, image_array, seed_point, lower_factor, upper_factor, min_tumor_size,
+                                  roi, roi_radius, roi_output)
+    return tumor, seed_point
+
+DEFAULT_SWEEP_FACTORS = [(0.75, 1.25), (0.8, 1.2), (0.85, 1.15)]
+
+def seed_neighbourhood(seed, shape, offset=2):
+    """Le seed et ses six voisins à `offset` voxels le long de chaque axe.
+
+    shape est la forme (z, y, x) du tableau de l'image : les voisins hors du volume sont écartés.
+    """
+    seeds = [tuple(seed)]
+    for axis in range(3):
+        for sign in (-1, 1):
+            neighbour = list(seed)
+            neighbour[axis] += sign * offset
+            if 0 <= neighbour[axis] < shape[axis]:
+                seeds.append(tuple(neighbour))
+    return seeds
+
+def _count_components(mask):
+    cc = itk.ConnectedComponentImageFilter[type(mask), itk.Image[itk.UL, 3]].New()
+    cc.SetInput(mask)
+    cc.Update()
+    return cc.GetObjectCount()
+
+def _evaluate_tumor_parameters(image, seed, lower_factor, upper_factor, min_tumor_size, roi):
+    mask, _ = segment_tumor(image, seed, lower_factor, upper_factor, min_tumor_size,
+                            roi=roi, roi_output="cropped")
+    spacing = image.GetSpacing()
+    voxel_count = int(np.count_nonzero(itk.array_view_from_image(mask)))
+    return {
+        'seed': tuple(seed),
+        'lower_factor': lower_factor,
+        'upper_factor': upper_factor,
+        'volume': voxel_count * spacing[0] * spacing[1] * spacing[2],
+        'components': _count_components(mask),
+    }
+
+def sweep_tumor_parameters(image, seeds, factor_pairs=DEFAULT_SWEEP_FACTORS, min_tumor_size=100,
+                           roi=True, workers=None):
+    """Évalue segment_tumor sur une grille de seeds et de facteurs (lower, upper) en parallèle.
+
+    L'image est chargée une seule fois et partagée par les threads. Chaque combinaison reçoit un
+    score de stabilité : 1 moins l'écart relatif moyen de son volume avec les combinaisons voisines
+    (même seed avec d'autres facteurs, mêmes facteurs avec d'autres seeds). Un volume qui bouge peu
+    quand on perturbe les paramètres est jugé fiable. Retourne (résultats, meilleure combinaison).
+    """
+    image = _load_float_image(image)
+    combinations = [(tuple(seed), lower, upper) for seed in seeds for lower, upper in factor_pairs]
+
+    def evaluate(combination):
+        seed, lower, upper = combination
+        return _evaluate_tumor_parameters(image, seed, lower, upper, min_tumor_size, roi)
+
+    # La première combinaison tourne sur le thread appelant : le chargement paresseux des
+    # modules ITK n'a alors lieu qu'une fois, avant que les threads ne se le disputent
+    with profile_span("sweep_tumor_parameters", combinations=len(combinations)):
+        results = [evaluate(combinations[0])]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results += list(pool.map(evaluate, combinations[1:]))
+
+    for result in results:
+        neighbours = [
+            other['volume'] for other in results
+            if other is not result and (other['seed'] == result['seed'] or
+                                        (other['lower_factor'], other['upper_factor']) ==
+                                        (result['lower_factor'], result['upper_factor']))
+        ]
+        if result['volume'] == 0:
+            result['stability'] = 0.0
+        elif not neighbours:
+            result['stability'] = 1.0
+        else:
+            relative_change = np.mean([abs(v - result['volume']) for v in neighbours]) / result['volume']
+            result['stability'] = float(max(0.0, 1.0 - relative_change))
+
+    # À stabilité égale, on préfère une tumeur d'un seul tenant
+    best = max(results, key=lambda r: (r['stability'], -r['components']))
+    return results, best
+
+# Tâches simultanées de segment_scans : les deux cerveaux et la tumeur de l'image fixe
+SEGMENTATION_JOBS = 3
+
+def _load_filter_modules():
+    """Charge les modules ITK de la segmentation sur le thread appelant, avant que les tâches ne se les disputent"""
+    itk.OtsuThresholdImageFilter, itk.BinaryMorphologicalClosingImageFilter, itk.BinaryMorphologicalOpeningImageFilter
+    itk.ConnectedComponentImageFilter, itk.RelabelComponentImageFilter, itk.BinaryThresholdImageFilter
+    itk.ConnectedThresholdImageFilter, itk.ExtractImageFilter, itk.CastImageFilter, itk.MinimumMaximumImageFilter
+
+def segment_scans(fixed, registered, seed=None, lower_factor=0.8, upper_factor=1.2, roi=False, threads=None,
+                  select_parameters=None, on_mask=None, fast_brain=False):
+    """Les quatre segmentations d'une paire d'examens : cerveau et tumeur de l'image fixe et de l'image recalée.
+
+    Les deux cerveaux ne dépendent de rien : ils sont segmentés dans des threads pendant la tumeur
+    de l'image fixe, qui reste sur le thread appelant (sélection interactive du seed, puis choix
+    des paramètres par `select_parameters(image, seed) -> (seed, lower_factor, upper_factor)`).
+    La tumeur de l'image recalée, qui n'attend que le seed, part ensuite. Les `threads` ITK (défaut :
+    réglage global, voir src/parallel.py) sont répartis entre les tâches simultanées ; avec un seul
+    thread, tout s'exécute à la suite. on_mask(nom, masque) est appelé sur le thread appelant dès
+    qu'un masque est prêt. fast_brain choisit le mode rapide de segment_brain.
+    Retourne (masques par nom, seed, lower_factor, upper_factor).
+    """
+    threads = threads or configured_threads()
+    fixed, registered = _load_float_image(fixed), _load_float_image(registered)
+    masks = {}
+
+    def done(name, mask):
+        masks[name] = mask
+        if on_mask is not None:
+            on_mask(name, mask)
+
+    def fixed_tumor():
+        nonlocal seed, lower_factor, upper_factor
+        mask = None
+        if seed is None:
+            # Sélection interactive du seed
+            mask, seed = segment_tumor(fixed, seed, lower_factor, upper_factor, roi=roi)
+        if select_parameters is not None:
+            seed, lower_factor, upper_factor = select_parameters(fixed, seed)
+            mask = None
+        if mask is None:
+            mask, seed = segment_tumor(fixed, seed, lower_factor, upper_factor, roi=roi)
+        return mask
+
+    if threads == 1:
+        done("fixed_brain_mask", segment_brain(fixed, fast_brain))
+        done("fixed_tumor_mask", fixed_tumor())
+        done("registered_brain_mask", segment_brain(registered, fast_brain))
+        done("registered_tumor_mask", segment_tumor(registered, seed, lower_factor, upper_factor, roi=roi)[0])
+        return masks, seed, lower_factor, upper_factor
+
+    _load_filter_modules()
+    pool, units = job_pool(SEGMENTATION_JOBS, threads)
+    with pool:
+        brains = {name: submit_job(pool, units, segment_brain, image, fast_brain)
+                  for name, image in (("fixed_brain_mask", fixed), ("registered_brain_mask", registered))}
+        with work_units(units):
+            done("fixed_tumor_mask", fixed_tumor())
+        registered_tumor = submit_job(pool, units, segment_tumor, registered, seed, lower_factor, upper_factor,
+                                      roi=roi)
+        for name, future in brains.items():
+            done(name, future.result())
+        done("registered_tumor_mask", registered_tumor.result()[0])
+    return masks, seed, lower_factor, upper_factor
@@ -0,0 +1,316 @@
+import csv
+import hashlib
+import json
+import os
+import time
+import traceback
+
+from concurrent.futures import as_completed
+
+from src.batch import process_pool
+from src.cache import cache_key, code_version, file_digest
+
+STATE_NAME = "series.json"
+GROWTH_CURVE_FIELDS = [
+    "timepoint", "path", "status", "seed", "volume", "volume_change", "relative_change",
+    "dice_previous", "jaccard_previous", "growth_voxels", "regression_voxels", "mean", "std", "median",
+]
+
+def timepoint_id(path):
+    """Identifiant d'un examen : nom du fichier sans extension (scan_t3.nii.gz -> scan_t3)"""
+    return os.path.basename(path).split(".")[0]
+
+def load_series_state(output_dir):
+    state_path = os.path.join(output_dir, STATE_NAME)
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as f:
+        return json.load(f)
+
+def _save_state(output_dir, state):
+    state_path = os.path.join(output_dir, STATE_NAME)
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+def propagate_seed(seed, reference_image, moving_image, transform):
+    """Seed (z, y, x) de la référence -> indice du même point physique dans le scan natif.
+
+    La transformation du recalage envoie les points de la référence dans l'espace du scan mobile.
+    """
+    import itk
+    index = itk.Index[3]()
+    index[0], index[1], index[2] = int(seed[2]), int(seed[1]), int(seed[0])
+    point = transform.TransformPoint(reference_image.TransformIndexToPhysicalPoint(index))
+    moving_index = moving_image.TransformPhysicalPointToIndex(point)
+    moving_seed = (int(moving_index[2]), int(moving_index[1]), int(moving_index[0]))
+
+    size = moving_image.GetLargestPossibleRegion().GetSize()
+    if any(not 0 <= moving_seed[a] < size[2 - a] for a in range(3)):
+        raise ValueError(f"Le seed propagé {moving_seed} sort du scan.")
+    return moving_seed
+
+def process_timepoint(reference_path, path, timepoint_dir, seed, params, is_reference):
+    """Recalage sur la référence, propagation du seed et segmentation d'un examen (processus du pool).
+
+    La tumeur est segmentée dans le scan natif (intensités non interpolées), puis le masque est
+    rééchantillonné dans l'espace de la référence pour les comparaisons entre examens.
+    """
+    record = {"status": "ok", "error": ""}
+    start = time.perf_counter()
+    try:
+        import itk
+        from src.image_io import load_image, safe_itk_write, safe_transform_write, nonzero_bounding_box, set_bounding_box
+        from src.registration import estimate_rigid_transform, resample_image
+        from src.segmentation import segment_tumor
+        from src.analysis import analyze_mask
+
+        os.makedirs(timepoint_dir, exist_ok=True)
+        reference_image = load_image(reference_path, itk.F)
+        image = load_image(path, itk.F)
+
+        if is_reference:
+            transform = itk.VersorRigid3DTransform[itk.D].New()
+        else:
+            transform = estimate_rigid_transform(reference_image, image, params["preset"])
+        transform_path = os.path.join(timepoint_dir, "registered_transform.tfm")
+        safe_transform_write(transform, transform_path)
+
+        native_seed = propagate_seed(seed, reference_image, image, transform)
+        mask, native_seed = segment_tumor(image, native_seed, params["lower_factor"], params["upper_factor"],
+                                          roi=params["roi"])
+        mask_path = os.path.join(timepoint_dir, "tumor_mask.nrrd")
+        safe_itk_write(mask, mask_path)
+
+        if is_reference:
+            reference_mask = mask
+        else:
+            reference_mask = resample_image(mask, transform, reference_image, interpolation="nearest")
+            bbox = nonzero_bounding_box(itk.array_view_from_image(reference_mask))
+            if bbox is not None:
+                set_bounding_box(reference_mask, bbox)
+        reference_mask_path = os.path.join(timepoint_dir, "tumor_mask_reference.nrrd")
+        safe_itk_write(reference_mask, reference_mask_path)
+
+        analysis = analyze_mask(mask, image)
+        stats = analysis["stats"]
+        record.update({
+            "seed": list(native_seed), "transform": transform_path, "mask": mask_path,
+            "reference_mask": reference_mask_path, "volume": analysis["volume"],
+            "mean": stats["mean"], "std": stats["std"], "median": stats["median"],
+        })
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    record["seconds"] = round(time.perf_counter() - start, 2)
+    return record
+
+def _timepoint_is_current(timepoint):
+    return (timepoint.get("status") == "ok"
+            and all(os.path.exists(timepoint[name]) for name in ("transform", "mask", "reference_mask")))
+
+def _pair_key(previous, timepoint):
+    return hashlib.sha256(f"{previous['key']}:{timepoint['key']}".encode()).hexdigest()
+
+def _update_growth(timepoints):
+    """Comparaison de chaque examen au précédent réussi ; seules les paires modifiées sont recalculées.
+
+    Retourne les identifiants des examens dont la comparaison a été recalculée.
+    """
+    from src.analysis import analyze_masks
+
+    updated = set()
+    previous = None
+    for timepoint in timepoints:
+        if timepoint.get("status") != "ok":
+            continue
+        if previous is None:
+            timepoint["previous"] = None
+        else:
+            key = _pair_key(previous, timepoint)
+            if (timepoint.get("previous") or {}).get("key") != key:
+                analysis = analyze_masks(previous["reference_mask"], timepoint["reference_mask"])
+                timepoint["previous"] = {
+                    "key": key, "timepoint": previous["id"],
+                    "dice": analysis["dice"], "jaccard": analysis["jaccard"],
+                    "growth_voxels": analysis["growth_voxels"], "regression_voxels": analysis["regression_voxels"],
+                }
+                updated.add(timepoint["id"])
+        previous = timepoint
+    return updated
+
+def series_records(timepoints, patient_id, params, ids=None):
+    """Lignes de l'entrepôt des résultats (src/results_store.py) : chaque examen réussi comparé au précédent.
+
+    `ids` limite les lignes à ces examens. La ligne de la référence n'a que le volume 2.
+    """
+    from src.results_store import analysis_record
+    version = code_version()
+    records = []
+    previous = None
+    for timepoint in timepoints:
+        if timepoint.get("status") != "ok":
+            continue
+        if ids is None or timepoint["id"] in ids:
+            comparison = timepoint.get("previous") or {}
+            analysis = {"volume2": timepoint["volume"],
+                        "stats2": {key: timepoint[key] for key in ("mean", "std", "median")},
+                        **{key: comparison[key] for key in ("dice", "jaccard", "growth_voxels", "regression_voxels")
+                           if key in comparison}}
+            if previous is not None:
+                analysis.update({"volume1": previous["volume"],
+                                 "volume_diff": timepoint["volume"] - previous["volume"],
+                                 "stats1": {key: previous[key] for key in ("mean", "std", "median")}})
+            records.append(analysis_record(
+                analysis, source="series", patient_id=patient_id, timepoint=timepoint["id"],
+                reference=previous["id"] if previous is not None else "",
+                seed=" ".join(str(v) for v in timepoint["seed"]), preset=params["preset"],
+                lower_factor=params["lower_factor"], upper_factor=params["upper_factor"], roi=params["roi"],
+                reference_digest=file_digest(previous["path"]) if previous is not None else "",
+                digest=file_digest(timepoint["path"]), code_version=version))
+        previous = timepoint
+    return records
+
+def growth_curve(timepoints):
+    """Lignes de la courbe de croissance (une par examen), variations par rapport à l'examen précédent"""
+    rows = []
+    previous_volume = None
+    for timepoint in timepoints:
+        row = {"timepoint": timepoint["id"], "path": timepoint["path"], "status": timepoint.get("status", "")}
+        if timepoint.get("status") == "ok":
+            row.update({key: timepoint[key] for key in ("volume", "mean", "std", "median")})
+            row["seed"] = " ".join(str(v) for v in timepoint["seed"])
+            comparison = timepoint.get("previous")
+            if comparison is not None:
+                row["volume_change"] = timepoint["volume"] - previous_volume
+                row["relative_change"] = row["volume_change"] / previous_volume if previous_volume else ""
+                row["dice_previous"] = comparison["dice"]
+                row["jaccard_previous"] = comparison["jaccard"]
+                row["growth_voxels"] = comparison["growth_voxels"]
+                row["regression_voxels"] = comparison["regression_voxels"]
+            previous_volume = timepoint["volume"]
+        rows.append(row)
+    return rows
+
+def _write_growth_curve(rows, output_dir):
+    csv_path = os.path.join(output_dir, "growth_curve.csv")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=GROWTH_CURVE_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    points = [(i, row["volume"]) for i, row in enumerate(rows) if row["status"] == "ok"]
+    figure = Figure(figsize=(8, 4))
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(1, 1, 1)
+    if points:
+        ax.plot([i for i, _ in points], [v for _, v in points], marker="o")
+    ax.set_xticks(range(len(rows)))
+    ax.set_xticklabels([row["timepoint"] for row in rows], rotation=45, ha="right", fontsize=8)
+    ax.set_ylabel("Volume tumoral (mm³)")
+    ax.set_title("Courbe de croissance")
+    ax.grid(alpha=0.3)
+    figure.tight_layout()
+    figure.savefig(os.path.join(output_dir, "growth_curve.png"), dpi=100)
+    return csv_path
+
+def _reference_brain_mask(reference_path, output_dir, state):
+    """Masque du cerveau de la référence (pour la visualisation), recalculé seulement si la référence change"""
+    brain_path = os.path.join(output_dir, "brain_mask.nrrd")
+    digest = file_digest(reference_path)
+    if state.get("brain_mask_digest") != digest or not os.path.exists(brain_path):
+        from src.segmentation import segment_brain
+        from src.image_io import safe_itk_write
+        safe_itk_write(segment_brain(reference_path), brain_path)
+        state["brain_mask_digest"] = digest
+    return brain_path
+
+def run_series(paths, output_dir, seed=None, preset="exact", lower_factor=0.8, upper_factor=1.2, roi=False,
+               workers=None, threads_per_worker=None, results_store=None, patient_id=None, image_cache_mb=None):
+    """Suivi longitudinal d'un patient sur N examens, de manière incrémentale.
+
+    Le premier examen de la série sert de référence. Les examens déjà traités avec les mêmes entrées,
+    paramètres et code (état dans `<output_dir>/series.json`) sont repris tels quels : ajouter un examen
+    à une série existante (`paths` peut ne contenir que le nouveau) ne traite que celui-ci. Les examens
+    à traiter sont recalés et segmentés en parallèle dans un pool de processus. Écrit la courbe de
+    croissance (`growth_curve.csv`, `growth_curve.png`) et retourne la liste des examens.
+
+    Avec `results_store`, les examens traités ou comparés à nouveau sont ajoutés à l'entrepôt des
+    résultats (series_records) sous `patient_id` (défaut : nom du dossier de sortie).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state = load_series_state(output_dir) or {"seed": None, "timepoints": []}
+    timepoints = state["timepoints"]
+
+    known = {os.path.abspath(timepoint["path"]): timepoint for timepoint in timepoints}
+    for path in paths:
+        if os.path.abspath(path) not in known:
+            timepoint = {"id": timepoint_id(path), "path": os.path.abspath(path)}
+            timepoints.append(timepoint)
+            known[timepoint["path"]] = timepoint
+    ids = [timepoint["id"] for timepoint in timepoints]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Identifiants d'examen en double : {', '.join(ids)}")
+    if not timepoints:
+        raise ValueError("Série vide : donner au moins un examen.")
+
+    reference_path = timepoints[0]["path"]
+    if seed is not None:
+        state["seed"] = list(seed)
+    elif state["seed"] is None:
+        from src.segmentation import segment_tumor
+        print("Cliquer sur la tumeur dans l'examen de référence.")
+        _, seed = segment_tumor(reference_path, None, lower_factor, upper_factor, roi=roi)
+        state["seed"] = list(seed)
+    seed = tuple(state["seed"])
+
+    params = {"preset": preset, "lower_factor": lower_factor, "upper_factor": upper_factor, "roi": roi}
+    state["params"] = params
+    pending = []
+    for i, timepoint in enumerate(timepoints):
+        key = cache_key("series", [reference_path, timepoint["path"]],
+                        {"seed": list(seed), "reference": i == 0, **params})
+        if timepoint.get("key") != key or not _timepoint_is_current(timepoint):
+            timepoint["key"] = key
+            timepoint["status"] = "pending"
+            pending.append((i, timepoint))
+
+    print(f"Série : {len(timepoints)} examens, {len(pending)} à traiter, référence {timepoints[0]['id']}")
+    if pending:
+        pool, workers, threads_per_worker = process_pool(len(pending), workers, threads_per_worker, image_cache_mb)
+        with pool:
+            futures = {
+                pool.submit(process_timepoint, reference_path, timepoint["path"],
+                            os.path.join(output_dir, timepoint["id"]), seed, params, i == 0): timepoint
+                for i, timepoint in pending
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                timepoint = futures[future]
+                try:
+                    timepoint.update(future.result())
+                except Exception as e:
+                    # Plantage du processus lui-même (mémoire, erreur native)
+                    timepoint.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+                print(f"[{done}/{len(pending)}] {timepoint['id']} : {timepoint['status']} {timepoint.get('error', '')}")
+                # Progression enregistrée au fil de l'eau : une interruption ne perd que l'examen en cours
+                _save_state(output_dir, state)
+
+    updated = _update_growth(timepoints)
+    _reference_brain_mask(reference_path, output_dir, state)
+    _save_state(output_dir, state)
+    csv_path = _write_growth_curve(growth_curve(timepoints), output_dir)
+    print(f"Courbe de croissance : {csv_path}")
+    if results_store:
+        from src.results_store import append_records
+        patient_id = patient_id or os.path.basename(os.path.abspath(output_dir))
+        ids = updated | {timepoint["id"] for _, timepoint in pending}
+        records = series_records(timepoints, patient_id, params, ids)
+        if records:
+            rows = append_records(results_store, records)
+            print(f"Entrepôt des résultats : {len(records)} lignes ajoutées (total : {rows}), {results_store}")
+    return timepoints
@@ -1,37 +1,38 @@
+import os
 import itk
 import vtk
 import numpy as np
 
-def visualize_volume_vtk(itk_image, title="Volume"):
-    vtk_image = itk.vtk_image_from_image(itk_image);
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
-    volume_mapper = vtk.vtkSmartVolumeMapper()
-    volume_mapper.SetInputData(vtk_image)
+from src.image_io import load_image
+from src.meshing import surface_actor
+from src.volume_lod import volume_lod_prop, enable_level_of_detail, DEFAULT_INTERACTIVE_FPS, STILL_FPS
+from src.profiling import profile_span
 
-    opacity_transfer_function = vtk.vtkPiecewiseFunction()
-    opacity_transfer_function.AddPoint(0, 0.0)
-    opacity_transfer_function.AddPoint(100, 0.2)
-    opacity_transfer_function.AddPoint(255, 0.6)
+# Budgets de triangles des surfaces affichées (décimation au-delà)
+BRAIN_TRIANGLE_BUDGET = 200000
+TUMOR_TRIANGLE_BUDGET = 50000
 
-    color_transfer_function = vtk.vtkColorTransferFunction()
-    color_transfer_function.AddRGBPoint(0, 0.0, 0.0, 0.0)
-    color_transfer_function.AddRGBPoint(255, 1.0, 1.0, 1.0)
+def visualize_volume_vtk(image, title="Volume", interactive_fps=DEFAULT_INTERACTIVE_FPS):
+    """Rendu volumique interactif d'une image (chemin ou image ITK), à niveaux de détail.
 
-    volume_property = vtk.vtkVolumeProperty()
-    volume_property.SetColor(color_transfer_function)
-    volume_property.SetScalarOpacity(opacity_transfer_function)
-    volume_property.ShadeOn()
-    volume_property.SetInterpolationTypeToLinear()
-
-    volume = vtk.vtkVolume()
-    volume.SetMapper(volume_mapper)
-    volume.SetProperty(volume_property)
+    Pendant les mouvements de caméra, le niveau de la pyramide (src/volume_lod.py) est choisi pour
+    tenir `interactive_fps` images par seconde ; à l'arrêt, la pleine résolution ombrée est rendue.
+    Passer un chemin permet de réutiliser la pyramide en cache à côté du fichier.
+    """
+    volume, info = volume_lod_prop(image)
+    print(f"Niveaux de détail : {' / '.join('x'.join(str(n) for n in shape[::-1]) for shape in info['shapes'])}")
 
     renderer = vtk.vtkRenderer()
     render_window = vtk.vtkRenderWindow()
     render_window.AddRenderer(renderer)
     interactor = vtk.vtkRenderWindowInteractor()
     interactor.SetRenderWindow(render_window)
+    interactor.SetDesiredUpdateRate(interactive_fps)
+    interactor.SetStillUpdateRate(STILL_FPS)
+    enable_level_of_detail(render_window, volume, info)
 
     renderer.AddVolume(volume)
     renderer.SetBackground(0.1, 0.1, 0.1)
@@ -43,27 +44,8 @@ def visualize_volume_vtk(itk_image, title="Volume"):
     interactor.Start()
 
 def visualize_with_vtk(brain_mask, tumor_mask):
-    def make_actor(vtk_img, value, color, opacity):
-        iso = vtk.vtkMarchingCubes()
-        iso.SetInputData(vtk_img)
-        iso.SetValue(0, value)
-        iso.Update()
-
-        mapper = vtk.vtkPolyDataMapper()
-        mapper.SetInputConnection(iso.GetOutputPort())
-        mapper.ScalarVisibilityOff()
-
-        actor = vtk.vtkActor()
-        actor.SetMapper(mapper)
-        actor.GetProperty().SetColor(*color)
-        actor.GetProperty().SetOpacity(opacity)
-        return actor
-
-    brain_vtk = itk.vtk_image_from_image(brain_mask)
-    tumor_vtk = itk.vtk_image_from_image(tumor_mask)
-
-    brain_actor = make_actor(brain_vtk, 0.5, (0.8, 0.8, 0.8), 0.4)
-    tumor_actor = make_actor(tumor_vtk, 0.5, (1.0, 0.0, 0.0), 0.9)
+    brain_actor = surface_actor(brain_mask, (0.8, 0.8, 0.8), 0.4, target_triangles=BRAIN_TRIANGLE_BUDGET)
+    tumor_actor = surface_actor(tumor_mask, (1.0, 0.0, 0.0), 0.9, target_triangles=TUMOR_TRIANGLE_BUDGET)
 
     renderer = vtk.vtkRenderer()
     renderer.SetBackground(0.1, 0.1, 0.1)
@@ -83,32 +65,9 @@ def visualize_with_vtk(brain_mask, tumor_mask):
     interactor.Start()
 
 def visualize_two_tumors_vtk(mask1, mask2, brain_mask):
-    def load_vtk(mask):
-        if isinstance(mask, str):
-            mask = itk.imread(mask, itk.ctype("unsigned char"))
-        return itk.vtk_image_from_image(mask)
-
-    vtk1 = load_vtk(mask1)
-    vtk2 = load_vtk(mask2)
-    vtk_brain = load_vtk(brain_mask)
-
-    def make_actor(vtk_img, color, opacity):
-        contour = vtk.vtkMarchingCubes()
-        contour.SetInputData(vtk_img)
-        contour.SetValue(0, 0.5)
-        contour.Update()
-        mapper = vtk.vtkPolyDataMapper()
-        mapper.SetInputConnection(contour.GetOutputPort())
-        mapper.ScalarVisibilityOff()
-        actor = vtk.vtkActor()
-        actor.SetMapper(mapper)
-        actor.GetProperty().SetColor(*color)
-        actor.GetProperty().SetOpacity(opacity)
-        return actor
-
-    actor1 = make_actor(vtk1, (1.0, 1.0, 0.0), 0.6)   # Jaune
-    actor2 = make_actor(vtk2, (0.0, 0.5, 1.0), 0.6)   # Bleu
-    actor_brain = make_actor(vtk_brain, (0.8, 0.8, 0.8), 0.1)  # Gris
+    actor1 = surface_actor(mask1, (1.0, 1.0, 0.0), 0.6, target_triangles=TUMOR_TRIANGLE_BUDGET)   # Jaune
+    actor2 = surface_actor(mask2, (0.0, 0.5, 1.0), 0.6, target_triangles=TUMOR_TRIANGLE_BUDGET)   # Bleu
+    actor_brain = surface_actor(brain_mask, (0.8, 0.8, 0.8), 0.1, target_triangles=BRAIN_TRIANGLE_BUDGET)  # Gris
 
     renderer = vtk.vtkRenderer()
     renderer.SetBackground(0.1, 0.1, 0.1)
@@ -160,4 +119,158 @@ def visualize_two_tumors_vtk(mask1, mask2, brain_mask):
     show_mode()
 
     interactor.Initialize()
-    interactor.Start()
\ No newline at end of file
+    interactor.Start()
+
+def _series_color(index, count):
+    """Couleur d'un examen, du jaune (premier) au bleu (dernier)"""
+    t = index / max(count - 1, 1)
+    return (1.0 - t, 1.0 - 0.5 * t, t)
+
+def visualize_series_vtk(masks, brain_mask, labels):
+    """Parcours des examens d'une série, masques dans l'espace de la référence.
+
+    Tous les acteurs sont construits une fois (surfaces du cache de maillages) ; changer d'examen
+    ne fait que modifier leur visibilité. Touches : n / flèche droite (suivant), p / flèche gauche
+    (précédent), a (tous les examens, l'examen courant en opaque), b (cerveau).
+    """
+    actors = [surface_actor(mask, _series_color(i, len(masks)), 0.8, target_triangles=TUMOR_TRIANGLE_BUDGET)
+              for i, mask in enumerate(masks)]
+    actor_brain = surface_actor(brain_mask, (0.8, 0.8, 0.8), 0.1, target_triangles=BRAIN_TRIANGLE_BUDGET)
+    caption = vtk.vtkTextActor()
+    caption.GetTextProperty().SetFontSize(18)
+    caption.SetPosition(10, 10)
+
+    renderer = vtk.vtkRenderer()
+    renderer.SetBackground(0.1, 0.1, 0.1)
+    for actor in actors:
+        renderer.AddActor(actor)
+    renderer.AddActor(actor_brain)
+    renderer.AddViewProp(caption)
+
+    window = vtk.vtkRenderWindow()
+    window.AddRenderer(renderer)
+    window.SetSize(800, 600)
+
+    interactor = vtk.vtkRenderWindowInteractor()
+    interactor.SetRenderWindow(window)
+
+    state = {'current': 0, 'all': False}
+
+    def show_timepoint():
+        for i, actor in enumerate(actors):
+            actor.SetVisibility(i == state['current'] or state['all'])
+            actor.GetProperty().SetOpacity(0.8 if i == state['current'] else 0.15)
+        caption.SetInput(f"{state['current'] + 1}/{len(actors)} : {labels[state['current']]}")
+        window.Render()
+
+    def keypress_callback(obj, event):
+        key = obj.GetKeySym()
+        match key:
+            case 'n' | 'Right':
+                state['current'] = min(state['current'] + 1, len(actors) - 1)
+            case 'p' | 'Left':
+                state['current'] = max(state['current'] - 1, 0)
+            case 'a':
+                state['all'] = not state['all']
+            case 'b':
+                actor_brain.SetVisibility(not actor_brain.GetVisibility())
+            case _:
+                return
+        show_timepoint()
+
+    interactor.AddObserver('KeyPressEvent', keypress_callback)
+
+    renderer.ResetCamera()
+    show_timepoint()
+
+    interactor.Initialize()
+    interactor.Start()
+
+# Préréglages de caméra (repère LPS) : direction caméra -> point visé, et vecteur "haut"
+CAMERA_PRESETS = {
+    "axial": ((0.0, 0.0, 1.0), (0.0, -1.0, 0.0)),
+    "coronal": ((0.0, -1.0, 0.0), (0.0, 0.0, 1.0)),
+    "sagittal": ((1.0, 0.0, 0.0), (0.0, 0.0, 1.0)),
+    "3d": ((1.0, -1.0, 1.0), (0.0, 0.0, 1.0)),
+}
+
+def _set_camera(renderer, preset):
+    direction, view_up = CAMERA_PRESETS[preset]
+    renderer.ResetCamera()
+    camera = renderer.GetActiveCamera()
+    focal_point = np.array(camera.GetFocalPoint())
+    distance = camera.GetDistance()
+    direction = np.array(direction) / np.linalg.norm(direction)
+    camera.SetPosition(*(focal_point + distance * direction))
+    camera.SetViewUp(*view_up)
+    renderer.ResetCamera()
+
+def render_snapshots(mask1, mask2, brain_mask, output_dir, presets=tuple(CAMERA_PRESETS), size=(800, 600)):
+    """Rendu hors écran des surfaces (tumeurs et cerveau) en PNG, une image par préréglage de caméra.
+
+    Fonctionne sans affichage : une seule fenêtre de rendu hors écran sert à toutes les vues,
+    et les surfaces viennent du cache de maillages. Retourne la liste des fichiers écrits.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    renderer = vtk.vtkRenderer()
+    renderer.SetBackground(0.1, 0.1, 0.1)
+    renderer.AddActor(surface_actor(mask1, (1.0, 1.0, 0.0), 0.6, target_triangles=TUMOR_TRIANGLE_BUDGET))
+    renderer.AddActor(surface_actor(mask2, (0.0, 0.5, 1.0), 0.6, target_triangles=TUMOR_TRIANGLE_BUDGET))
+    renderer.AddActor(surface_actor(brain_mask, (0.8, 0.8, 0.8), 0.1, target_triangles=BRAIN_TRIANGLE_BUDGET))
+
+    window = vtk.vtkRenderWindow()
+    window.SetOffScreenRendering(1)
+    window.AddRenderer(renderer)
+    window.SetSize(*size)
+
+    capture = vtk.vtkWindowToImageFilter()
+    capture.SetInput(window)
+    capture.ReadFrontBufferOff()
+    writer = vtk.vtkPNGWriter()
+    writer.SetInputConnection(capture.GetOutputPort())
+
+    paths = []
+    for preset in presets:
+        _set_camera(renderer, preset)
+        path = os.path.join(output_dir, f"tumors_{preset}.png")
+        with profile_span("render_snapshot", preset=preset):
+            window.Render()
+            capture.Modified()
+            writer.SetFileName(path)
+            writer.Write()
+        paths.append(path)
+    window.Finalize()
+    return paths
+
+def render_overlay_mosaic(image, mask1, mask2, output_path, slices=9, columns=3):
+    """Mosaïque de coupes axiales de l'image avec les contours des deux tumeurs, en PNG (sans fenêtre).
+
+    Les coupes sont réparties sur l'étendue en z des deux masques ; tumeur 1 en jaune, tumeur 2 en bleu.
+    """
+    image = load_image(image, itk.F)
+    image_array = itk.array_view_from_image(image)
+    arr1 = itk.array_view_from_image(load_image(mask1, itk.UC))
+    arr2 = itk.array_view_from_image(load_image(mask2, itk.UC))
+
+    z_with_tumor = np.flatnonzero(arr1.any(axis=(1, 2)) | arr2.any(axis=(1, 2)))
+    if z_with_tumor.size == 0:
+        z_with_tumor = np.array([image_array.shape[0] // 2])
+    z_indices = np.unique(np.linspace(z_with_tumor[0], z_with_tumor[-1], slices).round().astype(int))
+
+    rows = int(np.ceil(len(z_indices) / columns))
+    figure = Figure(figsize=(3 * columns, 3 * rows))
+    FigureCanvasAgg(figure)
+    for i, z in enumerate(z_indices):
+        ax = figure.add_subplot(rows, columns, i + 1)
+        ax.imshow(image_array[z], cmap='gray')
+        if arr1[z].any():
+            ax.contour(arr1[z], levels=[0.5], colors='yellow', linewidths=0.8)
+        if arr2[z].any():
+            ax.contour(arr2[z], levels=[0.5], colors='deepskyblue', linewidths=0.8)
+        ax.set_title(f"Coupe axiale {z}", fontsize=8)
+        ax.axis('off')
+    figure.tight_layout()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    figure.savefig(output_path, dpi=100)
+    return output_path
@@ -0,0 +1,195 @@
+import os
+import time
+
+import itk
+import vtk
+import numpy as np
+
+from src.cache import file_digest
+from src.config import DEFAULT_INTERACTIVE_FPS
+from src.histogram import otsu_threshold
+from src.image_io import load_image
+from src.profiling import profile_span
+
+# Rendu volumique à niveaux de détail. Une pyramide de volumes réduits de moitié à chaque
+# niveau (moyenne de blocs 2×2×2) est rendue pendant les mouvements de caméra ; la pleine
+# résolution, ombrée, revient dès que la caméra s'arrête. La pyramide d'un fichier est mise en
+# cache à côté de lui (registered.nrrd -> registered.pyramid.npz), indexée par son contenu.
+PYRAMID_SUFFIX = ".pyramid.npz"
+# Le niveau le plus grossier garde au moins ce nombre de voxels sur son plus petit côté
+MIN_LEVEL_SIZE = 32
+# Cadence à l'arrêt de la caméra : pas de limite, la pleine résolution est toujours rendue
+STILL_FPS = 0.0001
+HISTOGRAM_BINS = 256
+
+def _downsample(array):
+    """Moyenne des blocs 2×2×2 (une coupe impaire en bord de volume est ignorée)"""
+    even = array[tuple(slice(0, (n // 2) * 2) for n in array.shape)].astype(np.float32, copy=False)
+    nz, ny, nx = (n // 2 for n in array.shape)
+    return even.reshape(nz, 2, ny, 2, nx, 2).mean(axis=(1, 3, 5), dtype=np.float32)
+
+def build_pyramid(array, spacing, origin, direction, min_size=MIN_LEVEL_SIZE):
+    """Niveaux réduits d'un volume (tableau z, y, x), du plus fin au plus grossier (pleine résolution exclue).
+
+    Chaque niveau est un dictionnaire "array", "spacing", "origin" : le centre d'un bloc 2×2×2
+    est à une demi-maille du voxel de coin, l'origine est décalée d'autant.
+    """
+    levels = []
+    spacing, origin = np.asarray(spacing, dtype=np.float64), np.asarray(origin, dtype=np.float64)
+    while min(array.shape) // 2 >= min_size:
+        origin = origin + np.asarray(direction) @ (spacing / 2.0)
+        spacing = spacing * 2.0
+        array = _downsample(array)
+        levels.append({"array": array, "spacing": tuple(spacing), "origin": tuple(origin)})
+    return levels
+
+def pyramid_cache_path(path):
+    base = path[:-len(".nrrd")] if path.endswith(".nrrd") else os.path.splitext(path)[0]
+    return base + PYRAMID_SUFFIX
+
+def _read_pyramid(cache_path, digest):
+    if not os.path.exists(cache_path):
+        return None
+    with np.load(cache_path) as data:
+        if str(data["source"]) != digest:
+            return None
+        return [{"array": data[f"level{i}"], "spacing": tuple(data["spacings"][i]), "origin": tuple(data["origins"][i])}
+                for i in range(len(data["spacings"]))]
+
+def _write_pyramid(cache_path, digest, levels):
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, source=np.array(digest), spacings=np.array([level["spacing"] for level in levels]),
+                 origins=np.array([level["origin"] for level in levels]),
+                 **{f"level{i}": level["array"] for i, level in enumerate(levels)})
+    os.replace(tmp_path, cache_path)
+
+def load_pyramid(image, min_size=MIN_LEVEL_SIZE):
+    """Image pleine résolution et niveaux réduits d'un volume (chemin ou image ITK).
+
+    Pour un chemin, la pyramide est lue depuis son cache, ou construite puis enregistrée
+    (pyramid_cache_path) ; une image déjà chargée n'a pas de cache. Retourne (image, niveaux).
+    """
+    path = image if isinstance(image, str) else None
+    image = load_image(image, itk.F)
+    cache_path = digest = None
+    if path is not None:
+        cache_path, digest = pyramid_cache_path(path), file_digest(path)
+        levels = _read_pyramid(cache_path, digest)
+        if levels is not None:
+            return image, levels
+
+    with profile_span("volume_pyramid"):
+        levels = build_pyramid(itk.array_view_from_image(image), image.GetSpacing(), image.GetOrigin(),
+                               itk.array_from_matrix(image.GetDirection()), min_size)
+    if cache_path is not None:
+        try:
+            _write_pyramid(cache_path, digest, levels)
+        except OSError as e:
+            print(f"Pyramide non enregistrée ({cache_path}) : {e}")
+    return image, levels
+
+def fit_transfer_functions(array):
+    """Fonctions de transfert ajustées à l'histogramme des intensités.
+
+    Couleur : niveaux de gris du 1er au 99,5e percentile. Opacité : nulle jusqu'au seuil d'Otsu
+    (fond), puis la rampe 0 -> 0,2 -> 0,6 de l'ancienne fonction fixe entre le seuil et le 99,5e
+    percentile. Retourne (vtkColorTransferFunction, vtkPiecewiseFunction, repères de l'histogramme).
+    """
+    values = np.asarray(array, dtype=np.float32).ravel()
+    low, high = (float(v) for v in np.percentile(values, [1, 99.5]))
+    if high <= low:
+        high = low + 1.0
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS, range=(low, high))
+    threshold = otsu_threshold(counts.astype(np.float64), (edges[:-1] + edges[1:]) / 2.0)
+
+    color = vtk.vtkColorTransferFunction()
+    color.AddRGBPoint(low, 0.0, 0.0, 0.0)
+    color.AddRGBPoint(high, 1.0, 1.0, 1.0)
+
+    opacity = vtk.vtkPiecewiseFunction()
+    opacity.AddPoint(low, 0.0)
+    opacity.AddPoint(threshold, 0.0)
+    opacity.AddPoint(threshold + 0.4 * (high - threshold), 0.2)
+    opacity.AddPoint(high, 0.6)
+    return color, opacity, {"low": low, "threshold": threshold, "high": high}
+
+def _vtk_level_image(level, direction):
+    image = itk.image_from_array(np.ascontiguousarray(level["array"]))
+    image.SetSpacing(level["spacing"])
+    image.SetOrigin(level["origin"])
+    image.SetDirection(itk.matrix_from_array(np.ascontiguousarray(direction, dtype=np.float64)))
+    return itk.vtk_image_from_image(image)
+
+def volume_lod_prop(image, min_size=MIN_LEVEL_SIZE):
+    """Volume à niveaux de détail (vtkLODProp3D) : un mapper par niveau de la pyramide.
+
+    Seule la pleine résolution est ombrée. Le niveau rendu est choisi par enable_level_of_detail.
+    Retourne (prop, infos : identifiants et tailles des niveaux, repères des fonctions de transfert).
+    """
+    image, levels = load_pyramid(image, min_size)
+    direction = itk.array_from_matrix(image.GetDirection())
+    # L'histogramme d'un niveau réduit suffit et évite de parcourir le volume complet
+    color, opacity, landmarks = fit_transfer_functions(levels[0]["array"] if levels else
+                                                       itk.array_view_from_image(image))
+
+    prop = vtk.vtkLODProp3D()
+    # La sélection automatique de VTK s'appuie sur des durées que les mappers GPU ne mesurent pas
+    prop.AutomaticLODSelectionOff()
+    sources = [itk.vtk_image_from_image(image)] + [_vtk_level_image(level, direction) for level in levels]
+    lod_ids = []
+    for index, vtk_image in enumerate(sources):
+        mapper = vtk.vtkSmartVolumeMapper()
+        mapper.SetInputData(vtk_image)
+        volume_property = vtk.vtkVolumeProperty()
+        volume_property.SetColor(color)
+        volume_property.SetScalarOpacity(opacity)
+        volume_property.SetInterpolationTypeToLinear()
+        volume_property.SetShade(index == 0)
+        lod_ids.append(prop.AddLOD(mapper, volume_property, 0.0))
+    prop.SetSelectedLODID(lod_ids[0])
+
+    info = {
+        "lod_ids": lod_ids,
+        "shapes": [tuple(itk.size(image))[::-1]] + [level["array"].shape for level in levels],
+        **landmarks,
+    }
+    return prop, info
+
+def enable_level_of_detail(render_window, prop, info):
+    """Choisit avant chaque rendu le niveau le plus fin qui tient dans le temps alloué.
+
+    Le temps alloué est celui de la fenêtre (1 / DesiredUpdateRate) : l'interacteur le fixe à
+    1 / SetDesiredUpdateRate pendant les mouvements de caméra et à 1 / SetStillUpdateRate à
+    l'arrêt. La durée de chaque niveau est mesurée à chacun de ses rendus ; celle d'un niveau
+    pas encore rendu est extrapolée d'un niveau mesuré, proportionnellement au nombre de voxels.
+    Retourne les durées mesurées (secondes par identifiant de niveau).
+    """
+    lod_ids = info["lod_ids"]
+    voxels = [float(np.prod(shape)) for shape in info["shapes"]]
+    seconds = {}
+    started = [0.0]
+
+    def estimate(index):
+        measured = [i for i in range(len(lod_ids)) if lod_ids[i] in seconds]
+        if not measured:
+            return 0.0
+        # Niveau mesuré le plus proche en nombre de voxels
+        known = min(measured, key=lambda i: abs(np.log(voxels[i] / voxels[index])))
+        return seconds[lod_ids[known]] * voxels[index] / voxels[known]
+
+    def on_start(obj, event):
+        allocated = 1.0 / max(render_window.GetDesiredUpdateRate(), 1e-6)
+        selected = next((lod_ids[i] for i in range(len(lod_ids)) if estimate(i) <= allocated), lod_ids[-1])
+        prop.SetSelectedLODID(selected)
+        started[0] = time.perf_counter()
+
+    def on_end(obj, event):
+        lod_id = prop.GetSelectedLODID()
+        elapsed = time.perf_counter() - started[0]
+        # Moyenne glissante : le premier rendu d'un niveau (envoi des textures) est plus lent
+        seconds[lod_id] = elapsed if lod_id not in seconds else 0.5 * (seconds[lod_id] + elapsed)
+
+    render_window.AddObserver("StartEvent", on_start)
+    render_window.AddObserver("EndEvent", on_end)
+    return seconds
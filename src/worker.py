@@ -0,0 +1,210 @@
+import io
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+from contextlib import redirect_stdout, redirect_stderr
+
+# Processus de travail persistant : ITK reste chargé et les images lues restent dans le cache
+# LRU de src/image_io.py d'un appel à l'autre. Protocole : une ligne JSON par message sur un
+# socket Unix local. Requête {"argv": [...], "cwd": "..."} ou {"command": "stop" | "ping"} ;
+# réponses {"stdout": "<ligne>"} au fil de l'exécution, puis {"status": "ok" | "error" | "stale", ...}.
+DEFAULT_WORKER_ADDRESS = os.path.join(tempfile.gettempdir(), f"vitk-worker-{os.getuid()}.sock")
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+STARTUP_TIMEOUT = 60
+
+# Types ITK utilisés par le pipeline : y accéder charge leurs modules à l'avance
+_WARM_UP_NAMES = [
+    "ImageFileReader", "ImageFileWriter", "NrrdImageIO", "CastImageFilter", "MinimumMaximumImageFilter",
+    "OtsuThresholdImageFilter", "BinaryMorphologicalClosingImageFilter", "BinaryMorphologicalOpeningImageFilter",
+    "ConnectedThresholdImageFilter", "ConnectedComponentImageFilter", "RelabelComponentImageFilter",
+    "BinaryThresholdImageFilter", "ExtractImageFilter", "FlatStructuringElement", "ResampleImageFilter",
+    "ImageRegistrationMethodv4", "MattesMutualInformationImageToImageMetricv4",
+    "RegularStepGradientDescentOptimizerv4", "VersorRigid3DTransform", "CenteredTransformInitializer",
+]
+
+def _code_digest():
+    """Version du code exécuté : modules de src/ et script principal (main.py)"""
+    from src.cache import code_version, file_digest
+    main_path = getattr(sys.modules["__main__"], "__file__", None)
+    return code_version() + (file_digest(main_path) if main_path else "")
+
+def _warm_up():
+    import itk
+    import src.registration, src.segmentation, src.analysis
+    for name in _WARM_UP_NAMES:
+        getattr(itk, name)
+
+class _LineWriter(io.TextIOBase):
+    """Sortie texte renvoyée au client ligne par ligne"""
+
+    def __init__(self, send):
+        self._send = send
+        self._buffer = ""
+
+    def write(self, text):
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            self._send({"stdout": line})
+        return len(text)
+
+    def flush(self):
+        if self._buffer:
+            self._send({"stdout": self._buffer})
+            self._buffer = ""
+
+def _send_message(stream, message):
+    stream.write((json.dumps(message) + "\n").encode())
+    stream.flush()
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        self.server.last_activity = time.monotonic()
+        send = lambda message: _send_message(self.wfile, message)
+
+        if request.get("command") == "ping":
+            send({"status": "ok", "pid": os.getpid()})
+            return
+        if request.get("command") == "stop":
+            self.server.stopped = True
+            send({"status": "ok"})
+            return
+
+        # Les modules restent ceux importés au démarrage : un code modifié depuis n'est pas exécuté
+        if _code_digest() != self.server.code_digest:
+            self.server.stopped = True
+            send({"status": "stale", "error": "Code source modifié depuis le démarrage du processus de travail"})
+            return
+
+        writer = _LineWriter(send)
+        status, error = "ok", ""
+        start = time.perf_counter()
+        try:
+            os.chdir(request.get("cwd", os.getcwd()))
+            with redirect_stdout(writer), redirect_stderr(writer):
+                self.server.run_job(request["argv"])
+        except SystemExit as e:
+            # argparse (--help, arguments invalides)
+            status = "ok" if not e.code else "error"
+            error = "" if not e.code else f"Code de sortie {e.code}"
+        except Exception as e:
+            status = "error"
+            error = f"{type(e).__name__}: {e}"
+            writer.write(traceback.format_exc())
+        writer.flush()
+        send({"status": status, "error": error, "seconds": round(time.perf_counter() - start, 3)})
+        self.server.last_activity = time.monotonic()
+
+class _WorkerServer(socketserver.UnixStreamServer):
+    # Un travail à la fois : les étapes partagent les fichiers de Data/ et le cache d'images
+    def __init__(self, address, run_job, code_digest):
+        super().__init__(address, _JobHandler)
+        self.run_job = run_job
+        self.code_digest = code_digest
+        self.stopped = False
+        self.last_activity = time.monotonic()
+
+def serve(run_job, address=DEFAULT_WORKER_ADDRESS, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Lance le processus de travail et traite les requêtes jusqu'à l'arrêt ou l'inactivité.
+
+    run_job(argv) exécute une ligne de commande du pipeline dans ce processus. L'empreinte du code
+    est relevée au démarrage : si src/ ou main.py changent, les travaux sont refusés (statut "stale")
+    et le processus s'arrête, pour que le client en relance un à jour.
+    """
+    if os.path.exists(address):
+        if ping_worker(address):
+            print(f"Un processus de travail écoute déjà sur {address}")
+            return
+        os.remove(address)
+
+    # Relevée avant le préchargement : les modules importés ensuite ne peuvent pas être plus anciens
+    # Socket créée en 0600 dès le bind, sans fenêtre où l'umask du processus la laisserait ouverte
+    previous_umask = os.umask(0o077)
+    try:
+        server = _WorkerServer(address, run_job, _code_digest())
+    finally:
+        os.umask(previous_umask)
+    os.chmod(address, 0o600)
+    server.timeout = 1.0
+    # Les clients déjà connectés attendent la fin du préchargement avant d'être servis
+    _warm_up()
+    print(f"Processus de travail prêt sur {address} (pid {os.getpid()})", flush=True)
+    try:
+        while not server.stopped and time.monotonic() - server.last_activity < idle_timeout:
+            server.handle_request()
+    finally:
+        server.server_close()
+        if os.path.exists(address):
+            os.remove(address)
+
+def _request(address, message, on_stdout=None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(address)
+        stream = client.makefile("rwb")
+        _send_message(stream, message)
+        for line in stream:
+            reply = json.loads(line)
+            if "stdout" in reply:
+                if on_stdout is not None:
+                    on_stdout(reply["stdout"])
+                continue
+            return reply
+    raise ConnectionError("Connexion interrompue par le processus de travail.")
+
+def ping_worker(address=DEFAULT_WORKER_ADDRESS):
+    try:
+        return _request(address, {"command": "ping"})["status"] == "ok"
+    except (OSError, ValueError):
+        return False
+
+def stop_worker(address=DEFAULT_WORKER_ADDRESS):
+    if not ping_worker(address):
+        return False
+    _request(address, {"command": "stop"})
+    return True
+
+def start_worker(command, address=DEFAULT_WORKER_ADDRESS, log_path=None):
+    """Démarre le processus de travail en arrière-plan et attend qu'il réponde"""
+    log_path = log_path or f"{address}.log"
+    with open(log_path, "a") as log:
+        subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                         start_new_session=True)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if ping_worker(address):
+            return True
+        time.sleep(0.1)
+    raise TimeoutError(f"Le processus de travail ne répond pas (journal : {log_path})")
+
+def _wait_for_exit(address):
+    """Attend que le processus de travail arrêté libère son socket"""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while os.path.exists(address):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Le processus de travail ne s'arrête pas ({address})")
+        time.sleep(0.1)
+
+def run_remote(argv, server_command, address=DEFAULT_WORKER_ADDRESS):
+    """Exécute une ligne de commande dans le processus de travail (démarré si besoin) ; retourne le code de sortie"""
+    if not ping_worker(address):
+        print("Démarrage du processus de travail...")
+        start_worker(server_command, address)
+    request = {"argv": list(argv), "cwd": os.getcwd()}
+    reply = _request(address, request, on_stdout=lambda line: print(line, flush=True))
+    if reply["status"] == "stale":
+        print("Code source modifié : redémarrage du processus de travail...")
+        _wait_for_exit(address)
+        start_worker(server_command, address)
+        reply = _request(address, request, on_stdout=lambda line: print(line, flush=True))
+    if reply["status"] != "ok":
+        print(f"Erreur : {reply['error']}", file=sys.stderr)
+        return 1
+    return 0
@@ -0,0 +1,24 @@
+"""Distances de surface comparées à un calcul point à point (python -m pytest tests)"""
+import numpy as np
+
+from src.analysis import _surface, _surface_distances
+
+def _brute_force(points, queries, spacing):
+    scale = np.array(spacing[::-1])
+    p = np.argwhere(points) * scale
+    q = np.argwhere(queries) * scale
+    return np.sqrt(((q[:, None, :] - p[None, :, :]) ** 2).sum(axis=2)).min(axis=1)
+
+def test_surface_distances_match_brute_force():
+    rng = np.random.default_rng(0)
+    z, y, x = np.ogrid[:30, :40, :35]
+    mask1 = ((z - 15) / 10) ** 2 + ((y - 20) / 14) ** 2 + ((x - 17) / 12) ** 2 < 1
+    # Tache éloignée : la fenêtre de la transformée doit s'élargir
+    mask2 = (((z - 12) / 9) ** 2 + ((y - 22) / 11) ** 2 + ((x - 19) / 13) ** 2 < 1) | (rng.random(mask1.shape) > 0.9995)
+    spacing = (0.8, 1.1, 2.5)
+
+    result = _surface_distances(mask1, mask2, spacing)
+    d12 = _brute_force(_surface(mask2), _surface(mask1), spacing)
+    d21 = _brute_force(_surface(mask1), _surface(mask2), spacing)
+    assert np.isclose(result['hausdorff'], max(d12.max(), d21.max()), atol=1e-4)
+    assert np.isclose(result['assd'], (d12.sum() + d21.sum()) / (d12.size + d21.size), atol=1e-4)
@@ -0,0 +1,26 @@
+"""Budget du cache des images de src/image_io.py (python -m pytest tests)"""
+import itk
+import numpy as np
+
+from src import image_io
+from src.image_io import clear_image_cache, image_cache_budget, load_image
+
+def test_default_budget_holds_a_512_float_volume():
+    assert image_io.IMAGE_CACHE_BUDGET_MB * 1024 * 1024 >= 512 ** 3 * 4
+
+def test_lowered_budget_evicts_and_is_restored(tmp_path):
+    clear_image_cache()
+    previous = image_io.IMAGE_CACHE_BUDGET_MB
+    paths = []
+    for index in range(2):
+        path = str(tmp_path / f"image{index}.nrrd")
+        itk.imwrite(itk.image_from_array(np.full((64, 64, 64), index, dtype=np.float32)), path)
+        paths.append(path)
+        load_image(path, itk.F)
+    assert len(image_io._image_cache) == 2
+
+    # Deux volumes de 1 Mo : un budget de 1 Mo ne garde que le plus récent
+    with image_cache_budget(1):
+        assert [key[0] for key in image_io._image_cache] == [paths[1]]
+    assert image_io.IMAGE_CACHE_BUDGET_MB == previous
+    clear_image_cache()
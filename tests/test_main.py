@@ -0,0 +1,10 @@
+"""Noms des sorties de --step resample (python -m pytest tests)"""
+from main import registered_name
+
+def test_registered_name_keeps_multipart_suffix():
+    assert registered_name("Data/x.mask.npz") == "x_registered.mask.npz"
+    assert registered_name("/tmp/scan.nii.gz") == "scan_registered.nii.gz"
+
+def test_registered_name_simple_suffix():
+    assert registered_name("Data/case6_gre2.nrrd") == "case6_gre2_registered.nrrd"
+    assert registered_name("volume") == "volume_registered.nrrd"
@@ -0,0 +1,20 @@
+"""Seeds voisins au bord du volume (python -m pytest tests)"""
+import itk
+import numpy as np
+
+from src.segmentation import seed_neighbourhood, sweep_tumor_parameters
+
+def test_seed_neighbourhood_drops_out_of_bounds_neighbours():
+    seeds = seed_neighbourhood((0, 1, 18), (20, 20, 20))
+    assert seeds == [(0, 1, 18), (2, 1, 18), (0, 3, 18), (0, 1, 16)]
+
+def test_sweep_with_seed_next_to_border():
+    array = np.full((20, 20, 20), 10.0, dtype=np.float32)
+    array[:8, :8, :8] = 500.0
+    image = itk.image_from_array(array)
+
+    results, _ = sweep_tumor_parameters(image, seed_neighbourhood((0, 1, 3), image.shape), min_tumor_size=10,
+                                           workers=1)
+    assert {result['seed'] for result in results} == {(0, 1, 3), (2, 1, 3), (0, 3, 3), (0, 1, 1), (0, 1, 5)}
+    # Un voisin replié de l'autre côté du volume tomberait dans le fond (10 < 0,75 × 500)
+    assert all(abs(result['volume'] - 8 ** 3) <= 8 for result in results)
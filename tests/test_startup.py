@@ -0,0 +1,49 @@
+"""Démarrage de main.py : modules chargés et budgets de temps, dans des processus neufs (python -m pytest tests)"""
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HEAVY_MODULES = ("itk", "vtk", "matplotlib")
+IMPORT_BUDGET_S = 0.3
+ANALYZE_BUDGET_S = 1.0
+REPEAT = 3
+
+ANALYZE_ARGV = ["--step", "analyze", "--no-results"]
+ANALYZE_INPUTS = ["case6_gre1.nrrd", "registered.nrrd", "fixed_tumor_mask.nrrd", "registered_tumor_mask.nrrd"]
+needs_segmented_data = pytest.mark.skipif(
+    not all(os.path.exists(os.path.join(ROOT, "Data", name)) for name in ANALYZE_INPUTS),
+    reason="Données recalées et segmentées absentes (python main.py --all --hardcodeseed)")
+
+def _python(*args):
+    return subprocess.run([sys.executable, *args], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+
+def _best_time(*args):
+    seconds = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        _python(*args)
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+def _heavy_modules(code):
+    code += f"\nprint('modules:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    last_line = _python("-c", code).rstrip("\n").splitlines()[-1]
+    return [m for m in last_line.removeprefix("modules:").split(",") if m]
+
+def test_import_main_loads_no_heavy_module():
+    assert _heavy_modules("import sys, main") == []
+
+def test_import_main_within_budget():
+    assert _best_time("-c", "import main") <= IMPORT_BUDGET_S
+
+@needs_segmented_data
+def test_analyze_step_loads_no_heavy_module():
+    assert _heavy_modules(f"import sys, main\nmain.run(main.parse_args({ANALYZE_ARGV!r}))") == []
+
+@needs_segmented_data
+def test_analyze_step_within_budget():
+    assert _best_time("main.py", *ANALYZE_ARGV) <= ANALYZE_BUDGET_S